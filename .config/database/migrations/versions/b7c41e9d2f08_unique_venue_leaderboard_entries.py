@@ -0,0 +1,42 @@
+"""unique_venue_leaderboard_entries
+
+Revision ID: b7c41e9d2f08
+Revises: a5009d2fde41
+Create Date: 2026-10-16 10:12:41.275804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c41e9d2f08'
+down_revision = 'a5009d2fde41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fold duplicate (venue_id, user_id) rows into the oldest one before
+    # the constraint can be created
+    same_pair = "d.venue_id = venue_leaderboards.venue_id AND d.user_id = venue_leaderboards.user_id"
+    op.execute(
+        "UPDATE venue_leaderboards SET "
+        f"points = (SELECT SUM(COALESCE(d.points, 0)) FROM venue_leaderboards d WHERE {same_pair}), "
+        f"wins = (SELECT SUM(COALESCE(d.wins, 0)) FROM venue_leaderboards d WHERE {same_pair}), "
+        f"losses = (SELECT SUM(COALESCE(d.losses, 0)) FROM venue_leaderboards d WHERE {same_pair}), "
+        f"highest_streak = (SELECT MAX(d.highest_streak) FROM venue_leaderboards d WHERE {same_pair}), "
+        f"last_played = (SELECT MAX(d.last_played) FROM venue_leaderboards d WHERE {same_pair}) "
+        "WHERE id IN (SELECT MIN(id) FROM venue_leaderboards GROUP BY venue_id, user_id HAVING COUNT(*) > 1)"
+    )
+    op.execute(
+        "DELETE FROM venue_leaderboards "
+        "WHERE id NOT IN (SELECT MIN(id) FROM venue_leaderboards GROUP BY venue_id, user_id)"
+    )
+    with op.batch_alter_table('venue_leaderboards') as batch_op:
+        batch_op.create_unique_constraint('uq_venue_leaderboards_venue_user', ['venue_id', 'user_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('venue_leaderboards') as batch_op:
+        batch_op.drop_constraint('uq_venue_leaderboards_venue_user', type_='unique')
@@ -1,10 +1,28 @@
 import logging
+import os
+import time
+from threading import Lock
 from flask import Blueprint, request, jsonify
-from flask_socketio import emit, join_room, leave_room
+from flask_socketio import join_room, leave_room
 from flask_login import current_user, login_required
 from datetime import datetime, timedelta
-from extensions import db
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
+from extensions import db, socketio
 from models import User
+from ranking.leaderboard import Leaderboards, write_leaderboards
+from ranking.ranking_system import RankingSystem
+from realtime.chat import ChatLog
+from realtime.coalescing import DeltaCoalescer
+from realtime.emission import init_emitter
+from realtime.matchmaking import Matchmaker
+from realtime.presence import STATUS_ONLINE, PresenceTracker
+from realtime.profiles import invalidate_on_change, profile_summary, user_profiles
+from realtime.spatial import SpatialIndex
+from realtime.state import (
+    CHALLENGE_ACTIVE, CHALLENGE_COMPLETED, CHALLENGE_PENDING, create_state_backend
+)
+from realtime.timers import TimerScheduler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,63 +30,606 @@ logger = logging.getLogger(__name__)
 
 multiplayer = Blueprint("multiplayer", __name__)
 
-# Store active user sessions and their rooms
-active_users = {}
-user_rooms = {}
-ongoing_challenges = {}
+# Events are serialized once per emit (SOCKET_EMIT_ENCODING: json or msgpack)
+emitter = init_emitter(socketio, os.environ.get("SOCKET_EMIT_ENCODING", "json").strip())
+
+# Profile summaries for event payloads; edits to a user evict their entry
+invalidate_on_change(User)
+
+# Users' rooms and ongoing challenges, shared by every worker when
+# MULTIPLAYER_STATE_URLS lists Redis shards (redis://host:port/db, ...)
+state = create_state_backend(os.environ.get("MULTIPLAYER_STATE_URLS", ""))
+
+# Player positions by geohash cell; players hear everyone within the radius
+PROXIMITY_RADIUS_M = float(os.environ.get("MULTIPLAYER_PROXIMITY_RADIUS_M", "100"))
+MAX_NEARBY_RADIUS_M = 50000
+spatial_index = SpatialIndex(
+    radius=PROXIMITY_RADIUS_M,
+    ttl=float(os.environ.get("MULTIPLAYER_POSITION_TTL_SECONDS", "900"))
+)
+
+# user_id -> rooms of the cells around the user they are subscribed to
+user_subscriptions = {}
+
+# Shown for players whose profile no longer exists
+UNKNOWN_PLAYER_NAME = "Unknown player"
 
 def get_nearby_room(lat, lng):
-    """Generate a room name based on approximate location (100m grid)"""
-    # Round coordinates to create a grid of roughly 100m squares
-    grid_lat = round(lat * 1000) / 1000
-    grid_lng = round(lng * 1000) / 1000
-    return f"area_{grid_lat}_{grid_lng}"
+    """Room a player at this location publishes to (their geohash cell)"""
+    return spatial_index.room_for(lat, lng)
+
+def get_user_room(user_id):
+    """Room the user last joined, from the shared state"""
+    user = state.get_user(user_id)
+    return user["room"] if user else None
+
+# Timer callbacks run outside a request and push the app context themselves
+registered_app = {}
+
+@multiplayer.record_once
+def remember_app(setup_state):
+    registered_app["app"] = setup_state.app
+
+def end_challenge(challenge_id, challenge):
+    """Announce the result of a completed challenge and drop it"""
+    scores = challenge["scores"]
+    winner_id = max(scores.items(), key=lambda x: x[1])[0]
+    # The winner may have been deleted since the challenge started
+    winner = user_profiles.get(int(winner_id))
+    
+    emitter.emit("challenge_ended", {
+        "challenge_id": challenge_id,
+        "scores": scores,
+        "winner": {
+            "id": int(winner_id),
+            "name": winner["username"] if winner else UNKNOWN_PLAYER_NAME,
+            "score": scores[winner_id]
+        }
+    }, to=challenge["room"])
+    try:
+        record_ranked_game(challenge, winner_id)
+    except Exception as e:
+        logger.error(f"Error recording ranked game of challenge {challenge_id}: {str(e)}")
+    state.delete_challenge(challenge_id, CHALLENGE_COMPLETED)
+
+def expire_challenge(challenge_id, status):
+    """Timer callback: a challenge reached the deadline of its current status"""
+    with registered_app["app"].app_context():
+        if status == CHALLENGE_PENDING:
+            challenge = state.get_challenge(challenge_id)
+            if challenge is not None and state.delete_challenge(challenge_id, CHALLENGE_PENDING):
+                emitter.emit("challenge_expired", {"challenge_id": challenge_id}, to=challenge["room"])
+        else:
+            challenge = state.transition_challenge(challenge_id, CHALLENGE_ACTIVE, CHALLENGE_COMPLETED)
+            if challenge is not None:
+                end_challenge(challenge_id, challenge)
+
+# Unanswered challenges expire after this long; active ones at the end of their duration
+CHALLENGE_PENDING_SECONDS = float(os.environ.get("MULTIPLAYER_CHALLENGE_PENDING_SECONDS", "120"))
+
+challenge_timers = TimerScheduler(
+    expire_challenge,
+    tick=float(os.environ.get("MULTIPLAYER_CHALLENGE_TICK_SECONDS", "1")),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+def broadcast_scores(challenge_id, deltas):
+    """Apply one tick's score increments and broadcast the changed totals"""
+    challenge = state.apply_scores(challenge_id, deltas)
+    if challenge is None:
+        # Ended or expired meanwhile, or none of the scorers plays in it
+        return
+    emitter.emit("scores_updated", {
+        "challenge_id": challenge_id,
+        "seq": challenge["seq"],
+        "scores": {player: challenge["scores"][player] for player in deltas if player in challenge["scores"]}
+    }, to=challenge["room"])
+
+# Score increments are summed per challenge and broadcast once per tick
+score_coalescer = DeltaCoalescer(
+    broadcast_scores,
+    tick=float(os.environ.get("MULTIPLAYER_SCORE_TICK_MS", "75")) / 1000,
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+# Chat messages are stored write-behind: sends only append to a buffer
+# that a background task inserts into chat_messages in batches
+MAX_MESSAGE_LENGTH = 1000
+CHAT_HISTORY_PAGE = int(os.environ.get("MULTIPLAYER_CHAT_HISTORY_PAGE", "50"))
+
+# Room name -> chat_rooms.id, for rooms known to exist
+chat_rooms = {}
+
+def write_chat_messages(messages):
+    """Insert a batch of chat messages with one executemany round trip"""
+    rows = [
+        {
+            "room_id": message["room_id"],
+            "user_id": message["user_id"],
+            "content": message["content"],
+            "created_at": message["created_at"]
+        }
+        for message in messages
+    ]
+    with registered_app["app"].app_context():
+        try:
+            db.session.execute(text(
+                "INSERT INTO chat_messages (room_id, user_id, content, created_at, updated_at) "
+                "VALUES (:room_id, :user_id, :content, :created_at, :created_at)"
+            ), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+chat_log = ChatLog(
+    write_chat_messages,
+    max_rows=int(os.environ.get("MULTIPLAYER_CHAT_BATCH_SIZE", "200")),
+    max_age=float(os.environ.get("MULTIPLAYER_CHAT_FLUSH_SECONDS", "1")),
+    discard=(IntegrityError,),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+def chat_room_ids(names):
+    """chat_rooms ids of those named rooms that exist, looking up unknown names in one query"""
+    unknown = [name for name in names if name not in chat_rooms]
+    if unknown:
+        rows = db.session.execute(
+            text("SELECT id, name FROM chat_rooms WHERE name IN :names").bindparams(
+                bindparam("names", expanding=True)
+            ),
+            {"names": unknown}
+        )
+        for room_id, name in rows:
+            chat_rooms[name] = room_id
+    return {name: chat_rooms[name] for name in names if name in chat_rooms}
+
+def ensure_chat_room(name, lat, lng):
+    """chat_rooms id of a proximity room, creating the row on first use"""
+    room_id = chat_room_ids([name]).get(name)
+    if room_id is None:
+        now = datetime.utcnow()
+        try:
+            db.session.execute(text(
+                "INSERT INTO chat_rooms (name, is_dojo, latitude, longitude, is_private, created_at, updated_at) "
+                "VALUES (:name, false, :lat, :lng, false, :now, :now)"
+            ), {"name": name, "lat": lat, "lng": lng, "now": now})
+            db.session.commit()
+        except IntegrityError:
+            # Created concurrently by another request
+            db.session.rollback()
+        room_id = chat_room_ids([name])[name]
+    return room_id
+
+def chat_history(room_names, before=None, limit=CHAT_HISTORY_PAGE):
+    """Newest messages of the given rooms, newest first, with one query
+    
+    Pages are keyed on message id: pass the returned 'next_before' as
+    ``before`` for the next page. The first page also carries messages
+    still waiting in the write-behind buffer.
+    """
+    room_ids = chat_room_ids(room_names)
+    if not room_ids:
+        return {"messages": [], "next_before": None}
+    names = {room_id: name for name, room_id in room_ids.items()}
+    
+    messages = []
+    if before is None:
+        messages = [
+            {
+                "id": None,
+                "room": names[message["room_id"]],
+                "user_id": message["user_id"],
+                "user": message["user"],
+                "message": message["content"],
+                "timestamp": message["created_at"].isoformat()
+            }
+            for message in chat_log.pending_for(names, limit)
+        ]
+    
+    query = (
+        "SELECT m.id, m.room_id, m.user_id, u.username, m.content, m.created_at "
+        "FROM chat_messages m JOIN users u ON u.id = m.user_id "
+        "WHERE m.room_id IN :room_ids"
+        + (" AND m.id < :before" if before is not None else "")
+        + " ORDER BY m.id DESC LIMIT :limit"
+    )
+    rows = db.session.execute(
+        text(query).bindparams(bindparam("room_ids", expanding=True)),
+        {"room_ids": list(names), "before": before, "limit": limit}
+    ).fetchall()
+    for message_id, room_id, user_id, username, content, created_at in rows:
+        messages.append({
+            "id": message_id,
+            "room": names[room_id],
+            "user_id": user_id,
+            "user": username,
+            "message": content,
+            "timestamp": created_at.isoformat() if created_at else None
+        })
+    
+    return {"messages": messages, "next_before": rows[-1][0] if len(rows) == limit else None}
+
+# Presence: socket heartbeats update memory, a background task writes
+# status changes to player_status every MULTIPLAYER_PRESENCE_FLUSH_SECONDS
+
+# users.id -> player.id, matched on email
+player_ids = {}
+
+def player_ids_for(user_ids):
+    """player ids of the given users that have a player row, looking up unknown users in one query"""
+    unknown = [user_id for user_id in user_ids if user_id not in player_ids]
+    if unknown:
+        rows = db.session.execute(
+            text("SELECT u.id, p.id FROM users u JOIN player p ON p.email = u.email WHERE u.id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": unknown}
+        )
+        for user_id, player_id in rows:
+            player_ids[user_id] = player_id
+    return {user_id: player_ids[user_id] for user_id in user_ids if user_id in player_ids}
+
+def write_presence(statuses):
+    """Upsert a batch of presence rows: one lookup, then one executemany UPDATE and one INSERT"""
+    with registered_app["app"].app_context():
+        try:
+            ids = player_ids_for([status["user_id"] for status in statuses])
+            now = datetime.utcnow()
+            rows = [
+                dict(status, player_id=ids[status["user_id"]], now=now)
+                for status in statuses if status["user_id"] in ids
+            ]
+            if not rows:
+                return
+            existing = {
+                player_id for (player_id,) in db.session.execute(
+                    text("SELECT player_id FROM player_status WHERE player_id IN :ids").bindparams(
+                        bindparam("ids", expanding=True)
+                    ),
+                    {"ids": [row["player_id"] for row in rows]}
+                )
+            }
+            updates = [row for row in rows if row["player_id"] in existing]
+            inserts = [row for row in rows if row["player_id"] not in existing]
+            if updates:
+                db.session.execute(text(
+                    "UPDATE player_status SET status = :status, venue_id = :venue_id, game_id = :game_id, "
+                    "current_activity = :current_activity, last_active = :last_active, "
+                    "is_available = :is_available, is_busy = :is_busy, is_away = :is_away, updated_at = :now "
+                    "WHERE player_id = :player_id"
+                ), updates)
+            if inserts:
+                db.session.execute(text(
+                    "INSERT INTO player_status (player_id, status, venue_id, game_id, current_activity, "
+                    "last_active, is_available, is_busy, is_away, created_at, updated_at) "
+                    "VALUES (:player_id, :status, :venue_id, :game_id, :current_activity, "
+                    ":last_active, :is_available, :is_busy, :is_away, :now, :now)"
+                ), inserts)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+presence = PresenceTracker(
+    write_presence,
+    spatial=spatial_index,
+    timeout=float(os.environ.get("MULTIPLAYER_PRESENCE_TIMEOUT_SECONDS", "90")),
+    touch_interval=float(os.environ.get("MULTIPLAYER_PRESENCE_TOUCH_SECONDS", "60")),
+    flush_interval=float(os.environ.get("MULTIPLAYER_PRESENCE_FLUSH_SECONDS", "5")),
+    discard=(IntegrityError,),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+# Venue and game ids seen to exist, so heartbeats only look up new ones
+known_ids = {"venues": set(), "games": set()}
+KNOWN_IDS_LIMIT = 100000
+
+def stored_id(table, value):
+    """A client-supplied venue or game id as an int if that row exists, else None"""
+    try:
+        row_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    known = known_ids[table]
+    if row_id in known:
+        return row_id
+    found = db.session.execute(text(f"SELECT 1 FROM {table} WHERE id = :id"), {"id": row_id}).first()
+    if found is None:
+        return None
+    if len(known) >= KNOWN_IDS_LIMIT:
+        known.clear()
+    known.add(row_id)
+    return row_id
+
+# Matchmaking: players looking for a game are paired by area, game type
+# and player.skill_level, with the limits widening the longer they wait
+MATCH_DURATION_SECONDS = int(os.environ.get("MULTIPLAYER_MATCH_DURATION_SECONDS", "300"))
+
+# Matchmade challenges are ranked games: each one completed with a winner
+# is stored in games, rated by the Glicko-2 engine and credited on the
+# global and venue leaderboards
+RANKED_GAME_TYPES = {
+    "8ball": "EIGHT_BALL", "9ball": "NINE_BALL", "10ball": "TEN_BALL",
+    "straight": "STRAIGHT_POOL", "one_pocket": "ONE_POCKET", "bank": "BANK_POOL"
+}
 
-@multiplayer.route("/api/join-chat", methods=["POST"])
+def write_rankings(venue_rows, player_rows):
+    """Leaderboards writer: add a batch of increments to venue_leaderboards and player"""
+    with registered_app["app"].app_context():
+        write_leaderboards(db.session, venue_rows, player_rows)
+
+leaderboards = Leaderboards(
+    write_rankings,
+    flush_interval=float(os.environ.get("MULTIPLAYER_LEADERBOARD_FLUSH_SECONDS", "5")),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+rankings = RankingSystem(leaderboards=leaderboards)
+rankings_state = {"loaded": False}
+rankings_lock = Lock()
+
+def load_rankings():
+    """Warm-start ratings and leaderboards from the database, once per process"""
+    with rankings_lock:
+        if not rankings_state["loaded"]:
+            leaderboards.load_from_db(db.session)
+            rankings.rebuild_from_db(db.session)
+            rankings_state["loaded"] = True
+
+def record_ranked_game(challenge, winner_id):
+    """Store and rate a completed matchmade challenge that has a single winner"""
+    game_type = RANKED_GAME_TYPES.get(challenge.get("game_type"))
+    scores = challenge["scores"]
+    if game_type is None or len(scores) != 2:
+        return
+    loser_id = next(player for player in scores if player != winner_id)
+    if scores[loser_id] == scores[winner_id]:
+        return
+    # Loaded before the insert, so the rebuild does not count this game too
+    load_rankings()
+    now = datetime.utcnow()
+    try:
+        db.session.execute(text(
+            "INSERT INTO games (player1_id, player2_id, game_type, game_mode, status, winner_id, score, "
+            "created_at, updated_at, started_at, completed_at) "
+            "VALUES (:player1_id, :player2_id, :game_type, 'RANKED', 'COMPLETED', :winner_id, :score, "
+            ":now, :now, :started_at, :now)"
+        ), {
+            "player1_id": challenge["challenger_id"],
+            "player2_id": challenge["target_id"],
+            "game_type": game_type,
+            "winner_id": int(winner_id),
+            "score": f"{scores[str(challenge['challenger_id'])]}-{scores[str(challenge['target_id'])]}",
+            "now": now,
+            "started_at": datetime.fromisoformat(challenge["start_time"])
+        })
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Venue boards only count games both players reported playing at the venue
+    venue_id = presence.venue_of(int(winner_id))
+    if venue_id != presence.venue_of(int(loser_id)):
+        venue_id = None
+    rankings.record_game(int(winner_id), int(loser_id), venue_id=venue_id)
+
+def player_room(user_id):
+    """Room of one player's own sockets"""
+    return f"player:{user_id}"
+
+def player_skill(user_id):
+    """player.skill_level of a user, 0 without a player row"""
+    player_id = player_ids_for([user_id]).get(user_id)
+    if player_id is None:
+        return 0.0
+    skill = db.session.execute(
+        text("SELECT skill_level FROM player WHERE id = :id"), {"id": player_id}
+    ).scalar()
+    return float(skill or 0.0)
+
+def start_match(waiting, new):
+    """Matchmaker callback: start a challenge between two matched players"""
+    with registered_app["app"].app_context():
+        challenge_id = f"match_{waiting.user_id}_{new.user_id}_{datetime.utcnow().timestamp()}"
+        state.create_challenge(challenge_id, {
+            "challenger_id": waiting.user_id,
+            "challenger_name": waiting.data["name"],
+            "target_id": new.user_id,
+            "game_type": new.game_type,
+            "duration": MATCH_DURATION_SECONDS,
+            "status": CHALLENGE_ACTIVE,
+            "start_time": datetime.utcnow().isoformat(),
+            "room": [player_room(waiting.user_id), player_room(new.user_id)],
+            "scores": {str(waiting.user_id): 0, str(new.user_id): 0}
+        })
+        challenge_timers.schedule(challenge_id, time.time() + MATCH_DURATION_SECONDS, CHALLENGE_ACTIVE)
+        
+        emitter.emit("challenge_started", {
+            "challenge_id": challenge_id,
+            "players": [
+                {"id": waiting.user_id, "name": waiting.data["name"]},
+                {"id": new.user_id, "name": new.data["name"]}
+            ],
+            "game_type": new.game_type,
+            "duration": MATCH_DURATION_SECONDS,
+            "start_time": datetime.utcnow().isoformat()
+        }, to=[player_room(waiting.user_id), player_room(new.user_id)])
+
+def match_timed_out(ticket):
+    """Matchmaker callback: nobody was found within the maximum wait"""
+    emitter.emit("match_not_found", {"game_type": ticket.game_type}, to=player_room(ticket.user_id))
+
+matchmaker = Matchmaker(
+    start_match,
+    match_timed_out,
+    skill_width=float(os.environ.get("MULTIPLAYER_MATCH_SKILL_WIDTH", "1")),
+    max_spread=int(os.environ.get("MULTIPLAYER_MATCH_MAX_SPREAD", "3")),
+    widen_every=float(os.environ.get("MULTIPLAYER_MATCH_WIDEN_SECONDS", "15")),
+    max_wait=float(os.environ.get("MULTIPLAYER_MATCH_MAX_WAIT_SECONDS", "300")),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+
+@multiplayer.route("/api/chat-history", methods=["GET"])
 @login_required
-def join_chat():
+def get_chat_history():
+    """Older messages of the rooms the user hears, paged with 'before'"""
     try:
-        data = request.get_json()
-        lat = float(data.get("lat"))
-        lng = float(data.get("lng"))
+        user = state.get_user(current_user.id)
+        if not user:
+            return jsonify({"status": "error", "message": "Not in any chat room"}), 400
         
-        room = get_nearby_room(lat, lng)
+        before = request.args.get("before", type=int)
+        limit = min(request.args.get("limit", CHAT_HISTORY_PAGE, type=int), 200)
+        rooms = spatial_index.rooms_around(user["lat"], user["lng"])
         
-        # Update user's current room
-        if current_user.id in user_rooms:
-            old_room = user_rooms[current_user.id]
-            leave_room(old_room)
-            
-        user_rooms[current_user.id] = room
-        join_room(room)
+        return jsonify(dict(chat_history(sorted(rooms), before, limit), status="success"))
+    except Exception as e:
+        logger.error(f"Error fetching chat history: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@multiplayer.route("/api/nearby-players", methods=["GET"])
+@login_required
+def nearby_players():
+    try:
+        lat = float(request.args.get("lat"))
+        lng = float(request.args.get("lng"))
+        radius = min(float(request.args.get("radius", PROXIMITY_RADIUS_M)), MAX_NEARBY_RADIUS_M)
+        limit = min(int(request.args.get("limit", 50)), 200)
         
-        # Notify others in the room
-        emit("user_joined", {
-            "user": current_user.username,
-            "timestamp": datetime.utcnow().isoformat()
-        }, room=room)
+        nearby = spatial_index.nearby(lat, lng, radius, limit, exclude=current_user.id)
+        profiles = user_profiles.get_many([user_id for user_id, _ in nearby])
         
-        return jsonify({"status": "success", "room": room})
+        return jsonify({
+            "status": "success",
+            "players": [
+                {"id": user_id, "name": profiles[user_id]["username"], "distance": round(distance, 1)}
+                for user_id, distance in nearby if user_id in profiles
+            ]
+        })
     except Exception as e:
-        logger.error(f"Error joining chat: {str(e)}")
+        logger.error(f"Error finding nearby players: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@multiplayer.route("/api/presence/venue/<int:venue_id>", methods=["GET"])
+@login_required
+def venue_presence(venue_id):
+    """Players online at a venue, from this process's presence"""
+    try:
+        online = presence.at_venue(venue_id)
+        profiles = user_profiles.get_many([player["user_id"] for player in online])
+        
+        return jsonify({
+            "status": "success",
+            "players": [
+                {"id": player["user_id"], "name": profiles[player["user_id"]]["username"], "status": player["status"]}
+                for player in online if player["user_id"] in profiles
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Error fetching venue presence: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@multiplayer.route("/api/presence/nearby", methods=["GET"])
+@login_required
+def nearby_presence():
+    """Online players near a location, nearest first"""
+    try:
+        lat = float(request.args.get("lat"))
+        lng = float(request.args.get("lng"))
+        radius = min(float(request.args.get("radius", PROXIMITY_RADIUS_M)), MAX_NEARBY_RADIUS_M)
+        limit = min(int(request.args.get("limit", 50)), 200)
+        
+        online = presence.near(lat, lng, radius, limit, exclude=current_user.id)
+        profiles = user_profiles.get_many([player["user_id"] for player in online])
+        
+        return jsonify({
+            "status": "success",
+            "players": [
+                {
+                    "id": player["user_id"],
+                    "name": profiles[player["user_id"]]["username"],
+                    "status": player["status"],
+                    "distance": round(player["distance"], 1)
+                }
+                for player in online if player["user_id"] in profiles
+            ]
+        })
+    except Exception as e:
+        logger.error(f"Error finding nearby online players: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@multiplayer.route("/api/leaderboard", methods=["GET"])
+@login_required
+def leaderboard():
+    """Top players by experience points, or by points at ?venue_id=, and the caller's own rank"""
+    try:
+        load_rankings()
+        venue_id = request.args.get("venue_id", type=int)
+        count = min(int(request.args.get("count", 10)), 100)
+        
+        return jsonify({
+            "status": "success",
+            "top": leaderboards.top(count, venue_id),
+            "me": leaderboards.rank(current_user.id, venue_id)
+        })
+    except Exception as e:
+        logger.error(f"Error fetching leaderboard: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@multiplayer.route("/api/multiplayer/stats")
+@login_required
+def multiplayer_stats():
+    """Shared state, timer, score coalescing, profile cache, presence, matchmaking, proximity and ranking metrics for this process"""
+    return jsonify({
+        "state": state.stats(),
+        "challenge_timers": challenge_timers.stats(),
+        "scores": score_coalescer.stats(),
+        "profiles": user_profiles.stats(),
+        "chat_log": chat_log.stats(),
+        "emits": emitter.stats(),
+        "presence": presence.stats(),
+        "matchmaking": matchmaker.stats(),
+        "proximity": spatial_index.stats(),
+        "leaderboards": leaderboards.stats(),
+        "ranked_players": len(rankings)
+    })
+
 @multiplayer.route("/api/send-message", methods=["POST"])
 @login_required
 def send_message():
     try:
         data = request.get_json()
-        message = data.get("message")
-        room = user_rooms.get(current_user.id)
+        message = (data.get("message") or "").strip()
+        user = state.get_user(current_user.id)
         
-        if not room:
+        if not user:
             return jsonify({"status": "error", "message": "Not in any chat room"}), 400
+        if not message or len(message) > MAX_MESSAGE_LENGTH:
+            return jsonify({"status": "error", "message": "Message must be 1-1000 characters"}), 400
             
-        emit("new_message", {
+        room = user["room"]
+        created_at = datetime.utcnow()
+        emitter.emit("new_message", {
             "user": current_user.username,
             "message": message,
-            "timestamp": datetime.utcnow().isoformat()
-        }, room=room)
+            "timestamp": created_at.isoformat()
+        }, to=room)
+        
+        # Stored by the chat log's background flush, off this request
+        chat_log.add({
+            "room_id": ensure_chat_room(room, user["lat"], user["lng"]),
+            "user_id": current_user.id,
+            "user": current_user.username,
+            "content": message,
+            "created_at": created_at
+        })
         
         return jsonify({"status": "success"})
     except Exception as e:
@@ -83,29 +644,31 @@ def challenge_player():
         target_user_id = data.get("target_user_id")
         duration = int(data.get("duration", 300))  # Default 5 minutes
         
-        room = user_rooms.get(current_user.id)
+        room = get_user_room(current_user.id)
         if not room:
             return jsonify({"status": "error", "message": "Not in range of target player"}), 400
         
         # Create challenge data
         challenge_id = f"challenge_{current_user.id}_{target_user_id}_{datetime.utcnow().timestamp()}"
-        ongoing_challenges[challenge_id] = {
+        state.create_challenge(challenge_id, {
             "challenger_id": current_user.id,
             "challenger_name": current_user.username,
             "target_id": target_user_id,
             "duration": duration,
-            "status": "pending",
+            "status": CHALLENGE_PENDING,
             "start_time": None,
+            "room": room,
             "scores": {str(current_user.id): 0}
-        }
+        })
+        challenge_timers.schedule(challenge_id, time.time() + CHALLENGE_PENDING_SECONDS, CHALLENGE_PENDING)
             
-        emit("challenge_received", {
+        emitter.emit("challenge_received", {
             "challenge_id": challenge_id,
             "challenger": current_user.username,
             "challenger_id": current_user.id,
             "duration": duration,
             "timestamp": datetime.utcnow().isoformat()
-        }, room=room)
+        }, to=room)
         
         return jsonify({"status": "success", "challenge_id": challenge_id})
     except Exception as e:
@@ -120,39 +683,46 @@ def respond_to_challenge():
         challenge_id = data.get("challenge_id")
         accept = data.get("accept", False)
         
-        if challenge_id not in ongoing_challenges:
+        challenge = state.get_challenge(challenge_id)
+        if challenge is None:
             return jsonify({"status": "error", "message": "Challenge not found"}), 404
             
-        challenge = ongoing_challenges[challenge_id]
         if challenge["target_id"] != current_user.id:
             return jsonify({"status": "error", "message": "Not the challenge target"}), 403
             
-        room = user_rooms.get(current_user.id)
+        room = get_user_room(current_user.id)
         if not room:
             return jsonify({"status": "error", "message": "Not in a valid room"}), 400
             
         if accept:
-            # Start the challenge
-            challenge["status"] = "active"
-            challenge["start_time"] = datetime.utcnow()
-            challenge["scores"][str(current_user.id)] = 0
+            # Start the challenge; only the first response can
+            challenge = state.transition_challenge(
+                challenge_id, CHALLENGE_PENDING, CHALLENGE_ACTIVE,
+                changes={"start_time": datetime.utcnow().isoformat()},
+                scores={str(current_user.id): 0}
+            )
+            if challenge is None:
+                return jsonify({"status": "error", "message": "Challenge already answered"}), 409
+            challenge_timers.schedule(challenge_id, time.time() + challenge["duration"], CHALLENGE_ACTIVE)
             
-            emit("challenge_started", {
+            emitter.emit("challenge_started", {
                 "challenge_id": challenge_id,
                 "players": [
                     {"id": challenge["challenger_id"], "name": challenge["challenger_name"]},
                     {"id": current_user.id, "name": current_user.username}
                 ],
                 "duration": challenge["duration"],
-                "start_time": challenge["start_time"].isoformat()
-            }, room=room)
+                "start_time": challenge["start_time"]
+            }, to=room)
         else:
             # Delete the challenge
-            del ongoing_challenges[challenge_id]
-            emit("challenge_declined", {
+            if not state.delete_challenge(challenge_id, CHALLENGE_PENDING):
+                return jsonify({"status": "error", "message": "Challenge already answered"}), 409
+            challenge_timers.cancel(challenge_id)
+            emitter.emit("challenge_declined", {
                 "challenge_id": challenge_id,
                 "decliner": current_user.username
-            }, room=room)
+            }, to=room)
             
         return jsonify({"status": "success"})
     except Exception as e:
@@ -167,52 +737,177 @@ def update_challenge_score():
         challenge_id = data.get("challenge_id")
         score_increment = int(data.get("score_increment", 0))
         
-        if challenge_id not in ongoing_challenges:
+        challenge = state.get_challenge(challenge_id)
+        if challenge is None:
             return jsonify({"status": "error", "message": "Challenge not found"}), 404
             
-        challenge = ongoing_challenges[challenge_id]
         if str(current_user.id) not in challenge["scores"]:
             return jsonify({"status": "error", "message": "Not part of this challenge"}), 403
             
         # Check if challenge is still active
-        if challenge["status"] != "active":
+        if challenge["status"] != CHALLENGE_ACTIVE:
             return jsonify({"status": "error", "message": "Challenge is not active"}), 400
             
-        elapsed_time = datetime.utcnow() - challenge["start_time"]
+        elapsed_time = datetime.utcnow() - datetime.fromisoformat(challenge["start_time"])
         if elapsed_time > timedelta(seconds=challenge["duration"]):
-            # End the challenge
-            challenge["status"] = "completed"
-            room = user_rooms.get(current_user.id)
-            
-            # Determine winner
-            scores = challenge["scores"]
-            winner_id = max(scores.items(), key=lambda x: x[1])[0]
-            winner = User.query.get(int(winner_id))
-            
-            emit("challenge_ended", {
-                "challenge_id": challenge_id,
-                "scores": scores,
-                "winner": {
-                    "id": winner.id,
-                    "name": winner.username,
-                    "score": scores[str(winner.id)]
-                }
-            }, room=room)
+            # The timer normally ends it first; this covers timers lost with
+            # a restarted worker. A concurrent request may already have
+            challenge = state.transition_challenge(challenge_id, CHALLENGE_ACTIVE, CHALLENGE_COMPLETED)
+            if challenge is None:
+                return jsonify({"status": "error", "message": "Challenge is not active"}), 400
+            challenge_timers.cancel(challenge_id)
+            end_challenge(challenge_id, challenge)
             
             return jsonify({"status": "success", "message": "Challenge ended"})
             
-        # Update score
-        challenge["scores"][str(current_user.id)] += score_increment
-        
-        # Broadcast score update
-        room = user_rooms.get(current_user.id)
-        emit("score_updated", {
-            "challenge_id": challenge_id,
-            "player_id": current_user.id,
-            "new_score": challenge["scores"][str(current_user.id)]
-        }, room=room)
+        # Update score; applied and broadcast with the tick's other increments
+        score_coalescer.add(challenge_id, str(current_user.id), score_increment)
         
         return jsonify({"status": "success"})
     except Exception as e:
         logger.error(f"Error updating challenge score: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
+
+@multiplayer.route("/api/challenge/<challenge_id>", methods=["GET"])
+@login_required
+def challenge_state(challenge_id):
+    """Full challenge state, for clients resyncing after a gap in 'seq'"""
+    try:
+        challenge = state.get_challenge(challenge_id)
+        if challenge is None:
+            return jsonify({"status": "error", "message": "Challenge not found"}), 404
+        
+        return jsonify({
+            "status": "success",
+            "challenge": {
+                "challenge_id": challenge_id,
+                "status": challenge["status"],
+                "duration": challenge["duration"],
+                "start_time": challenge["start_time"],
+                "scores": challenge["scores"],
+                "seq": challenge["seq"]
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error fetching challenge: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@socketio.on("challenge_score")
+@login_required
+def handle_challenge_score(data):
+    """Socket-native score increment; participants and status are checked when the tick is applied"""
+    try:
+        challenge_id = data.get("challenge_id")
+        score_increment = int(data.get("score_increment", 0))
+        if not challenge_id or not score_increment:
+            return {"success": False, "error": "Missing challenge_id or score_increment"}
+        
+        score_coalescer.add(challenge_id, str(current_user.id), score_increment)
+        return {"success": True}
+    except Exception as e:
+        logger.error(f"Error queueing challenge score: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+@socketio.on("heartbeat")
+@login_required
+def handle_heartbeat(data):
+    """Presence heartbeat: status, venue_id, game_id (null unless stored), activity and an optional lat/lng"""
+    try:
+        data = data or {}
+        lat, lng = data.get("lat"), data.get("lng")
+        activity = data.get("activity")
+        presence.heartbeat(
+            current_user.id,
+            status=data.get("status", STATUS_ONLINE),
+            venue_id=stored_id("venues", data.get("venue_id")),
+            game_id=stored_id("games", data.get("game_id")),
+            activity=str(activity)[:100] if activity else None,
+            lat=float(lat) if lat is not None else None,
+            lng=float(lng) if lng is not None else None
+        )
+        return {"success": True}
+    except Exception as e:
+        logger.error(f"Error recording heartbeat: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+@socketio.on("find_match")
+@login_required
+def handle_find_match(data):
+    """Queue for an automatic challenge: game_type and lat/lng (defaults to the joined chat position)"""
+    try:
+        data = data or {}
+        game_type = str(data.get("game_type") or "8ball")[:50]
+        lat, lng = data.get("lat"), data.get("lng")
+        if lat is None or lng is None:
+            user = state.get_user(current_user.id)
+            if not user:
+                return {"success": False, "error": "Location required"}
+            lat, lng = user["lat"], user["lng"]
+        
+        join_room(player_room(current_user.id))
+        matched = matchmaker.enqueue(
+            current_user.id, player_skill(current_user.id), game_type, float(lat), float(lng),
+            data={"name": current_user.username}
+        )
+        return {"success": True, "matched": matched}
+    except Exception as e:
+        logger.error(f"Error queueing for a match: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+@socketio.on("cancel_match")
+@login_required
+def handle_cancel_match():
+    return {"success": matchmaker.cancel(current_user.id)}
+
+@socketio.on("join_chat")
+@login_required
+def handle_join_chat(data):
+    """Join the chat room at lat/lng; room subscriptions belong to the socket, so this is not an HTTP route"""
+    try:
+        data = data or {}
+        lat = float(data.get("lat"))
+        lng = float(data.get("lng"))
+        
+        spatial_index.update(current_user.id, lat, lng)
+        room = get_nearby_room(lat, lng)
+        
+        # Subscribe to the rooms of every cell within range, so players
+        # across a cell boundary still hear each other
+        rooms = spatial_index.rooms_around(lat, lng)
+        old_rooms = user_subscriptions.get(current_user.id, set())
+        for old_room in old_rooms - rooms:
+            leave_room(old_room)
+        for new_room in rooms - old_rooms:
+            join_room(new_room)
+            
+        user_profiles.put(current_user.id, profile_summary(current_user))
+        state.set_user(current_user.id, {
+            "room": room,
+            "lat": lat,
+            "lng": lng,
+            "joined_at": datetime.utcnow().isoformat()
+        })
+        user_subscriptions[current_user.id] = rooms
+        ensure_chat_room(room, lat, lng)
+        
+        # Notify others in the room
+        emitter.emit("user_joined", {
+            "user": current_user.username,
+            "timestamp": datetime.utcnow().isoformat()
+        }, to=room)
+        
+        # Backlog of every room the user now hears
+        return {"success": True, "room": room, "history": chat_history(sorted(rooms))}
+    except Exception as e:
+        logger.error(f"Error joining chat: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+@socketio.on("disconnect")
+def handle_disconnect():
+    if current_user.is_authenticated:
+        presence.leave(current_user.id)
+        matchmaker.cancel(current_user.id)
+        # The socket's rooms go with it; forget where the user was
+        state.remove_user(current_user.id)
+        spatial_index.remove(current_user.id)
+        user_subscriptions.pop(current_user.id, None)
@@ -2,13 +2,35 @@ import logging
 import numpy as np
 import cv2
 from flask import Blueprint, jsonify, request, Response, render_template
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
 from flask_login import login_required, current_user
+from flask_socketio import join_room, leave_room
 from extensions import db, socketio
 from models import User
 from datetime import datetime
+import copy
 import io
+import json
+import os
 from PIL import Image
-from threading import Lock
+from threading import Event
+from realtime.emission import init_emitter
+from realtime.profiles import profile_summary, user_profiles
+from vision.tracking import BallTracker
+from vision.table import TableGeometry
+from vision.calibration import ColorCalibrator
+from vision import detection, pipeline
+from vision.batching import FrameBatcher
+from vision.executor import create_frame_executor
+from vision.governor import IngestionGovernor
+from vision.monitor_store import MonitorStore
+from vision.frame_ring import FrameRing, RingAttachments
+from vision.pockets import PocketDetector, ShotLog
+from vision.replay import EVENT_FOUL, EVENT_POCKET, ReplayReader, ReplayRecorder
+from vision.transport import (
+    ENCODING_COMPRESSED, FrameDecoder, frame_thumbnail, packet_from_data_url, parse_frame
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,89 +38,159 @@ logger = logging.getLogger(__name__)
 
 umpire = Blueprint("umpire", __name__)
 
+INVALID_FRAME_MESSAGE = 'Invalid frame data'
+
 class GameMonitor:
-    def __init__(self):
-        self.monitors = {}  # Dictionary to store per-user monitors
-        self.lock = Lock()  # Thread safety lock
+    def __init__(self, detector=detection.DETECTOR_FUSED, max_monitors=1000,
+                 memory_budget=512 * 1024 * 1024, idle_ttl=30 * 60, last_frame_width=160,
+                 recorder=None, continuous_calibration=False):
+        # Per-user monitors, evicted when idle, least recently used first
+        # once the count or memory budget is exceeded
+        self.monitors = MonitorStore(max_entries=max_monitors, max_bytes=memory_budget, ttl=idle_ttl)
+        
+        # Width of the last_frame thumbnail kept per monitor (0 keeps none)
+        self.last_frame_width = last_frame_width
+        
+        # Ball detector strategy: 'color', 'hough' or 'fused'
+        if detector not in detection.DETECTORS:
+            logger.warning(f"Unknown detector '{detector}', using '{detection.DETECTOR_FUSED}'")
+            detector = detection.DETECTOR_FUSED
+        self.detector = detector
+        
+        # Optional ReplayRecorder; frames are recorded while a game is set
+        self.recorder = recorder
+        
+        # Keep refining color ranges from the balls detected in each frame
+        self.continuous_calibration = continuous_calibration
         
         # Default HSV color ranges that will be calibrated
-        self.default_color_ranges = {
-            'white': {'lower': np.array([0, 0, 200]), 'upper': np.array([180, 30, 255])},  # Cue ball
-            'red': {'lower': np.array([0, 100, 100]), 'upper': np.array([10, 255, 255])},
-            'yellow': {'lower': np.array([20, 100, 100]), 'upper': np.array([30, 255, 255])},
-            'green': {'lower': np.array([50, 100, 100]), 'upper': np.array([70, 255, 255])}
+        self.default_color_ranges = pipeline.DEFAULT_COLOR_RANGES
+    
+    def _calibrator(self, color_ranges):
+        return ColorCalibrator(color_ranges) if self.continuous_calibration else None
+    
+    def _new_monitor(self):
+        color_ranges = copy.deepcopy(self.default_color_ranges)
+        return {
+            'color_ranges': color_ranges,
+            'is_calibrated': False,
+            'last_frame': None,
+            'detected_balls': [],
+            'shots_detected': 0,
+            'fouls': 0,
+            'last_shot_time': None,
+            'segmenter': None,
+            'tracker': BallTracker(),
+            'table': None,
+            'game_id': None,
+            'calibrator': self._calibrator(color_ranges),
+            'pockets': PocketDetector(),
+            'current_shot': None
         }
     
     def get_user_monitor(self, user_id):
         """Get or create a monitor for a specific user"""
-        with self.lock:
-            if user_id not in self.monitors:
-                self.monitors[user_id] = {
-                    'color_ranges': self.default_color_ranges.copy(),
-                    'is_calibrated': False,
-                    'last_frame': None,
-                    'detected_balls': [],
-                    'shots_detected': 0,
-                    'fouls': 0,
-                    'last_shot_time': None
-                }
-            return self.monitors[user_id]
+        return self.monitors.get_or_create(user_id, self._new_monitor)
     
-    def process_frame(self, frame, user_id):
-        """Process a single frame to detect balls and shots"""
+    def start_game(self, user_id, game_id=None):
+        """Attribute this user's shots and replay to a game (a new session id by default)"""
+        monitor = self.get_user_monitor(user_id)
+        self.end_game(user_id)
+        monitor['game_id'] = game_id or f"session-{datetime.now().strftime('%Y%m%dT%H%M%S')}"
+        # The camera may have moved since the last game
+        monitor['is_calibrated'] = False
+        return monitor['game_id']
+    
+    def request_calibration(self, user_id):
+        """Locate the table and recalibrate colors on the user's next frame"""
+        self.get_user_monitor(user_id)['is_calibrated'] = False
+        return True
+    
+    def end_game(self, user_id):
+        """Close the user's current game; returns its last shot, if one was open"""
+        monitor = self.monitors.get(user_id)
+        if monitor is None:
+            return None
+        last_shot = self._close_shot(monitor)
+        if self.recorder is not None and monitor['game_id'] is not None:
+            self.recorder.close(user_id, monitor['game_id'])
+        monitor['game_id'] = None
+        return last_shot
+    
+    def _close_shot(self, monitor):
+        """Finish the shot in progress as a row for the shots table"""
+        shot = monitor['current_shot']
+        monitor['current_shot'] = None
+        if shot is None:
+            return None
+        return {
+            'game_id': monitor['game_id'],
+            'pocketed_balls': shot['balls'],
+            'pocketed': bool(shot['balls']),
+            'foul': shot['foul'],
+            'timestamp': shot['timestamp'].isoformat()
+        }
+    
+    def _thumbnail(self, frame):
+        """Downscaled copy of a frame for last_frame, or None if disabled"""
+        if not self.last_frame_width:
+            return None
+        height, width = frame.shape[:2]
+        scale = self.last_frame_width / width
+        if scale >= 1:
+            return frame.copy()
+        return cv2.resize(frame, (self.last_frame_width, max(1, int(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+    
+    def process_frame(self, frame, user_id, with_circles=False):
+        """Process a single frame to detect balls and shots
+        
+        With ``with_circles`` the result also carries the detector's circles
+        (camera pixel coordinates) under 'circles'.
+        """
         monitor = self.get_user_monitor(user_id)
         
         try:
-            # Convert frame to HSV color space
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-            detected_balls = []
+            # The first frame of a game calibrates: table bed, pockets, colors
+            calibration = None
+            if not monitor['is_calibrated'] and self.calibrate_colors(frame, user_id):
+                table = monitor['table']
+                calibration = {'table': table.to_dict() if table is not None else None}
             
-            # Detect balls of each color
-            for color, ranges in monitor['color_ranges'].items():
-                mask = cv2.inRange(hsv, ranges['lower'], ranges['upper'])
-                
-                # Apply morphological operations to reduce noise
-                kernel = np.ones((5,5), np.uint8)
-                mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-                mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-                
-                # Find contours
-                contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                
-                for contour in contours:
-                    # Filter contours by area to remove noise
-                    area = cv2.contourArea(contour)
-                    if area > 100:  # Minimum area threshold
-                        # Find the minimum enclosing circle
-                        (x, y), radius = cv2.minEnclosingCircle(contour)
-                        center = (int(x), int(y))
-                        radius = int(radius)
-                        
-                        if 10 <= radius <= 30:  # Valid ball radius range
-                            detected_balls.append({
-                                'color': color,
-                                'position': center,
-                                'radius': radius
-                            })
-            
-            # Detect shots by analyzing ball movement
-            shot_detected = self._detect_shot(detected_balls, monitor['detected_balls'])
+            detected_balls, shot_detected, circles = pipeline.analyze_frame(
+                monitor, frame, self.detector, with_circles
+            )
+            completed_shot = None
             if shot_detected:
                 monitor['shots_detected'] += 1
                 monitor['last_shot_time'] = datetime.now()
-                
-                # Emit shot detection event
-                socketio.emit('shot_detected', {
-                    'user_id': user_id,
-                    'shot_count': monitor['shots_detected'],
-                    'timestamp': datetime.now().isoformat()
-                })
+                completed_shot = self._close_shot(monitor)
+                monitor['current_shot'] = {'timestamp': datetime.utcnow(), 'balls': [], 'foul': False}
+            
+            # Balls that vanished inside a pocket ROI; a pocketed cue ball is a foul
+            pocketed = monitor['pockets'].update(detected_balls)
+            events = []
+            if pocketed:
+                if monitor['current_shot'] is None:
+                    monitor['current_shot'] = {'timestamp': datetime.utcnow(), 'balls': [], 'foul': False}
+                for event in pocketed:
+                    monitor['current_shot']['balls'].append({'color': event['color'], 'track_id': event['track_id']})
+                    events.append((EVENT_POCKET, event['track_id']))
+                    if event['foul']:
+                        monitor['current_shot']['foul'] = True
+                        monitor['fouls'] += 1
+                        events.append((EVENT_FOUL, event['track_id']))
+            
+            if self.recorder is not None and monitor['game_id'] is not None:
+                self.recorder.record(user_id, monitor['game_id'], detected_balls, shot_detected,
+                                     events=events)
             
             # Update monitor state
             monitor['detected_balls'] = detected_balls
-            monitor['last_frame'] = frame
+            monitor['last_frame'] = self._thumbnail(frame)
+            self.monitors.touch(user_id)
             
-            return {
+            result = {
                 'status': 'success',
                 'balls_detected': len(detected_balls),
                 'shot_detected': shot_detected,
@@ -107,6 +199,15 @@ class GameMonitor:
                     'fouls': monitor['fouls']
                 }
             }
+            if pocketed:
+                result['pocketed'] = pocketed
+            if completed_shot is not None:
+                result['completed_shot'] = completed_shot
+            if calibration is not None:
+                result['calibration'] = calibration
+            if circles is not None:
+                result['circles'] = detection.circle_payload(circles)
+            return result
             
         except Exception as e:
             logger.error(f"Error processing frame: {str(e)}")
@@ -115,34 +216,21 @@ class GameMonitor:
                 'message': str(e)
             }
     
-    def _detect_shot(self, current_balls, previous_balls):
-        """Detect if a shot has occurred by analyzing ball movement"""
-        if not previous_balls:
-            return False
-            
-        # Calculate the maximum displacement of any ball
-        max_displacement = 0
-        for curr_ball in current_balls:
-            curr_pos = curr_ball['position']
-            
-            # Find the same colored ball in previous frame
-            for prev_ball in previous_balls:
-                if prev_ball['color'] == curr_ball['color']:
-                    prev_pos = prev_ball['position']
-                    displacement = np.sqrt(
-                        (curr_pos[0] - prev_pos[0])**2 + 
-                        (curr_pos[1] - prev_pos[1])**2
-                    )
-                    max_displacement = max(max_displacement, displacement)
-        
-        # Consider it a shot if any ball moved more than the threshold
-        SHOT_THRESHOLD = 20  # pixels
-        return max_displacement > SHOT_THRESHOLD
-    
     def calibrate_colors(self, frame, user_id):
         """Calibrate color ranges using a reference frame"""
         try:
             monitor = self.get_user_monitor(user_id)
+            
+            # Locate the table bed once and cache its homography; balls are
+            # then segmented and tracked on the rectified surface only
+            table = TableGeometry.detect(frame)
+            if table is not None:
+                logger.info(f"Table detected for user {user_id}: {table.to_dict()['corners']}")
+                frame = table.warp(frame)
+            monitor['table'] = table
+            monitor['tracker'] = BallTracker()
+            monitor['pockets'] = PocketDetector(table.size) if table is not None else PocketDetector()
+            
             hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
             
             # Automatic calibration using histogram analysis
@@ -174,15 +262,428 @@ class GameMonitor:
                         255
                     ])
             
+            # Rebuild the lookup tables from the new ranges on the next frame
+            # and restart continuous calibration from them
+            monitor['segmenter'] = None
+            monitor['calibrator'] = self._calibrator(monitor['color_ranges'])
             monitor['is_calibrated'] = True
+            self.monitors.touch(user_id)
             return True
             
         except Exception as e:
             logger.error(f"Calibration error: {str(e)}")
             return False
 
+# Columnar replay logs per user and game; recording is off without a directory
+REPLAY_DIR = os.environ.get("UMPIRE_REPLAY_DIR", "").strip()
+replay_recorder = ReplayRecorder(REPLAY_DIR) if REPLAY_DIR else None
+
+# Refine color ranges from detected balls as venue lighting drifts
+CONTINUOUS_CALIBRATION = os.environ.get("UMPIRE_CONTINUOUS_CALIBRATION", "false").strip().lower() in ("1", "true")
+
 # Create game monitor instance
-game_monitor = GameMonitor()
+game_monitor = GameMonitor(
+    detector=os.environ.get("UMPIRE_DETECTOR", detection.DETECTOR_FUSED).strip(),
+    max_monitors=int(os.environ.get("UMPIRE_MAX_MONITORS", "1000")),
+    memory_budget=int(os.environ.get("UMPIRE_MONITOR_MEMORY_MB", "512")) * 1024 * 1024,
+    idle_ttl=float(os.environ.get("UMPIRE_MONITOR_IDLE_SECONDS", "1800")),
+    last_frame_width=int(os.environ.get("UMPIRE_LAST_FRAME_WIDTH", "160")),
+    recorder=replay_recorder,
+    continuous_calibration=CONTINUOUS_CALIBRATION
+)
+
+# Frame processing backend: 'inline' runs OpenCV on the handling thread,
+# 'process' pins each user to one of a pool of worker processes
+FRAME_EXECUTOR = os.environ.get("UMPIRE_FRAME_EXECUTOR", "inline").strip()
+FRAME_WORKERS = int(os.environ.get("UMPIRE_FRAME_WORKERS", "0")) or None
+FRAME_QUEUE_SIZE = int(os.environ.get("UMPIRE_FRAME_QUEUE_SIZE", "4"))
+FRAME_TIMEOUT = float(os.environ.get("UMPIRE_FRAME_TIMEOUT", "5"))
+
+frame_executor = create_frame_executor(
+    FRAME_EXECUTOR,
+    workers=FRAME_WORKERS,
+    queue_size=FRAME_QUEUE_SIZE,
+    spawn=socketio.start_background_task
+)
+
+# Per-user video_frame admission: coalescing, duplicate skipping, target FPS
+frame_governor = IngestionGovernor(
+    min_fps=int(os.environ.get("UMPIRE_MIN_FPS", "2")),
+    max_fps=int(os.environ.get("UMPIRE_MAX_FPS", "30")),
+    cpu_budget=float(os.environ.get("UMPIRE_TABLE_CPU_BUDGET", "0.5")),
+    thumbnailer=frame_thumbnail
+)
+
+# Decodes binary and legacy base64 video frames; lives with the executor
+frame_decoder = FrameDecoder()
+
+def release_monitor(user_id, monitor):
+    """Give back an evicted monitor's decode buffers, pacing state and replay"""
+    frame_governor.forget(user_id)
+    frame_decoder.release(user_id)
+    if replay_recorder is not None and monitor['game_id'] is not None:
+        replay_recorder.close(user_id, monitor['game_id'])
+
+game_monitor.monitors.on_evict = release_monitor
+
+# With the process executor, socket frames are decoded straight into a
+# per-user ring of shared memory slots and workers read them in place
+FRAME_RING_SLOTS = int(os.environ.get("UMPIRE_FRAME_RING_SLOTS", "3"))
+USE_FRAME_RING = FRAME_EXECUTOR == 'process' and FRAME_RING_SLOTS > 0
+
+frame_rings = MonitorStore(
+    max_entries=int(os.environ.get("UMPIRE_MAX_MONITORS", "1000")),
+    max_bytes=int(os.environ.get("UMPIRE_FRAME_RING_MEMORY_MB", "1024")) * 1024 * 1024,
+    ttl=float(os.environ.get("UMPIRE_MONITOR_IDLE_SECONDS", "1800")),
+    sizeof=lambda ring: ring.nbytes,
+    on_evict=lambda user_id, ring: ring.close()
+)
+
+# Worker-side mappings of the rings above
+ring_attachments = RingAttachments()
+
+# Venue hubs: frames from a venue's tables arriving within a short window
+# are submitted as one executor task per worker the tables hash to
+VENUE_BATCHING = os.environ.get("UMPIRE_VENUE_BATCHING", "false").strip().lower() in ("1", "true")
+
+venue_batcher = FrameBatcher(
+    frame_executor,
+    window=float(os.environ.get("UMPIRE_VENUE_BATCH_WINDOW_MS", "15")) / 1000,
+    max_batch=int(os.environ.get("UMPIRE_VENUE_BATCH_SIZE", "16")),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+) if VENUE_BATCHING else None
+
+# user_id -> venue whose batches their frames join; the batcher splits a
+# venue's batches by the worker each user's frames already go to
+venue_tables = {}
+
+def stored_venue_id(value):
+    """A client-supplied venue id as a stored venue's id, or None"""
+    try:
+        venue_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    found = db.session.execute(text("SELECT 1 FROM venues WHERE id = :id"), {'id': venue_id}).first()
+    return venue_id if found is not None else None
+
+# Events go to the monitoring user's room, and table events also to the
+# room of the venue the table is at; payloads are serialized once
+emitter = init_emitter(socketio, os.environ.get("SOCKET_EMIT_ENCODING", "json").strip())
+
+# user_id -> room of the venue their table is at
+table_venues = {}
+
+def user_room(user_id):
+    return f"umpire:{user_id}"
+
+def table_rooms(user_id):
+    """Rooms a table's game events go to"""
+    return [user_room(user_id), table_venues.get(user_id)]
+
+# Executor callbacks run outside a request, so shot writes push the app context themselves
+registered_app = {}
+
+@umpire.record_once
+def remember_app(state):
+    registered_app['app'] = state.app
+
+# Completed shots are written to the shots table in batches
+shot_log = ShotLog(
+    lambda rows: write_shots(rows),
+    max_rows=int(os.environ.get("UMPIRE_SHOT_BATCH_SIZE", "50")),
+    max_age=float(os.environ.get("UMPIRE_SHOT_FLUSH_SECONDS", "5")),
+    discard=(IntegrityError,),
+    spawn=socketio.start_background_task,
+    sleep=socketio.sleep
+)
+
+# user_id -> stored game their shots are persisted under, checked at start_monitoring
+shot_games = {}
+
+def decode_frame(image_bytes):
+    """Decode compressed image bytes into a BGR frame (None if invalid)"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def analyze_uploaded_frame(user_id, image_bytes):
+    """Decode and process a frame posted to /api/process-frame
+    
+    Runs on whichever frame executor is configured, so it must only touch
+    per-user state that lives with the executor.
+    """
+    frame = decode_frame(image_bytes)
+    if frame is None:
+        return {'status': 'error', 'message': INVALID_FRAME_MESSAGE}
+    return game_monitor.process_frame(frame, user_id)
+
+def build_video_result(user_id, frame, sequence):
+    """Run the GameMonitor on a decoded video frame and build its cv_result payload"""
+    # Circles come from the same detection pass as the balls
+    result = game_monitor.process_frame(frame, user_id, with_circles=True)
+    circle_data = result.pop('circles', [])
+    
+    return {
+        'user_id': user_id,
+        'sequence': sequence,
+        'ball_count': len(circle_data),
+        'circles': circle_data,
+        'timestamp': datetime.now().isoformat(),
+        'game_monitor_result': result
+    }
+
+def analyze_video_frame(user_id, packet):
+    """Decode a socket video frame packet and build its cv_result payload"""
+    frame = frame_decoder.decode(user_id, packet)
+    if frame is None:
+        logger.error("Failed to decode image")
+        return None
+    return build_video_result(user_id, frame, packet.sequence)
+
+def analyze_ring_frame(user_id, ref):
+    """Process a frame already decoded into a shared memory ring slot
+    
+    Returns None if the ring was unlinked (monitoring stopped or the ring
+    was evicted) while the frame waited for this worker.
+    """
+    try:
+        ring = ring_attachments.get(ref)
+    except FileNotFoundError:
+        return None
+    try:
+        return build_video_result(user_id, ring.frame(ref.slot), ref.sequence)
+    finally:
+        ring.release(ref.slot)
+
+def stage_ring_frame(user_id, packet):
+    """Convert a raw packet into a free slot of the user's frame ring
+    
+    Returns (ring, slot), or (None, None) if no slot is free. Compressed
+    packets never come here: they are smaller than the frame and are
+    decoded on the worker instead of the socket thread.
+    """
+    shape = (packet.height, packet.width, 3)
+    ring = frame_rings.get(user_id)
+    if ring is not None and ring.shape != shape:
+        frame_rings.pop(user_id)
+        ring.close()
+        ring = None
+    if ring is None:
+        ring = frame_rings.get_or_create(user_id, lambda: FrameRing(shape, FRAME_RING_SLOTS))
+        
+    slot = ring.acquire()
+    if slot is None:
+        return None, None
+    frame_decoder.decode(user_id, packet, dst=ring.frame(slot))
+    return ring, slot
+
+def player_name(user_id):
+    """Username for event payloads, from the shared profile cache"""
+    with registered_app['app'].app_context():
+        profile = user_profiles.get(user_id)
+    return profile['username'] if profile else None
+
+def emit_shot_event(user_id, result):
+    """Emit shot detection event for a processed frame"""
+    if result.get('shot_detected'):
+        emitter.emit('shot_detected', {
+            'user_id': user_id,
+            'player': player_name(user_id),
+            'shot_count': result['stats']['total_shots'],
+            'timestamp': datetime.now().isoformat()
+        }, to=table_rooms(user_id))
+
+def write_shots(rows):
+    """Insert a batch of completed shots with one executemany round trip
+
+    The tracker tells balls apart by color and track, not by number, so
+    ball_numbers holds each pocketed ball as {"color", "track_id"}.
+    """
+    with registered_app['app'].app_context():
+        try:
+            db.session.execute(text(
+                "INSERT INTO shots (game_id, player_id, ball_numbers, pocketed, foul, timestamp) "
+                "VALUES (:game_id, :player_id, :ball_numbers, :pocketed, :foul, :timestamp)"
+            ), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def stored_game_id(value, user_id):
+    """A client-supplied game id as the id of a stored game the user plays in, or None"""
+    try:
+        game_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    found = db.session.execute(text(
+        "SELECT 1 FROM games WHERE id = :id AND (player1_id = :user_id OR player2_id = :user_id)"
+    ), {'id': game_id, 'user_id': user_id}).first()
+    return game_id if found is not None else None
+
+def record_shot(user_id, shot):
+    """Queue a completed shot for the shots table
+    
+    Only shots of the stored game checked when monitoring started are
+    persisted; other sessions keep their shots in the replay log alone.
+    """
+    if shot is None:
+        return
+    game_id = shot_games.get(user_id)
+    if game_id is None or str(shot['game_id']) != str(game_id):
+        return
+    shot_log.add({
+        'game_id': game_id,
+        'player_id': user_id,
+        'ball_numbers': json.dumps(shot['pocketed_balls']),
+        'pocketed': shot['pocketed'],
+        'foul': shot['foul'],
+        'timestamp': shot['timestamp']
+    })
+
+def handle_game_events(user_id, result):
+    """Emit shot, pocket and foul events for a processed frame and persist finished shots"""
+    if 'calibration' in result:
+        emitter.emit('calibration_complete', result['calibration'], to=user_room(user_id))
+    emit_shot_event(user_id, result)
+    for event in result.get('pocketed', ()):
+        emitter.emit('ball_pocketed', {
+            'user_id': user_id,
+            'player': player_name(user_id),
+            'track_id': event['track_id'],
+            'color': event['color'],
+            'pocket': event['pocket']
+        }, to=table_rooms(user_id))
+        if event['foul']:
+            emitter.emit('foul_detected', {
+                'user_id': user_id,
+                'player': player_name(user_id),
+                'reason': 'cue_ball_pocketed',
+                'foul_count': result['stats']['fouls']
+            }, to=table_rooms(user_id))
+    record_shot(user_id, result.get('completed_shot'))
+
+def emit_video_result(user_id, payload):
+    """Deliver a processed video frame back to the client"""
+    if payload is None:
+        # Undecodable frame or dropped under load
+        return
+    if payload.get('status') == 'error':
+        emitter.emit('cv_result', payload, to=user_room(user_id))
+        return
+    handle_game_events(user_id, payload['game_monitor_result'])
+    emitter.emit('cv_result', payload, to=user_room(user_id))
+
+def dispatch_video_frame(user_id, func, args, deliver):
+    """Send a video frame task to the executor, via the venue batcher if the user is batched"""
+    venue_id = venue_tables.get(user_id)
+    if venue_batcher is not None and venue_id is not None:
+        venue_batcher.submit(venue_id, user_id, func, args, deliver)
+    else:
+        frame_executor.submit(user_id, func, args, deliver)
+
+def submit_video_frame(user_id, packet):
+    """Hand an admitted video frame packet to the executor
+    
+    Whatever happens, the governor hears back through finish_video_frame,
+    so a frame that fails before reaching the executor cannot leave the
+    user's stream stalled with a frame in flight.
+    """
+    staged = None
+    try:
+        if USE_FRAME_RING and packet.encoding != ENCODING_COMPRESSED:
+            staged = stage_ring_frame(user_id, packet)
+            ring, slot = staged
+            if ring is not None:
+                def deliver(payload):
+                    # The worker frees the slot once read, but not if the frame
+                    # was dropped, the worker died or the dispatch failed. With
+                    # one frame in flight per user the slot is still this
+                    # frame's, so freeing it again is harmless.
+                    ring.release(slot)
+                    finish_video_frame(user_id, payload)
+                    
+                ref = ring.ref(slot, packet.sequence)
+                # The executor owns the slot and the completion from here on
+                staged = None
+                dispatch_video_frame(user_id, analyze_ring_frame, (user_id, ref), deliver)
+                return
+            
+        # Compressed, no ring or no free slot: ship the packet to the worker
+        dispatch_video_frame(
+            user_id,
+            analyze_video_frame,
+            (user_id, packet),
+            lambda payload: finish_video_frame(user_id, payload)
+        )
+    except Exception as e:
+        logger.error(f"Error submitting video frame: {str(e)}")
+        if staged is not None and staged[0] is not None:
+            staged[0].release(staged[1])
+        finish_video_frame(user_id, None)
+
+def finish_video_frame(user_id, payload):
+    """Emit a frame's results and feed the governor's next frame, if any"""
+    next_frame, target_fps = frame_governor.complete(user_id)
+    if next_frame is not None:
+        submit_video_frame(user_id, next_frame)
+    if target_fps is not None:
+        emitter.emit('monitoring_status', {
+            'status': 'active',
+            'user_id': user_id,
+            'target_fps': target_fps
+        }, to=user_room(user_id))
+    emit_video_result(user_id, payload)
+
+def run_frame_task(user_id, func, args):
+    """Run a frame task on the executor and wait for its result
+    
+    Returns None if the frame was dropped or did not finish in time.
+    """
+    done = Event()
+    outcome = {}
+    
+    def deliver(result):
+        outcome['result'] = result
+        done.set()
+        
+    frame_executor.submit(user_id, func, args, deliver)
+    if not done.wait(FRAME_TIMEOUT):
+        return None
+    return outcome.get('result')
+
+def begin_game(user_id, game_id):
+    """Start a game where the user's monitor lives"""
+    return game_monitor.start_game(user_id, game_id)
+
+def request_calibration(user_id):
+    """Recalibrate on the user's next frame, where their monitor lives"""
+    return game_monitor.request_calibration(user_id)
+
+def finish_game(user_id):
+    """End the user's game where their monitor lives; returns its last shot"""
+    return {'completed_shot': game_monitor.end_game(user_id)}
+
+def replay_lines(reader):
+    """Stream a replay as one JSON document per recorded frame"""
+    shot_frames = set(reader.shots()['frame'].tolist())
+    for frame, timestamp, rows in reader.iter_frames():
+        yield json.dumps({
+            'frame': frame,
+            'timestamp': timestamp,
+            'shot': frame in shot_frames,
+            'balls': [
+                {
+                    'track_id': int(row['track_id']),
+                    'color': reader.color_name(row['color']),
+                    'position': (float(row['x']), float(row['y'])),
+                    'table_position': None if np.isnan(row['table_x'])
+                                      else (float(row['table_x']), float(row['table_y'])),
+                    'radius': int(row['radius'])
+                }
+                for row in rows
+            ]
+        }) + '\n'
 
 @umpire.route('/umpire')
 @login_required
@@ -201,34 +702,105 @@ def process_frame():
             
         frame_data = request.files['frame'].read()
         
-        # Convert to OpenCV format
-        nparr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            return jsonify({'status': 'error', 'message': 'Invalid frame data'}), 400
-            
         # Process the frame
-        result = game_monitor.process_frame(frame, current_user.id)
+        result = run_frame_task(current_user.id, analyze_uploaded_frame, (current_user.id, frame_data))
+        if result is None:
+            return jsonify({'status': 'error', 'message': 'Frame dropped, server busy'}), 503
+        if result.get('message') == INVALID_FRAME_MESSAGE:
+            return jsonify(result), 400
+            
+        handle_game_events(current_user.id, result)
         return jsonify(result)
         
     except Exception as e:
         logger.error(f"Error processing frame: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@umpire.route('/api/umpire/stats')
+@login_required
+def umpire_stats():
+    """Monitor registry and frame executor metrics for this process
+    
+    With the process executor, monitors live in the worker processes and
+    the registry figures here only cover frames processed inline.
+    """
+    game_monitor.monitors.evict_idle()
+    return jsonify({
+        'monitors': game_monitor.monitors.stats(),
+        'frame_rings': frame_rings.stats(),
+        'executor': frame_executor.stats(),
+        'venue_batches': venue_batcher.stats() if venue_batcher is not None else None,
+        'shot_log': shot_log.stats(),
+        'profiles': user_profiles.stats(),
+        'emits': emitter.stats()
+    })
+
+@umpire.route('/api/umpire/replay/<game_id>')
+@login_required
+def umpire_replay(game_id):
+    """Stream a recorded game back as newline-delimited JSON frames"""
+    if replay_recorder is None:
+        return jsonify({'status': 'error', 'message': 'Replay recording is disabled'}), 404
+    try:
+        reader = ReplayReader.open(REPLAY_DIR, current_user.id, game_id)
+    except FileNotFoundError:
+        return jsonify({'status': 'error', 'message': 'Replay not found'}), 404
+    return Response(replay_lines(reader), mimetype='application/x-ndjson')
+
 @socketio.on('start_monitoring')
 @login_required
-def handle_start_monitoring():
-    """Handle start monitoring event"""
+def handle_start_monitoring(data=None):
+    """Handle start monitoring event
+    
+    An optional 'game_id' attributes the detected shots (persisted when it
+    is a stored game the user plays in) and names the replay the frames are
+    recorded under. An optional 'venue_id' sends this table's game events to the
+    venue's room too, and batches its frames with the rest of the venue's
+    when venue batching is enabled.
+    """
     try:
+        venue_id = (data or {}).get('venue_id')
+        if venue_id is not None:
+            venue_id = stored_venue_id(venue_id)
+            if venue_id is None:
+                return {'success': False, 'error': 'Unknown venue'}
         monitor = game_monitor.get_user_monitor(current_user.id)
         monitor['is_monitoring'] = True
-        socketio.emit('monitoring_status', {'status': 'active'})
+        join_room(user_room(current_user.id))
+        user_profiles.put(current_user.id, profile_summary(current_user))
+        if venue_id is not None:
+            table_venues[current_user.id] = f"umpire_venue:{venue_id}"
+            if venue_batcher is not None:
+                venue_tables[current_user.id] = venue_id
+        requested = (data or {}).get('game_id')
+        stored = stored_game_id(requested, current_user.id) if requested is not None else None
+        if stored is not None:
+            shot_games[current_user.id] = stored
+        else:
+            shot_games.pop(current_user.id, None)
+        game_id = run_frame_task(current_user.id, begin_game, (current_user.id, requested))
+        emitter.emit('monitoring_status', {
+            'status': 'active',
+            'target_fps': frame_governor.target_fps(current_user.id),
+            'game_id': game_id
+        }, to=user_room(current_user.id))
         return {'success': True}
     except Exception as e:
         logger.error(f"Error starting monitoring: {str(e)}")
         return {'success': False, 'error': str(e)}
 
+@socketio.on('calibrate')
+@login_required
+def handle_calibrate():
+    """Locate the table bed again and recalibrate colors on the next frame"""
+    try:
+        if run_frame_task(current_user.id, request_calibration, (current_user.id,)) is None:
+            return {'success': False, 'error': 'Server busy, try again'}
+        return {'success': True}
+    except Exception as e:
+        logger.error(f"Error requesting calibration: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
 @socketio.on('stop_monitoring')
 @login_required
 def handle_stop_monitoring():
@@ -236,7 +808,20 @@ def handle_stop_monitoring():
     try:
         monitor = game_monitor.get_user_monitor(current_user.id)
         monitor['is_monitoring'] = False
-        socketio.emit('monitoring_status', {'status': 'inactive'})
+        frame_governor.forget(current_user.id)
+        frame_decoder.release(current_user.id)
+        ring = frame_rings.pop(current_user.id)
+        if ring is not None:
+            ring.close()
+        finished = run_frame_task(current_user.id, finish_game, (current_user.id,))
+        if finished is not None:
+            record_shot(current_user.id, finished['completed_shot'])
+        shot_log.flush()
+        shot_games.pop(current_user.id, None)
+        venue_tables.pop(current_user.id, None)
+        table_venues.pop(current_user.id, None)
+        emitter.emit('monitoring_status', {'status': 'inactive'}, to=user_room(current_user.id))
+        leave_room(user_room(current_user.id))
     except Exception as e:
         logger.error(f"Error stopping monitoring: {str(e)}")
 
@@ -244,79 +829,48 @@ def handle_stop_monitoring():
 def handle_video_frame(data):
     """Handle video frame event from client
     
-    Receives a base64 encoded image, processes it to detect circles (pool balls),
-    and emits the results back to the client.
+    Accepts either a binary frame packet (see vision.transport), a dict with
+    the packet under 'frame', or the legacy dict with a base64 encoded image
+    under 'image'. The frame is handed to the frame executor, which detects
+    circles (pool balls) and emits the results back to the client.
     """
     try:
-        # Extract user_id and base64 image from data
-        user_id = current_user.id if current_user.is_authenticated else data.get('user_id')
-        base64_image = data.get('image')
-        
-        if not user_id or not base64_image:
-            logger.error("Missing user_id or image data")
-            return
-            
-        # Decode base64 image to OpenCV format
-        # Remove the data URL prefix if present
-        if ',' in base64_image:
-            base64_image = base64_image.split(',')[1]
+        if isinstance(data, (bytes, bytearray)):
+            data = {'frame': data}
             
-        import base64
-        image_bytes = base64.b64decode(base64_image)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Frames only ever count for the signed-in user; their results go to
+        # the room joined in start_monitoring, never to a client-named one
+        if not current_user.is_authenticated:
+            logger.error("Video frame from an anonymous client")
+            return
+        user_id = current_user.id
+        binary_frame = data.get('frame')
+        base64_image = data.get('image')
         
-        if frame is None:
-            logger.error("Failed to decode image")
+        if not (binary_frame or base64_image):
+            logger.error("Missing image data")
             return
             
-        # Process the frame using the existing GameMonitor
-        result = game_monitor.process_frame(frame, user_id)
+        if binary_frame:
+            packet = parse_frame(bytes(binary_frame))
+            if frame_decoder.is_stale(user_id, packet):
+                return
+        else:
+            # Legacy path: base64 image, optionally with a data URL prefix
+            packet = packet_from_data_url(base64_image)
         
-        # Use cv2.HoughCircles to detect circles in the frame
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # Apply Gaussian blur to reduce noise
-        gray = cv2.GaussianBlur(gray, (5, 5), 0)
-        # Detect circles
-        circles = cv2.HoughCircles(
-            gray, 
-            cv2.HOUGH_GRADIENT, 
-            dp=1, 
-            minDist=20, 
-            param1=50, 
-            param2=30, 
-            minRadius=10, 
-            maxRadius=30
-        )
-        
-        circle_data = []
-        if circles is not None:
-            # Convert to integer coordinates
-            circles = np.uint16(np.around(circles))
-            for circle in circles[0, :]:
-                # Get coordinates and radius
-                x, y, r = circle
-                circle_data.append({
-                    'x': int(x),
-                    'y': int(y),
-                    'radius': int(r)
-                })
-        
-        # Emit results back to client
-        socketio.emit('cv_result', {
-            'user_id': user_id,
-            'ball_count': len(circle_data),
-            'circles': circle_data,
-            'timestamp': datetime.now().isoformat(),
-            'game_monitor_result': result
-        })
+        # Skip near-duplicates and coalesce while a frame is in flight;
+        # results are emitted asynchronously
+        packet = frame_governor.admit(user_id, packet)
+        if packet is not None:
+            submit_video_frame(user_id, packet)
         
     except Exception as e:
         logger.error(f"Error processing video frame: {str(e)}")
-        socketio.emit('cv_result', {
+        emitter.emit('cv_result', {
             'status': 'error',
             'message': str(e)
-        })
+        }, to=request.sid)
 
 @umpire.errorhandler(404)
 def page_not_found(error):
@@ -0,0 +1,379 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from vision.executor import _spawn_thread
+
+logger = logging.getLogger(__name__)
+
+MAX_LEVEL = 32
+LEVEL_PROBABILITY = 0.25
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next: List[Optional['_Node']] = [None] * level
+        self.width = [0] * level  # positions skipped by next[i]
+
+
+class Leaderboard:
+    """Indexable skip list of members ordered by score, highest first
+
+    Each link records how many positions it skips, so updating a score,
+    finding a member's rank and reaching the start of a range all take
+    O(log n) expected steps; ties are broken by member id. Scores are
+    also kept in a dict for O(1) lookups.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self.head = _Node(None, MAX_LEVEL)
+        self.level = 1
+        self.scores: Dict = {}
+        self.random = random.Random(seed)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def __contains__(self, member) -> bool:
+        return member in self.scores
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < MAX_LEVEL and self.random.random() < LEVEL_PROBABILITY:
+            level += 1
+        return level
+
+    def _insert(self, key):
+        update = [self.head] * MAX_LEVEL
+        rank = [0] * MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.width[i]
+                node = node.next[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                self.head.width[i] = len(self.scores)
+            self.level = level
+        new = _Node(key, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.width[i] = update[i].width[i] - (rank[0] - rank[i])
+            update[i].width[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].width[i] += 1
+
+    def _delete(self, key):
+        update = [self.head] * MAX_LEVEL
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+        target = node.next[0]
+        for i in range(self.level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+
+    def update(self, member, score: float):
+        old = self.scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._delete((-old, member))
+            del self.scores[member]
+        self._insert((-score, member))
+        self.scores[member] = score
+
+    def remove(self, member) -> bool:
+        score = self.scores.get(member)
+        if score is None:
+            return False
+        self._delete((-score, member))
+        del self.scores[member]
+        return True
+
+    def rank(self, member) -> Optional[int]:
+        """1-based position of a member, or None"""
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        key = (-score, member)
+        rank = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key <= key:
+                rank += node.width[i]
+                node = node.next[i]
+            if node.key == key:
+                return rank
+        return None
+
+    def range(self, start: int, count: int) -> List[Tuple[int, object, float]]:
+        """(rank, member, score) of up to ``count`` members from 1-based rank ``start``"""
+        if start < 1 or count <= 0 or start > len(self.scores):
+            return []
+        traversed = 0
+        node = self.head
+        for i in range(self.level - 1, -1, -1):
+            while node.next[i] is not None and traversed + node.width[i] < start:
+                traversed += node.width[i]
+                node = node.next[i]
+        node = node.next[0]
+        found = []
+        rank = start
+        while node is not None and len(found) < count:
+            found.append((rank, node.key[1], -node.key[0]))
+            node = node.next[0]
+            rank += 1
+        return found
+
+    def around(self, member, before: int = 5, after: int = 5) -> List[Tuple[int, object, float]]:
+        rank = self.rank(member)
+        if rank is None:
+            return []
+        start = max(1, rank - before)
+        return self.range(start, rank - start + after + 1)
+
+
+def _no_increments() -> Dict:
+    return {'points': 0, 'wins': 0, 'losses': 0}
+
+
+class Leaderboards:
+    """Global and per-venue leaderboards, written back to the database in batches
+
+    Venue boards rank users by ``venue_leaderboards.points`` and keep their
+    wins, losses and streaks; the global board ranks them by
+    ``player.experience_points``. Both are warm-started from the tables
+    with ``load``. ``record_result`` updates the boards in memory and adds
+    to the points, wins and losses pending for each row, and every
+    ``flush_interval`` seconds a background task hands those increments to
+    ``writer`` together, so processes sharing the tables add to each
+    other's totals instead of overwriting them. Streaks and last_played
+    are written as this process last saw them.
+    """
+
+    def __init__(self, writer: Callable[[List[Dict], List[Dict]], None], flush_interval: float = 5.0,
+                 spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.spawn = spawn
+        self.sleep = sleep
+        self.global_board = Leaderboard()
+        self.venues: Dict = {}  # venue_id -> Leaderboard
+        self.entries: Dict[Tuple, Dict] = {}  # (venue_id, user_id) -> stats
+        self.pending_venue: Dict[Tuple, Dict] = {}  # (venue_id, user_id) -> unwritten increments
+        self.pending_xp: Dict = {}  # user_id -> unwritten experience points
+        self.lock = threading.Lock()
+        self.started = False
+        self.stopping = False
+        self.flushes = 0
+        self.written = 0
+
+    def _venue(self, venue_id) -> Leaderboard:
+        board = self.venues.get(venue_id)
+        if board is None:
+            board = self.venues[venue_id] = Leaderboard()
+        return board
+
+    def load(self, venue_rows: List[Dict], player_rows: List[Dict]):
+        """Warm start from venue_leaderboards rows and (user_id, experience_points) rows"""
+        with self.lock:
+            for row in venue_rows:
+                entry = {
+                    'points': row.get('points') or 0,
+                    'wins': row.get('wins') or 0,
+                    'losses': row.get('losses') or 0,
+                    'current_streak': row.get('current_streak') or 0,
+                    'highest_streak': row.get('highest_streak') or 0,
+                    'last_played': row.get('last_played')
+                }
+                self.entries[(row['venue_id'], row['user_id'])] = entry
+                self._venue(row['venue_id']).update(row['user_id'], entry['points'])
+            for row in player_rows:
+                self.global_board.update(row['user_id'], row.get('experience_points') or 0)
+
+    def load_from_db(self, session):
+        venue_rows = session.execute(text(
+            "SELECT venue_id, user_id, points, wins, losses, current_streak, highest_streak, last_played "
+            "FROM venue_leaderboards"
+        )).mappings().all()
+        player_rows = session.execute(text(
+            "SELECT u.id AS user_id, p.experience_points FROM users u JOIN player p ON p.email = u.email"
+        )).mappings().all()
+        self.load(venue_rows, player_rows)
+        logger.info(f"Loaded {len(venue_rows)} venue leaderboard rows and {len(player_rows)} players")
+
+    def record_result(self, winner_id, loser_id, venue_id=None, points: int = 1,
+                      at: Optional[datetime] = None):
+        """Credit a win of ``points`` to the winner, globally and at the venue"""
+        at = at or datetime.utcnow()
+        with self.lock:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            self.global_board.update(winner_id, self.global_board.scores.get(winner_id, 0) + points)
+            self.pending_xp[winner_id] = self.pending_xp.get(winner_id, 0) + points
+            if venue_id is None:
+                return
+            board = self._venue(venue_id)
+            for user_id, won in ((winner_id, True), (loser_id, False)):
+                entry = self.entries.get((venue_id, user_id))
+                if entry is None:
+                    entry = self.entries[(venue_id, user_id)] = {
+                        'points': 0, 'wins': 0, 'losses': 0,
+                        'current_streak': 0, 'highest_streak': 0, 'last_played': None
+                    }
+                pending = self.pending_venue.setdefault((venue_id, user_id), _no_increments())
+                if won:
+                    entry['points'] += points
+                    entry['wins'] += 1
+                    entry['current_streak'] = max(entry['current_streak'], 0) + 1
+                    entry['highest_streak'] = max(entry['highest_streak'], entry['current_streak'])
+                    pending['points'] += points
+                    pending['wins'] += 1
+                else:
+                    entry['losses'] += 1
+                    entry['current_streak'] = 0
+                    pending['losses'] += 1
+                entry['last_played'] = at
+                board.update(user_id, entry['points'])
+
+    def _board(self, venue_id) -> Optional[Leaderboard]:
+        return self.global_board if venue_id is None else self.venues.get(venue_id)
+
+    def top(self, count: int = 10, venue_id=None, start: int = 1) -> List[Dict]:
+        with self.lock:
+            board = self._board(venue_id)
+            if board is None:
+                return []
+            return [
+                {'rank': rank, 'user_id': user_id, 'score': score}
+                for rank, user_id, score in board.range(start, count)
+            ]
+
+    def rank(self, user_id, venue_id=None) -> Optional[Dict]:
+        """A user's rank, score and the board size; with a venue, their stats there too"""
+        with self.lock:
+            board = self._board(venue_id)
+            if board is None or user_id not in board:
+                return None
+            found = {'rank': board.rank(user_id), 'score': board.scores[user_id], 'total': len(board)}
+            if venue_id is not None:
+                found.update(self.entries[(venue_id, user_id)])
+            return found
+
+    def around(self, user_id, venue_id=None, before: int = 5, after: int = 5) -> List[Dict]:
+        with self.lock:
+            board = self._board(venue_id)
+            if board is None:
+                return []
+            return [
+                {'rank': rank, 'user_id': member, 'score': score}
+                for rank, member, score in board.around(user_id, before, after)
+            ]
+
+    def flush(self) -> int:
+        with self.lock:
+            venue_rows = [
+                dict(self.entries[key], **pending, venue_id=key[0], user_id=key[1])
+                for key, pending in self.pending_venue.items()
+            ]
+            player_rows = [
+                {'user_id': user_id, 'experience_points': points} for user_id, points in self.pending_xp.items()
+            ]
+            pending_venue, pending_xp = self.pending_venue, self.pending_xp
+            self.pending_venue, self.pending_xp = {}, {}
+        if not venue_rows and not player_rows:
+            return 0
+        try:
+            self.writer(venue_rows, player_rows)
+        except Exception as e:
+            logger.error(f"Error writing {len(venue_rows) + len(player_rows)} leaderboard rows: {str(e)}")
+            # Put the increments back, on top of any recorded meanwhile
+            with self.lock:
+                for key, pending in pending_venue.items():
+                    merged = self.pending_venue.setdefault(key, _no_increments())
+                    for field, amount in pending.items():
+                        merged[field] += amount
+                for user_id, points in pending_xp.items():
+                    self.pending_xp[user_id] = self.pending_xp.get(user_id, 0) + points
+            return 0
+        self.flushes += 1
+        self.written += len(venue_rows) + len(player_rows)
+        return len(venue_rows) + len(player_rows)
+
+    def _run(self):
+        while not self.stopping:
+            self.sleep(self.flush_interval)
+            self.flush()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'players': len(self.global_board),
+                'venues': len(self.venues),
+                'dirty': len(self.pending_venue) + len(self.pending_xp),
+                'flushes': self.flushes,
+                'written': self.written
+            }
+
+    def shutdown(self):
+        self.stopping = True
+        self.flush()
+
+
+def write_leaderboards(session, venue_rows: List[Dict], player_rows: List[Dict]):
+    """Add leaderboard increments to venue_leaderboards and player with executemany batches
+
+    Rows carry increments of points, wins, losses and experience points,
+    added to the stored values; streaks and last_played replace them, the
+    highest streak only upwards. Venue rows are upserted on the unique
+    (venue_id, user_id) key, so processes inserting the same pair at once
+    add to one row.
+    """
+    now = datetime.utcnow()
+    try:
+        if venue_rows:
+            session.execute(text(
+                "INSERT INTO venue_leaderboards (venue_id, user_id, points, wins, losses, current_streak, "
+                "highest_streak, last_played, created_at, updated_at) "
+                "VALUES (:venue_id, :user_id, :points, :wins, :losses, :current_streak, "
+                ":highest_streak, :last_played, :now, :now) "
+                "ON CONFLICT (venue_id, user_id) DO UPDATE SET "
+                "points = COALESCE(venue_leaderboards.points, 0) + excluded.points, "
+                "wins = COALESCE(venue_leaderboards.wins, 0) + excluded.wins, "
+                "losses = COALESCE(venue_leaderboards.losses, 0) + excluded.losses, "
+                "current_streak = excluded.current_streak, "
+                "highest_streak = CASE WHEN COALESCE(venue_leaderboards.highest_streak, 0) > excluded.highest_streak "
+                "THEN venue_leaderboards.highest_streak ELSE excluded.highest_streak END, "
+                "last_played = excluded.last_played, updated_at = excluded.updated_at"
+            ), [dict(row, now=now) for row in venue_rows])
+        if player_rows:
+            session.execute(text(
+                "UPDATE player SET experience_points = COALESCE(experience_points, 0) + :experience_points, "
+                "updated_at = :now "
+                "WHERE email = (SELECT email FROM users WHERE id = :user_id)"
+            ), [dict(row, now=now) for row in player_rows])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
@@ -1,11 +1,308 @@
+import logging
+import math
+import time
+from datetime import datetime
 from enum import Enum
-from typing import Dict
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Glicko-2 works on a scale of (rating - 1500) / 173.7178
+GLICKO_SCALE = 173.7178
+DEFAULT_RATING = 1500.0
+DEFAULT_RD = 350.0
+DEFAULT_VOLATILITY = 0.06
+MAX_PHI = DEFAULT_RD / GLICKO_SCALE
+CONVERGENCE = 1e-6
+
 
 class RankTier(Enum):
     NOVICE = "novice"
     EXPERT = "expert"
     MASTER = "master"
 
+
+# Lowest percentile of each tier, highest tier first
+TIER_PERCENTILES = ((RankTier.MASTER, 0.9), (RankTier.EXPERT, 0.5), (RankTier.NOVICE, 0.0))
+
+
+def _g(phi: np.ndarray) -> np.ndarray:
+    return 1.0 / np.sqrt(1.0 + 3.0 * phi ** 2 / math.pi ** 2)
+
+
+def glicko2_update(mu: np.ndarray, phi: np.ndarray, sigma: np.ndarray, v: np.ndarray,
+                   delta_sum: np.ndarray, tau: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One Glicko-2 rating period for many players at once
+
+    ``v`` is each player's estimated variance, 1 / sum(g^2 E (1 - E)), and
+    ``delta_sum`` their sum(g (s - E)) over the period's games. The new
+    volatility is found with the Illinois variant of regula falsi, iterated
+    only for players that have not converged yet. Returns (mu, phi, sigma).
+    """
+    delta = v * delta_sum
+    a = np.log(sigma ** 2)
+    phi2 = phi ** 2
+
+    def f(x, rows):
+        ex = np.exp(x)
+        d2, p2, vv, aa = delta[rows] ** 2, phi2[rows], v[rows], a[rows]
+        return ex * (d2 - p2 - vv - ex) / (2.0 * (p2 + vv + ex) ** 2) - (x - aa) / tau ** 2
+
+    all_rows = np.arange(len(mu))
+    A = a.copy()
+    big = delta ** 2 > phi2 + v
+    B = np.where(big, np.log(np.maximum(delta ** 2 - phi2 - v, 1e-300)), a - tau)
+    rows = np.flatnonzero(~big)
+    while len(rows):
+        low = f(B[rows], rows) < 0
+        rows = rows[low]
+        B[rows] -= tau
+    fA = f(A, all_rows)
+    fB = f(B, all_rows)
+    rows = np.flatnonzero(np.abs(B - A) > CONVERGENCE)
+    for _ in range(100):
+        if not len(rows):
+            break
+        C = A[rows] + (A[rows] - B[rows]) * fA[rows] / (fB[rows] - fA[rows])
+        fC = f(C, rows)
+        crossed = fC * fB[rows] <= 0
+        A[rows] = np.where(crossed, B[rows], A[rows])
+        fA[rows] = np.where(crossed, fB[rows], fA[rows] / 2.0)
+        B[rows] = C
+        fB[rows] = fC
+        rows = rows[np.abs(B[rows] - A[rows]) > CONVERGENCE]
+
+    new_sigma = np.exp(A / 2.0)
+    phi_star = np.sqrt(phi2 + new_sigma ** 2)
+    new_phi = 1.0 / np.sqrt(1.0 / phi_star ** 2 + 1.0 / v)
+    new_mu = mu + new_phi ** 2 * delta_sum
+    return new_mu, new_phi, new_sigma
+
+
 class RankingSystem:
-    def __init__(self):
-        self.rankings: Dict[str, Dict] = {}
+    """Glicko-2 ratings of every ranked player in flat NumPy arrays
+
+    Ratings, deviations, volatilities, game counts and the rating period
+    of each player's last game live in parallel arrays indexed by a slot
+    per player, grown by doubling, so a hundred thousand players take a
+    few megabytes. ``record_game`` updates both players as soon as a
+    ranked game completes, treating the game as its own rating period;
+    between their games a player's deviation grows by one volatility step
+    per idle ``period`` seconds, up to the starting 350. ``rebuild``
+    replays a whole history period by period instead, as Glicko-2
+    intends, with every player of a period updated in one vectorized
+    step. Tiers go by rating percentile over a sorted snapshot that is
+    re-sorted once about ``resort_fraction`` of the players have changed.
+    With ``leaderboards`` attached, each rated game also credits the
+    winner with their rating gain (at least one point) on the global and
+    venue boards.
+    """
+
+    def __init__(self, tau: float = 0.5, period: float = 86400.0, capacity: int = 1024,
+                 resort_fraction: float = 0.01, clock=time.time, leaderboards=None):
+        self.tau = tau
+        self.period = period
+        self.resort_fraction = resort_fraction
+        self.clock = clock
+        self.leaderboards = leaderboards
+        self.index: Dict[int, int] = {}  # player id -> slot
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.mu = np.zeros(capacity)
+        self.phi = np.full(capacity, MAX_PHI)
+        self.sigma = np.full(capacity, DEFAULT_VOLATILITY)
+        self.games = np.zeros(capacity, dtype=np.int32)
+        self.last_period = np.full(capacity, -1, dtype=np.int64)
+        self.lock = Lock()
+        self.sorted_ratings = np.zeros(0)
+        self.changed = 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _slot(self, player_id: int) -> int:
+        slot = self.index.get(player_id)
+        if slot is not None:
+            return slot
+        slot = len(self.index)
+        if slot == len(self.mu):
+            grow = len(self.mu)
+            self.ids = np.concatenate([self.ids, np.zeros(grow, dtype=np.int64)])
+            self.mu = np.concatenate([self.mu, np.zeros(grow)])
+            self.phi = np.concatenate([self.phi, np.full(grow, MAX_PHI)])
+            self.sigma = np.concatenate([self.sigma, np.full(grow, DEFAULT_VOLATILITY)])
+            self.games = np.concatenate([self.games, np.zeros(grow, dtype=np.int32)])
+            self.last_period = np.concatenate([self.last_period, np.full(grow, -1, dtype=np.int64)])
+        self.index[player_id] = slot
+        self.ids[slot] = player_id
+        return slot
+
+    def _age(self, slots: np.ndarray, current: int):
+        """Grow the deviation of these players for the periods they sat out"""
+        last = self.last_period[slots]
+        idle = np.where(last >= 0, np.maximum(current - last - 1, 0), 0)
+        self.phi[slots] = np.minimum(
+            np.sqrt(self.phi[slots] ** 2 + idle * self.sigma[slots] ** 2), MAX_PHI
+        )
+        self.last_period[slots] = current
+
+    def record_game(self, winner_id: int, loser_id: int, at: Optional[float] = None,
+                    venue_id: Optional[int] = None) -> Tuple[Dict, Dict]:
+        """Rate one completed game; returns the winner's and the loser's new ratings"""
+        if winner_id == loser_id:
+            raise ValueError("A player cannot play themselves")
+        at = self.clock() if at is None else at
+        current = int(at // self.period)
+        with self.lock:
+            slots = np.array([self._slot(winner_id), self._slot(loser_id)])
+            self._age(slots, current)
+            mu, phi = self.mu[slots], self.phi[slots]
+            opponent = slots[::-1]
+            g = _g(self.phi[opponent])
+            expected = 1.0 / (1.0 + np.exp(-g * (mu - self.mu[opponent])))
+            scores = np.array([1.0, 0.0])
+            self.mu[slots], self.phi[slots], self.sigma[slots] = glicko2_update(
+                mu, phi, self.sigma[slots],
+                1.0 / (g ** 2 * expected * (1.0 - expected)),
+                g * (scores - expected),
+                self.tau
+            )
+            gain = GLICKO_SCALE * float(self.mu[slots[0]] - mu[0])
+            self.games[slots] += 1
+            self.changed += 2
+        if self.leaderboards is not None:
+            self.leaderboards.record_result(
+                winner_id, loser_id, venue_id, points=max(1, round(gain)), at=datetime.utcfromtimestamp(at)
+            )
+        return self.rating(winner_id), self.rating(loser_id)
+
+    def rebuild(self, player1: np.ndarray, player2: np.ndarray, winner: np.ndarray,
+                played_at: np.ndarray) -> int:
+        """Recompute every rating from a full game history, one vectorized step per period
+
+        Games are given as parallel arrays of player ids, winner ids and
+        completion times (epoch seconds). Games whose winner is neither
+        player are skipped. Returns the number of games rated.
+        """
+        player1 = np.asarray(player1, dtype=np.int64)
+        player2 = np.asarray(player2, dtype=np.int64)
+        winner = np.asarray(winner, dtype=np.int64)
+        played_at = np.asarray(played_at, dtype=np.float64)
+        valid = ((winner == player1) | (winner == player2)) & (player1 != player2)
+        player1, player2, winner, played_at = player1[valid], player2[valid], winner[valid], played_at[valid]
+
+        order = np.argsort(played_at, kind='stable')
+        player1, player2, winner, played_at = player1[order], player2[order], winner[order], played_at[order]
+        ids, slots = np.unique(np.concatenate([player1, player2]), return_inverse=True)
+        count = len(player1)
+        first, second = slots[:count], slots[count:]
+        first_won = (winner == player1).astype(np.float64)
+
+        players = len(ids)
+        mu = np.zeros(players)
+        phi = np.full(players, MAX_PHI)
+        sigma = np.full(players, DEFAULT_VOLATILITY)
+        games = np.zeros(players, dtype=np.int32)
+        last = np.full(players, -1, dtype=np.int64)
+
+        periods = (played_at // self.period).astype(np.int64)
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(periods)) + 1, [count]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            current = periods[start]
+            # Each game is seen from both sides
+            who = np.concatenate([first[start:end], second[start:end]])
+            against = np.concatenate([second[start:end], first[start:end]])
+            score = np.concatenate([first_won[start:end], 1.0 - first_won[start:end]])
+
+            active, local = np.unique(who, return_inverse=True)
+            idle = np.where(last[active] >= 0, np.maximum(current - last[active] - 1, 0), 0)
+            phi[active] = np.minimum(np.sqrt(phi[active] ** 2 + idle * sigma[active] ** 2), MAX_PHI)
+            last[active] = current
+
+            g = _g(phi[against])
+            expected = 1.0 / (1.0 + np.exp(-g * (mu[who] - mu[against])))
+            information = np.bincount(local, g ** 2 * expected * (1.0 - expected), len(active))
+            delta_sum = np.bincount(local, g * (score - expected), len(active))
+            mu[active], phi[active], sigma[active] = glicko2_update(
+                mu[active], phi[active], sigma[active], 1.0 / information, delta_sum, self.tau
+            )
+            games += np.bincount(who, minlength=players).astype(np.int32)
+
+        with self.lock:
+            capacity = max(1024, 1 << max(players - 1, 0).bit_length())
+            self.index = {player_id: slot for slot, player_id in enumerate(ids.tolist())}
+            self.ids = np.zeros(capacity, dtype=np.int64)
+            self.ids[:players] = ids
+            self.mu = np.zeros(capacity)
+            self.mu[:players] = mu
+            self.phi = np.full(capacity, MAX_PHI)
+            self.phi[:players] = phi
+            self.sigma = np.full(capacity, DEFAULT_VOLATILITY)
+            self.sigma[:players] = sigma
+            self.games = np.zeros(capacity, dtype=np.int32)
+            self.games[:players] = games
+            self.last_period = np.full(capacity, -1, dtype=np.int64)
+            self.last_period[:players] = last
+            self.sorted_ratings = np.zeros(0)
+            self.changed = players
+        return count
+
+    def rebuild_from_db(self, session) -> int:
+        """Rebuild from every completed ranked game and decided tournament match"""
+        started = time.perf_counter()
+        rows = session.execute(text(
+            "SELECT player1_id, player2_id, winner_id, COALESCE(completed_at, updated_at) FROM games "
+            "WHERE game_mode = 'RANKED' AND status = 'COMPLETED' AND winner_id IS NOT NULL "
+            "UNION ALL "
+            "SELECT player1_id, player2_id, winner_id, COALESCE(end_time, updated_at, created_at) FROM matches "
+            "WHERE winner_id IS NOT NULL"
+        )).fetchall()
+        if not rows:
+            return self.rebuild([], [], [], [])
+        player1, player2, winner, finished = zip(*rows)
+        played_at = [moment.timestamp() if moment is not None else 0.0 for moment in finished]
+        count = self.rebuild(player1, player2, winner, played_at)
+        logger.info(f"Rebuilt ratings of {len(self)} players from {count} games "
+                    f"in {time.perf_counter() - started:.2f}s")
+        return count
+
+    def _percentile(self, rating: float) -> float:
+        players = len(self.index)
+        if self.changed > self.resort_fraction * players or len(self.sorted_ratings) != players:
+            self.sorted_ratings = np.sort(GLICKO_SCALE * self.mu[:players] + DEFAULT_RATING)
+            self.changed = 0
+        if players <= 1:
+            return 1.0
+        return float(np.searchsorted(self.sorted_ratings, rating, side='left')) / (players - 1)
+
+    def tier(self, player_id: int) -> RankTier:
+        rating = self.rating(player_id)
+        return rating['tier'] if rating else RankTier.NOVICE
+
+    def rating(self, player_id: int) -> Optional[Dict]:
+        """Rating, deviation, volatility, games, percentile and tier of a player"""
+        with self.lock:
+            slot = self.index.get(player_id)
+            if slot is None:
+                return None
+            rating = GLICKO_SCALE * float(self.mu[slot]) + DEFAULT_RATING
+            percentile = self._percentile(rating)
+            return {
+                'player_id': player_id,
+                'rating': rating,
+                'rd': GLICKO_SCALE * float(self.phi[slot]),
+                'volatility': float(self.sigma[slot]),
+                'games': int(self.games[slot]),
+                'percentile': percentile,
+                'tier': next(tier for tier, floor in TIER_PERCENTILES if percentile >= floor)
+            }
+
+    @property
+    def rankings(self) -> Dict[int, Dict]:
+        """Every player's rating, keyed by player id"""
+        return {player_id: self.rating(player_id) for player_id in list(self.index)}
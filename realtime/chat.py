@@ -0,0 +1,18 @@
+from typing import Dict, Iterable, List
+
+from realtime.write_behind import WriteBehindBuffer
+
+
+class ChatLog(WriteBehindBuffer):
+    """Write-behind buffer of chat messages
+
+    Messages still in the buffer are served by ``pending_for`` so history
+    stays complete before they reach the database.
+    """
+
+    label = 'chat messages'
+
+    def pending_for(self, room_ids: Iterable[int], limit: int) -> List[Dict]:
+        """Newest ``limit`` unwritten messages of the given rooms, newest first"""
+        rooms = set(room_ids)
+        return [message for message in reversed(self.buffered()) if message['room_id'] in rooms][:limit]
@@ -0,0 +1,70 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from vision.executor import POLL_INTERVAL, _spawn_thread
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaCoalescer:
+    """Sums increments per key and hands them over once per tick
+
+    ``add(key, field, amount)`` only touches an in-memory dict; every
+    ``tick`` seconds the pending sums are swapped out and
+    ``flush(key, {field: total})`` is called once per key that changed.
+    However many increments arrive for a key within a tick, it costs one
+    state write and one broadcast.
+    """
+
+    def __init__(self, flush: Callable[[Any, Dict[Any, int]], None], tick: float = 0.075,
+                 spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep):
+        self.flush = flush
+        self.tick = tick
+        self.spawn = spawn
+        self.sleep = sleep
+        self.pending: Dict[Any, Dict[Any, int]] = {}
+        self.ready = threading.Condition()
+        self.started = False
+        self.stopping = False
+        self.received = 0
+        self.flushed = 0
+
+    def add(self, key, field, amount: int):
+        with self.ready:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            deltas = self.pending.setdefault(key, {})
+            deltas[field] = deltas.get(field, 0) + amount
+            self.received += 1
+            self.ready.notify()
+
+    def _run(self):
+        while not self.stopping:
+            with self.ready:
+                while not self.pending and not self.stopping:
+                    self.ready.wait(POLL_INTERVAL)
+            if self.stopping:
+                break
+            # Let the tick's increments accumulate before taking them
+            self.sleep(self.tick)
+            with self.ready:
+                pending, self.pending = self.pending, {}
+            for key, deltas in pending.items():
+                try:
+                    self.flush(key, deltas)
+                except Exception as e:
+                    logger.error(f"Flushing deltas for {key} failed: {str(e)}")
+            self.flushed += len(pending)
+
+    def stats(self) -> Dict:
+        with self.ready:
+            waiting = len(self.pending)
+        return {'received': self.received, 'flushed': self.flushed, 'waiting': waiting}
+
+    def shutdown(self):
+        self.stopping = True
+        with self.ready:
+            self.ready.notify_all()
@@ -0,0 +1,86 @@
+import json
+import logging
+from threading import Lock
+from typing import Dict, Iterable, Optional, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+
+
+def _default(value):
+    # datetimes, numpy scalars and the like
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class Emitter:
+    """Emits Socket.IO events with payloads serialized once, up front
+
+    Each payload is encoded a single time, as compact JSON text or, with
+    ``encoding='msgpack'``, as msgpack bytes (sent as a binary
+    attachment), and that same value is handed to the server for every
+    room it goes to; the server then only frames an opaque string or
+    buffer. Clients decode the payload themselves. Emit counts and
+    encoded bytes are kept per event.
+    """
+
+    def __init__(self, socketio, encoding: str = ENCODING_JSON):
+        if encoding == ENCODING_MSGPACK and msgpack is None:
+            logger.warning("msgpack is not installed, emitting JSON payloads")
+            encoding = ENCODING_JSON
+        elif encoding not in (ENCODING_JSON, ENCODING_MSGPACK):
+            logger.warning(f"Unknown emit encoding '{encoding}', using '{ENCODING_JSON}'")
+            encoding = ENCODING_JSON
+        self.socketio = socketio
+        self.encoding = encoding
+        self.counts: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+        self.lock = Lock()
+
+    def encode(self, payload) -> Union[str, bytes]:
+        if self.encoding == ENCODING_MSGPACK:
+            return msgpack.packb(payload, default=_default)
+        return json.dumps(payload, separators=(',', ':'), default=_default)
+
+    def emit(self, event: str, payload, to: Optional[Union[str, Iterable[str]]] = None):
+        """Send ``payload`` to one room, several rooms (each client once) or, with no ``to``, everyone"""
+        if to is not None and not isinstance(to, str):
+            to = [room for room in dict.fromkeys(to) if room is not None]
+            if not to:
+                return
+        data = self.encode(payload)
+        self.socketio.emit(event, data, to=to)
+        with self.lock:
+            self.counts[event] = self.counts.get(event, 0) + 1
+            self.bytes[event] = self.bytes.get(event, 0) + len(data)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'encoding': self.encoding,
+                'events': {
+                    event: {'count': count, 'bytes': self.bytes[event]}
+                    for event, count in self.counts.items()
+                }
+            }
+
+
+# Shared by the multiplayer and umpire blueprints; created by init_emitter
+emitter: Optional[Emitter] = None
+
+
+def init_emitter(socketio, encoding: str = ENCODING_JSON) -> Emitter:
+    global emitter
+    if emitter is None:
+        emitter = Emitter(socketio, encoding)
+    return emitter
@@ -0,0 +1,269 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from realtime.spatial import covering_cells, encode, precision_for_radius
+from realtime.timers import TimerWheel
+from vision.executor import POLL_INTERVAL, _spawn_thread
+
+logger = logging.getLogger(__name__)
+
+WIDEN = 'widen'
+EXPIRE = 'expire'
+
+
+class Ticket:
+    """A player waiting for a game"""
+
+    __slots__ = ('user_id', 'skill', 'game_type', 'cells', 'around', 'bucket', 'enqueued', 'step', 'data')
+
+    def __init__(self, user_id, skill: float, game_type: str, cells: Tuple[str, ...],
+                 around: Tuple[List[str], ...], bucket: int, enqueued: float, data: Optional[Dict] = None):
+        self.user_id = user_id
+        self.skill = skill
+        self.game_type = game_type
+        self.cells = cells  # own geohash cell per level
+        self.around = around  # cells covering the level's radius, per level
+        self.bucket = bucket
+        self.enqueued = enqueued
+        self.step = 0
+        self.data = data or {}
+
+
+class MatchQueue:
+    """Players waiting for a game, pooled by area, game type and skill bucket
+
+    Skill is quantized into buckets ``skill_width`` wide. Each entry of
+    ``radii`` (meters, smallest first) is a level with geohash cells at
+    least that wide; a ticket sits in the pool of its own cell at every
+    level, keyed by game type and bucket, in arrival order, and probes the
+    cells covering a circle of that radius around it. Every
+    ``widen_every`` seconds of waiting a ticket's step grows by one: at
+    step ``s`` it accepts players ``min(s, max_spread)`` buckets away and
+    up to level ``min(s, len(radii) - 1)``. A pair qualifies under the
+    larger step of the two. Since the oldest ticket of a bucket has the
+    largest step there, a probe only looks at the head of each bucket: a
+    bounded number of lookups (a few cells per level times
+    ``2 * max_spread + 1`` buckets) however many players wait, preferring
+    the nearest level, then the closest skill, then the longest wait.
+    Cells are the finest at least as wide as the radius, so a player found
+    at a level may be up to about a cell width beyond it. Step changes and
+    the ``max_wait`` timeout run off a TimerWheel driven by ``advance``.
+    Not thread safe; see Matchmaker.
+    """
+
+    def __init__(self, skill_width: float = 1.0, max_spread: int = 3,
+                 radii: Sequence[float] = (1000.0, 5000.0, 25000.0), widen_every: float = 15.0,
+                 max_wait: float = 300.0, tick: float = 1.0, start: float = 0.0):
+        self.skill_width = skill_width
+        self.max_spread = max_spread
+        self.radii = tuple(radii)
+        self.precisions = tuple(precision_for_radius(radius) for radius in self.radii)
+        self.widen_every = widen_every
+        self.max_wait = max_wait
+        self.max_step = max(max_spread, len(self.radii) - 1)
+        self.pools: Dict[Tuple, Dict[int, OrderedDict]] = {}  # (level, cell, game type) -> bucket -> tickets
+        self.tickets: Dict = {}  # user_id -> ticket
+        self.wheel = TimerWheel(tick=tick, start=start)
+        self.probes = 0
+        self.matched = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self.tickets)
+
+    def _add(self, ticket: Ticket):
+        for level, cell in enumerate(ticket.cells):
+            pool = self.pools.setdefault((level, cell, ticket.game_type), {})
+            pool.setdefault(ticket.bucket, OrderedDict())[ticket.user_id] = ticket
+        self.tickets[ticket.user_id] = ticket
+
+    def _remove(self, ticket: Ticket):
+        for level, cell in enumerate(ticket.cells):
+            key = (level, cell, ticket.game_type)
+            pool = self.pools[key]
+            waiting = pool[ticket.bucket]
+            del waiting[ticket.user_id]
+            if not waiting:
+                del pool[ticket.bucket]
+                if not pool:
+                    del self.pools[key]
+        del self.tickets[ticket.user_id]
+        self.wheel.cancel(ticket.user_id)
+
+    def _step(self, ticket: Ticket, now: float) -> int:
+        return min(int((now - ticket.enqueued) // self.widen_every), self.max_step)
+
+    def _probe(self, ticket: Ticket, now: float) -> Optional[Ticket]:
+        """Best waiting partner for ``ticket``, if any qualifies"""
+        self.probes += 1
+        own = ticket.step
+        for level, cells in enumerate(ticket.around):
+            pools = [self.pools.get((level, cell, ticket.game_type)) for cell in cells]
+            pools = [pool for pool in pools if pool]
+            if not pools:
+                continue
+            for distance in range(self.max_spread + 1):
+                best = None
+                for bucket in ((ticket.bucket,) if not distance
+                               else (ticket.bucket - distance, ticket.bucket + distance)):
+                    for pool in pools:
+                        waiting = pool.get(bucket)
+                        if not waiting:
+                            continue
+                        for other in waiting.values():
+                            if other is ticket:
+                                continue
+                            step = max(own, self._step(other, now))
+                            if (distance <= min(step, self.max_spread) and level <= step
+                                    and (best is None or other.enqueued < best.enqueued)):
+                                best = other
+                            # Only the head (or the one after ticket itself) can qualify
+                            break
+                if best is not None:
+                    return best
+        return None
+
+    def _schedule(self, ticket: Ticket):
+        if ticket.step < self.max_step:
+            self.wheel.schedule(ticket.user_id, ticket.enqueued + (ticket.step + 1) * self.widen_every, WIDEN)
+        else:
+            self.wheel.schedule(ticket.user_id, ticket.enqueued + self.max_wait, EXPIRE)
+
+    def enqueue(self, user_id, skill: float, game_type: str, lat: float, lng: float, now: float,
+                data: Optional[Dict] = None) -> Optional[Tuple[Ticket, Ticket]]:
+        """Queue a player, replacing any ticket they had; returns (waiting, new) when matched at once"""
+        if user_id in self.tickets:
+            self._remove(self.tickets[user_id])
+        finest = encode(lat, lng, max(self.precisions))
+        ticket = Ticket(
+            user_id, skill, game_type,
+            tuple(finest[:precision] for precision in self.precisions),
+            tuple(covering_cells(lat, lng, radius, precision)
+                  for radius, precision in zip(self.radii, self.precisions)),
+            math.floor(skill / self.skill_width), now, data
+        )
+        other = self._probe(ticket, now)
+        if other is not None:
+            self._remove(other)
+            self.matched += 1
+            return other, ticket
+        self._add(ticket)
+        self._schedule(ticket)
+        return None
+
+    def cancel(self, user_id) -> bool:
+        ticket = self.tickets.get(user_id)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        return True
+
+    def advance(self, now: float) -> Tuple[List[Tuple[Ticket, Ticket]], List[Ticket]]:
+        """Widen tickets whose step is due and drop timed out ones; returns (matches, expired)"""
+        matches = []
+        expired = []
+        for user_id, action in self.wheel.advance(now):
+            ticket = self.tickets.get(user_id)
+            if ticket is None:
+                continue
+            if action == EXPIRE:
+                self._remove(ticket)
+                self.expired += 1
+                expired.append(ticket)
+                continue
+            ticket.step = self._step(ticket, now)
+            other = self._probe(ticket, now)
+            if other is None:
+                self._schedule(ticket)
+                continue
+            self._remove(ticket)
+            self._remove(other)
+            self.matched += 1
+            # The longer waiting player first
+            matches.append((ticket, other) if ticket.enqueued <= other.enqueued else (other, ticket))
+        return matches, expired
+
+    def stats(self) -> Dict:
+        return {
+            'waiting': len(self.tickets),
+            'pools': len(self.pools),
+            'probes': self.probes,
+            'matched': self.matched,
+            'expired': self.expired
+        }
+
+
+class Matchmaker:
+    """Runs a MatchQueue on a background task
+
+    Players matched on arrival or as their tickets widen are handed to
+    ``on_match(waiting, new)``, and tickets that time out to
+    ``on_expire(ticket)``; both run outside the queue lock. The task
+    starts with the first ticket.
+    """
+
+    def __init__(self, on_match: Callable[[Ticket, Ticket], None], on_expire: Callable[[Ticket], None],
+                 spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.time, **options):
+        self.on_match = on_match
+        self.on_expire = on_expire
+        self.spawn = spawn
+        self.sleep = sleep
+        self.clock = clock
+        self.queue = MatchQueue(start=clock(), **options)
+        self.ready = threading.Condition()
+        self.started = False
+        self.stopping = False
+
+    def enqueue(self, user_id, skill: float, game_type: str, lat: float, lng: float,
+                data: Optional[Dict] = None) -> bool:
+        """Queue a player; returns True when they were matched right away"""
+        with self.ready:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            match = self.queue.enqueue(user_id, skill, game_type, lat, lng, self.clock(), data)
+            self.ready.notify()
+        if match is not None:
+            self._matched(*match)
+        return match is not None
+
+    def cancel(self, user_id) -> bool:
+        with self.ready:
+            return self.queue.cancel(user_id)
+
+    def _matched(self, waiting: Ticket, new: Ticket):
+        try:
+            self.on_match(waiting, new)
+        except Exception as e:
+            logger.error(f"Match callback for {waiting.user_id} and {new.user_id} failed: {str(e)}")
+
+    def _run(self):
+        while not self.stopping:
+            with self.ready:
+                while not len(self.queue) and not self.stopping:
+                    self.ready.wait(POLL_INTERVAL)
+                if self.stopping:
+                    break
+                matches, expired = self.queue.advance(self.clock())
+            for waiting, new in matches:
+                self._matched(waiting, new)
+            for ticket in expired:
+                try:
+                    self.on_expire(ticket)
+                except Exception as e:
+                    logger.error(f"Expiry callback for {ticket.user_id} failed: {str(e)}")
+            self.sleep(self.queue.wheel.tick)
+
+    def stats(self) -> Dict:
+        with self.ready:
+            return self.queue.stats()
+
+    def shutdown(self):
+        self.stopping = True
+        with self.ready:
+            self.ready.notify_all()
@@ -0,0 +1,212 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from realtime.write_behind import write_rows
+from vision.executor import _spawn_thread
+
+STATUS_ONLINE = 'online'
+STATUS_IN_GAME = 'in_game'
+STATUS_AWAY = 'away'
+STATUS_OFFLINE = 'offline'
+STATUSES = (STATUS_ONLINE, STATUS_IN_GAME, STATUS_AWAY, STATUS_OFFLINE)
+
+
+class PresenceTracker:
+    """In-memory presence fed by heartbeats, flushed to storage in batches
+
+    A heartbeat only updates the user's entry and the venue index. A user
+    whose status, venue or activity changed, or whose stored last_active
+    is older than ``touch_interval`` seconds, is marked dirty; every
+    ``flush_interval`` seconds users silent for ``timeout`` seconds go
+    offline and the dirty entries are handed to ``writer`` as one list of
+    rows. A failed batch goes through ``write_rows``: a row raising one of
+    ``discard`` is dropped, and the users of the rows it keeps stay dirty
+    for the next flush.
+    Venue queries read the index directly, and positions go to an
+    optional SpatialIndex for proximity queries, so both cost time
+    proportional to their results.
+    """
+
+    def __init__(self, writer: Callable[[List[Dict]], None], spatial=None, timeout: float = 90.0,
+                 touch_interval: float = 60.0, flush_interval: float = 5.0,
+                 discard: Tuple[type, ...] = (), spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.writer = writer
+        self.spatial = spatial
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self.flush_interval = flush_interval
+        self.discard = discard
+        self.spawn = spawn
+        self.sleep = sleep
+        self.clock = clock
+        self.users: Dict = {}  # user_id -> entry
+        self.venues: Dict = {}  # venue_id -> set of user ids
+        self.dirty: Set = set()
+        self.offline: Dict = {}  # user_id -> final row of users gone offline, until flushed
+        self.lock = threading.Lock()
+        self.started = False
+        self.stopping = False
+        self.flushes = 0
+        self.written = 0
+        self.rejected = 0
+
+    def heartbeat(self, user_id, status: str = STATUS_ONLINE, venue_id=None, game_id=None,
+                  activity: Optional[str] = None, lat: Optional[float] = None,
+                  lng: Optional[float] = None):
+        if status not in STATUSES or status == STATUS_OFFLINE:
+            status = STATUS_ONLINE
+        now = self.clock()
+        with self.lock:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            entry = self.users.get(user_id)
+            if entry is None:
+                entry = self.users[user_id] = {'touched': None, 'venue_id': None}
+                changed = True
+            else:
+                changed = (entry['status'] != status or entry['venue_id'] != venue_id
+                           or entry['game_id'] != game_id or entry['activity'] != activity)
+            if entry['venue_id'] != venue_id:
+                self._unindex(user_id, entry['venue_id'])
+                if venue_id is not None:
+                    self.venues.setdefault(venue_id, set()).add(user_id)
+            entry.update(status=status, venue_id=venue_id, game_id=game_id, activity=activity,
+                         seen=now, last_active=datetime.utcnow())
+            if changed or entry['touched'] is None or now - entry['touched'] >= self.touch_interval:
+                self.dirty.add(user_id)
+            self.offline.pop(user_id, None)
+        if lat is not None and lng is not None and self.spatial is not None:
+            self.spatial.update(user_id, lat, lng)
+
+    def leave(self, user_id):
+        """The user disconnected; they are stored as offline on the next flush"""
+        with self.lock:
+            self._drop(user_id)
+
+    def _unindex(self, user_id, venue_id):
+        users = self.venues.get(venue_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self.venues[venue_id]
+
+    def _drop(self, user_id):
+        entry = self.users.pop(user_id, None)
+        if entry is None:
+            return
+        self._unindex(user_id, entry['venue_id'])
+        self.dirty.discard(user_id)
+        self.offline[user_id] = self._row(user_id, dict(entry, status=STATUS_OFFLINE))
+        if self.spatial is not None:
+            self.spatial.remove(user_id)
+
+    @staticmethod
+    def _row(user_id, entry: Dict) -> Dict:
+        status = entry['status']
+        return {
+            'user_id': user_id,
+            'status': status,
+            'venue_id': entry['venue_id'],
+            'game_id': entry['game_id'],
+            'current_activity': entry['activity'],
+            'last_active': entry['last_active'],
+            'is_available': status == STATUS_ONLINE,
+            'is_busy': status == STATUS_IN_GAME,
+            'is_away': status == STATUS_AWAY
+        }
+
+    def expire(self) -> int:
+        """Take users silent for longer than the timeout offline"""
+        cutoff = self.clock() - self.timeout
+        with self.lock:
+            silent = [user_id for user_id, entry in self.users.items() if entry['seen'] < cutoff]
+            for user_id in silent:
+                self._drop(user_id)
+        return len(silent)
+
+    def flush(self) -> int:
+        now = self.clock()
+        with self.lock:
+            rows = [self._row(user_id, self.users[user_id]) for user_id in self.dirty]
+            rows.extend(self.offline.values())
+            dirty = self.dirty
+            self.dirty, self.offline = set(), {}
+        if not rows:
+            return 0
+        written, rejected, kept = write_rows(self.writer, rows, self.discard, 'presence rows')
+        retry = {row['user_id'] for row in kept}
+        with self.lock:
+            for row in kept:
+                user_id = row['user_id']
+                if user_id in self.users:
+                    self.dirty.add(user_id)
+                else:
+                    self.offline.setdefault(user_id, row)
+            for user_id in dirty - retry:
+                entry = self.users.get(user_id)
+                if entry is not None:
+                    entry['touched'] = now
+        self.flushes += 1
+        self.written += written
+        self.rejected += rejected
+        return written
+
+    def _run(self):
+        while not self.stopping:
+            self.sleep(self.flush_interval)
+            self.expire()
+            self.flush()
+
+    def status(self, user_id) -> str:
+        with self.lock:
+            entry = self.users.get(user_id)
+            return entry['status'] if entry is not None else STATUS_OFFLINE
+
+    def venue_of(self, user_id):
+        """Venue the user last reported being at, or None"""
+        with self.lock:
+            entry = self.users.get(user_id)
+            return entry['venue_id'] if entry is not None else None
+
+    def at_venue(self, venue_id) -> List[Dict]:
+        """Users online at a venue, with their status"""
+        with self.lock:
+            return [
+                {'user_id': user_id, 'status': self.users[user_id]['status']}
+                for user_id in self.venues.get(venue_id, ())
+            ]
+
+    def near(self, lat: float, lng: float, radius: Optional[float] = None,
+             limit: Optional[int] = None, exclude=None) -> List[Dict]:
+        """Online users within ``radius`` meters, nearest first"""
+        if self.spatial is None:
+            return []
+        found = []
+        for user_id, distance in self.spatial.nearby(lat, lng, radius, exclude=exclude):
+            with self.lock:
+                entry = self.users.get(user_id)
+                if entry is None:
+                    continue
+                found.append({'user_id': user_id, 'status': entry['status'], 'distance': distance})
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'online': len(self.users),
+                'venues': len(self.venues),
+                'dirty': len(self.dirty) + len(self.offline),
+                'flushes': self.flushes,
+                'written': self.written,
+                'rejected': self.rejected
+            }
+
+    def shutdown(self):
+        self.stopping = True
+        self.flush()
@@ -0,0 +1,147 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCache:
+    """Read-through cache of user profile summaries
+
+    ``loader(user_ids)`` fetches summaries for a list of ids in one query
+    and returns them keyed by id. Entries live for ``ttl`` seconds, the
+    least recently used are dropped beyond ``max_entries``, and
+    ``invalidate`` forgets a user at once. Users the loader does not
+    return are not cached, so a user created later is found on the next
+    read.
+    """
+
+    def __init__(self, loader: Callable[[list], Dict], ttl: float = 300.0, max_entries: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries: OrderedDict = OrderedDict()  # user_id -> (expires, profile)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def _lookup(self, user_id, now: float) -> Optional[Dict]:
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return entry[1]
+
+    def _store(self, user_id, profile: Dict, now: float):
+        self.entries[user_id] = (now + self.ttl, profile)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, user_id) -> Optional[Dict]:
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids: Iterable) -> Dict:
+        """Profiles of the given users that exist, loading all misses with one loader call"""
+        found = {}
+        missing = []
+        with self.lock:
+            now = self.clock()
+            for user_id in user_ids:
+                profile = self._lookup(user_id, now)
+                if profile is not None:
+                    found[user_id] = profile
+                elif user_id not in missing:
+                    missing.append(user_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            loaded = self.loader(missing)
+            with self.lock:
+                self.loads += 1
+                now = self.clock()
+                for user_id, profile in loaded.items():
+                    self._store(user_id, profile, now)
+            found.update(loaded)
+        return found
+
+    def put(self, user_id, profile: Dict):
+        """Prime the cache with a profile already in hand"""
+        with self.lock:
+            self._store(user_id, profile, self.clock())
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'loads': self.loads,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+def profile_summary(user) -> Dict:
+    """The fields of a User that multiplayer and umpire events carry"""
+    return {'id': user.id, 'username': user.username}
+
+
+def load_user_profiles(user_ids: list) -> Dict:
+    from models import User
+
+    return {user.id: profile_summary(user) for user in User.query.filter(User.id.in_(user_ids))}
+
+
+# Shared by the multiplayer and umpire blueprints
+user_profiles = ProfileCache(
+    load_user_profiles,
+    ttl=float(os.environ.get("USER_PROFILE_CACHE_TTL_SECONDS", "300")),
+    max_entries=int(os.environ.get("USER_PROFILE_CACHE_SIZE", "10000"))
+)
+
+
+def invalidate_on_change(model):
+    """Drop a user's cached profile whenever their row is updated or deleted in this process
+
+    The profile is dropped when the change is flushed and again once its
+    transaction commits, since a read in between can cache the committed
+    (old) row again.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session, object_session
+
+    def forget(mapper, connection, target):
+        user_profiles.invalidate(target.id)
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault('changed_profiles', set()).add(target.id)
+
+    def forget_committed(session):
+        for user_id in session.info.pop('changed_profiles', ()):
+            user_profiles.invalidate(user_id)
+
+    def discard(session, *args):
+        session.info.pop('changed_profiles', None)
+
+    event.listen(model, 'after_update', forget)
+    event.listen(model, 'after_delete', forget)
+    event.listen(Session, 'after_commit', forget_committed)
+    event.listen(Session, 'after_rollback', discard)
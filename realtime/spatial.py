@@ -0,0 +1,189 @@
+import logging
+import math
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 12
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def encode(lat: float, lng: float, precision: int) -> str:
+    """Geohash of a point: alternate longitude/latitude bisections, 5 bits per character"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    cell = []
+    bits = 0
+    value = 0
+    even = True
+    while len(cell) < precision:
+        span, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (span[0] + span[1]) / 2
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            span[0] = middle
+        else:
+            value <<= 1
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            cell.append(BASE32[value])
+            bits = value = 0
+    return ''.join(cell)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(height, width) of a geohash cell in degrees"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def precision_for_radius(radius: float) -> int:
+    """Finest precision whose cells are at least ``radius`` meters on each side at the equator"""
+    for precision in range(MAX_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if min(height, width) * METERS_PER_DEGREE >= radius:
+            return precision
+    return 1
+
+
+def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_cells(lat: float, lng: float, radius: float, precision: int) -> List[str]:
+    """Geohash cells overlapping the bounding box of a circle
+
+    For a cell at least ``radius`` wide this is the point's own cell and
+    (some of) its neighbours; longitudes wrap at the antimeridian.
+    """
+    height, width = cell_size(precision)
+    dlat = radius / METERS_PER_DEGREE
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    south = max(-90.0, lat - dlat)
+    north = min(90.0, lat + dlat)
+    if 2 * dlng >= 360.0:
+        west, columns = -180.0, int(round(360.0 / width))
+    else:
+        west = math.floor((lng - dlng) / width) * width
+        columns = int(math.floor((lng + dlng) / width) - math.floor((lng - dlng) / width)) + 1
+
+    cells = []
+    row = math.floor(south / height) * height
+    while row <= north and row < 90.0:
+        for column in range(columns):
+            centre_lng = (west + (column + 0.5) * width + 180.0) % 360.0 - 180.0
+            cells.append(encode(row + height / 2, centre_lng, precision))
+        row += height
+    return list(dict.fromkeys(cells))
+
+
+class SpatialIndex:
+    """Player positions bucketed by geohash cell at every precision level
+
+    Each player sits in one cell per precision from 1 to ``precision``, so
+    an update costs ``precision`` set moves and a proximity query of any
+    radius only visits the few cells covering it at the matching level,
+    then filters candidates by exact distance. Positions older than
+    ``ttl`` seconds are dropped when a query meets them.
+
+    Rooms are cells at ``room_precision`` (chosen from ``radius``): a
+    player publishes to their own cell's room and subscribes to the rooms
+    covering ``radius`` around them, so everyone within the radius hears
+    them, across cell boundaries, and a broadcast reaches only the
+    players of a handful of cells.
+    """
+
+    def __init__(self, radius: float = 100.0, precision: int = 8, ttl: float = 900.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.radius = radius
+        self.precision = precision
+        self.room_precision = min(precision, precision_for_radius(radius))
+        self.ttl = ttl
+        self.clock = clock
+        self.levels: List[Dict[str, Set]] = [{} for _ in range(precision + 1)]
+        self.positions: Dict = {}  # user -> (lat, lng, cell, updated)
+        self.lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def update(self, user_id, lat: float, lng: float) -> str:
+        """Move a player to a new position; returns their cell at full precision"""
+        cell = encode(lat, lng, self.precision)
+        with self.lock:
+            previous = self.positions.get(user_id)
+            if previous is None or previous[2] != cell:
+                if previous is not None:
+                    self._unlink(user_id, previous[2])
+                for level in range(1, self.precision + 1):
+                    self.levels[level].setdefault(cell[:level], set()).add(user_id)
+            self.positions[user_id] = (lat, lng, cell, self.clock())
+        return cell
+
+    def remove(self, user_id):
+        with self.lock:
+            previous = self.positions.pop(user_id, None)
+            if previous is not None:
+                self._unlink(user_id, previous[2])
+
+    def _unlink(self, user_id, cell: str):
+        for level in range(1, self.precision + 1):
+            bucket = self.levels[level].get(cell[:level])
+            if bucket is not None:
+                bucket.discard(user_id)
+                if not bucket:
+                    del self.levels[level][cell[:level]]
+
+    def room_for(self, lat: float, lng: float) -> str:
+        """Room a player at this position publishes to"""
+        return f"area_{encode(lat, lng, self.room_precision)}"
+
+    def rooms_around(self, lat: float, lng: float) -> Set[str]:
+        """Rooms a player at this position subscribes to"""
+        return {f"area_{cell}" for cell in covering_cells(lat, lng, self.radius, self.room_precision)}
+
+    def nearby(self, lat: float, lng: float, radius: Optional[float] = None,
+               limit: Optional[int] = None, exclude=None) -> List[Tuple]:
+        """(user_id, distance in meters) of players within ``radius``, nearest first"""
+        radius = self.radius if radius is None else radius
+        level = min(self.precision, precision_for_radius(radius))
+        cells = covering_cells(lat, lng, radius, level)
+        now = self.clock()
+        found = []
+        stale = set()
+        with self.lock:
+            for cell in cells:
+                for user_id in self.levels[level].get(cell, ()):
+                    if user_id == exclude:
+                        continue
+                    user_lat, user_lng, _, updated = self.positions[user_id]
+                    if now - updated > self.ttl:
+                        stale.add(user_id)
+                        continue
+                    distance = haversine(lat, lng, user_lat, user_lng)
+                    if distance <= radius:
+                        found.append((user_id, distance))
+            for user_id in stale:
+                self._unlink(user_id, self.positions.pop(user_id)[2])
+        found.sort(key=lambda item: item[1])
+        return found[:limit] if limit is not None else found
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'players': len(self.positions),
+                'cells': len(self.levels[self.precision]),
+                'room_precision': self.room_precision
+            }
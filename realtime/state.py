@@ -0,0 +1,337 @@
+import bisect
+import copy
+import hashlib
+import json
+import logging
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Challenge states: pending -> active -> completed, or pending -> declined (deleted)
+CHALLENGE_PENDING = 'pending'
+CHALLENGE_ACTIVE = 'active'
+CHALLENGE_COMPLETED = 'completed'
+
+# Challenge keys stored outside the Redis backend's JSON 'data' field
+CHALLENGE_FIELDS = ('status', 'seq', 'scores')
+
+# Challenges are kept this long past their duration before expiring
+CHALLENGE_GRACE_SECONDS = 24 * 60 * 60
+
+# User records are removed on disconnect; this expires those a crashed worker never removed
+USER_TTL_SECONDS = 12 * 60 * 60
+
+
+class StateBackend:
+    """Shared multiplayer state: where each user is and the challenges in play
+
+    Users are records of plain JSON values keyed by user id. Challenges are
+    dicts as built by the multiplayer blueprint ('status', 'scores' of
+    str(player id) -> int, and JSON values otherwise); every status change
+    and score update is an atomic compare-and-set on the challenge's
+    status, so concurrent requests on any worker cannot both win. Each
+    score update bumps the challenge's 'seq', which orders broadcasts.
+    """
+
+    def set_user(self, user_id, record: Dict):
+        raise NotImplementedError
+
+    def get_user(self, user_id) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def remove_user(self, user_id):
+        raise NotImplementedError
+
+    def create_challenge(self, challenge_id: str, challenge: Dict):
+        raise NotImplementedError
+
+    def get_challenge(self, challenge_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def transition_challenge(self, challenge_id: str, from_status: str, to_status: str,
+                             changes: Optional[Dict] = None,
+                             scores: Optional[Dict[str, int]] = None) -> Optional[Dict]:
+        """Move a challenge from ``from_status`` to ``to_status``, merging in
+        ``changes`` and adding ``scores`` entries; returns the updated
+        challenge, or None if it is missing or not in ``from_status``"""
+        raise NotImplementedError
+
+    def delete_challenge(self, challenge_id: str, from_status: Optional[str] = None) -> bool:
+        """Delete a challenge (only while in ``from_status`` if given)"""
+        raise NotImplementedError
+
+    def apply_scores(self, challenge_id: str, deltas: Dict[str, int]) -> Optional[Dict]:
+        """Add ``deltas`` to the players' scores while the challenge is
+        active, ignoring players not in it, and bump its 'seq'; returns the
+        updated challenge, or None if it is not active or none of the
+        players is in it (the challenge is then left untouched)"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class InProcessStateBackend(StateBackend):
+    """State in this process's memory, for a single worker and for tests"""
+
+    def __init__(self):
+        self.users: Dict = {}
+        self.challenges: Dict[str, Dict] = {}
+        self.lock = Lock()
+
+    def set_user(self, user_id, record: Dict):
+        with self.lock:
+            self.users[user_id] = copy.deepcopy(record)
+
+    def get_user(self, user_id) -> Optional[Dict]:
+        with self.lock:
+            return copy.deepcopy(self.users.get(user_id))
+
+    def remove_user(self, user_id):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def create_challenge(self, challenge_id: str, challenge: Dict):
+        with self.lock:
+            self.challenges[challenge_id] = dict(copy.deepcopy(challenge), seq=0)
+
+    def get_challenge(self, challenge_id: str) -> Optional[Dict]:
+        with self.lock:
+            return copy.deepcopy(self.challenges.get(challenge_id))
+
+    def transition_challenge(self, challenge_id: str, from_status: str, to_status: str,
+                             changes: Optional[Dict] = None,
+                             scores: Optional[Dict[str, int]] = None) -> Optional[Dict]:
+        with self.lock:
+            challenge = self.challenges.get(challenge_id)
+            if challenge is None or challenge['status'] != from_status:
+                return None
+            challenge.update(copy.deepcopy(changes or {}))
+            challenge['scores'].update(scores or {})
+            challenge['status'] = to_status
+            return copy.deepcopy(challenge)
+
+    def delete_challenge(self, challenge_id: str, from_status: Optional[str] = None) -> bool:
+        with self.lock:
+            challenge = self.challenges.get(challenge_id)
+            if challenge is None or from_status not in (None, challenge['status']):
+                return False
+            del self.challenges[challenge_id]
+            return True
+
+    def apply_scores(self, challenge_id: str, deltas: Dict[str, int]) -> Optional[Dict]:
+        with self.lock:
+            challenge = self.challenges.get(challenge_id)
+            if challenge is None or challenge['status'] != CHALLENGE_ACTIVE:
+                return None
+            applied = {player: amount for player, amount in deltas.items() if player in challenge['scores']}
+            if not applied:
+                return None
+            for player, amount in applied.items():
+                challenge['scores'][player] += amount
+            challenge['seq'] = challenge.get('seq', 0) + 1
+            return copy.deepcopy(challenge)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {'backend': 'memory', 'users': len(self.users), 'challenges': len(self.challenges)}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes
+
+    Each node owns ``replicas`` points on a 64-bit ring and a key belongs
+    to the first point at or after its hash, so adding or removing a node
+    only moves about 1/n of the keys.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 128):
+        self.points: List[int] = []
+        self.owners: List[str] = []
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        for point, node in ring:
+            self.points.append(point)
+            self.owners.append(node)
+        if not self.points:
+            raise ValueError("HashRing needs at least one node")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect_left(self.points, _hash(key))
+        return self.owners[index % len(self.points)]
+
+
+class RedisStateBackend(StateBackend):
+    """State in Redis-protocol servers, sharded by consistent hashing
+
+    ``clients`` maps a shard name to a redis-py compatible client created
+    with ``decode_responses=True`` (a real connection, or e.g. fakeredis
+    locally). A user is one JSON string key expiring ``user_ttl`` seconds
+    after it was last set; a challenge is a hash holding
+    its status, sequence number and the JSON of its other fields, plus a
+    hash of scores on the same shard. Transitions WATCH the challenge and commit in a
+    MULTI/EXEC block, retrying when another writer got there first, which
+    needs no server-side scripting.
+    """
+
+    def __init__(self, clients: Dict[str, object], prefix: str = 'dojopool:mp:',
+                 max_retries: int = 16, user_ttl: int = USER_TTL_SECONDS):
+        self.clients = clients
+        self.ring = HashRing(clients)
+        self.prefix = prefix
+        self.max_retries = max_retries
+        self.user_ttl = user_ttl
+
+    @classmethod
+    def from_urls(cls, urls: Iterable[str], **kwargs) -> 'RedisStateBackend':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for a Redis state backend")
+        return cls({url: redis.Redis.from_url(url, decode_responses=True) for url in urls}, **kwargs)
+
+    def _client(self, key: str):
+        return self.clients[self.ring.node_for(key)]
+
+    def _user_key(self, user_id) -> str:
+        return f"{self.prefix}user:{user_id}"
+
+    def _challenge_keys(self, challenge_id: str):
+        key = f"{self.prefix}challenge:{challenge_id}"
+        return key, f"{key}:scores"
+
+    def set_user(self, user_id, record: Dict):
+        key = self._user_key(user_id)
+        self._client(key).set(key, json.dumps(record), ex=self.user_ttl)
+
+    def get_user(self, user_id) -> Optional[Dict]:
+        key = self._user_key(user_id)
+        value = self._client(key).get(key)
+        return json.loads(value) if value is not None else None
+
+    def remove_user(self, user_id):
+        key = self._user_key(user_id)
+        self._client(key).delete(key)
+
+    def create_challenge(self, challenge_id: str, challenge: Dict):
+        key, scores_key = self._challenge_keys(challenge_id)
+        fields = {name: value for name, value in challenge.items() if name not in CHALLENGE_FIELDS}
+        ttl = int(challenge.get('duration', 0)) + CHALLENGE_GRACE_SECONDS
+        with self._client(key).pipeline(transaction=True) as pipe:
+            pipe.delete(key, scores_key)
+            pipe.hset(key, mapping={'status': challenge['status'], 'seq': 0, 'data': json.dumps(fields)})
+            if challenge.get('scores'):
+                pipe.hset(scores_key, mapping=challenge['scores'])
+            pipe.expire(key, ttl)
+            pipe.expire(scores_key, ttl)
+            pipe.execute()
+
+    @staticmethod
+    def _decode(fields: Dict, scores: Dict) -> Optional[Dict]:
+        if not fields:
+            return None
+        challenge = json.loads(fields['data'])
+        challenge['status'] = fields['status']
+        challenge['seq'] = int(fields.get('seq', 0))
+        challenge['scores'] = {player: int(score) for player, score in scores.items()}
+        return challenge
+
+    def get_challenge(self, challenge_id: str) -> Optional[Dict]:
+        key, scores_key = self._challenge_keys(challenge_id)
+        with self._client(key).pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.hgetall(scores_key)
+            fields, scores = pipe.execute()
+        return self._decode(fields, scores)
+
+    def _watched(self, challenge_id: str, attempt):
+        """Run ``attempt(pipe, key, scores_key)`` under WATCH until it commits
+
+        ``attempt`` reads in immediate mode and returns (result, commit):
+        ``commit`` queues the writes on the pipeline in MULTI mode, or is
+        None to give up with ``result`` without writing.
+        """
+        from redis.exceptions import WatchError
+
+        key, scores_key = self._challenge_keys(challenge_id)
+        client = self._client(key)
+        for _ in range(self.max_retries):
+            with client.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(key, scores_key)
+                    result, commit = attempt(pipe, key, scores_key)
+                    if commit is None:
+                        pipe.unwatch()
+                        return result
+                    pipe.multi()
+                    commit(pipe)
+                    pipe.execute()
+                    return result
+                except WatchError:
+                    continue
+        logger.warning(f"Challenge {challenge_id} update gave up after {self.max_retries} conflicts")
+        return None
+
+    def transition_challenge(self, challenge_id: str, from_status: str, to_status: str,
+                             changes: Optional[Dict] = None,
+                             scores: Optional[Dict[str, int]] = None) -> Optional[Dict]:
+        def attempt(pipe, key, scores_key):
+            challenge = self._decode(pipe.hgetall(key), pipe.hgetall(scores_key))
+            if challenge is None or challenge['status'] != from_status:
+                return None, None
+            challenge.update(changes or {})
+            challenge['scores'].update(scores or {})
+            challenge['status'] = to_status
+            fields = {name: value for name, value in challenge.items() if name not in CHALLENGE_FIELDS}
+
+            def commit(pipe):
+                pipe.hset(key, mapping={'status': to_status, 'data': json.dumps(fields)})
+                if scores:
+                    pipe.hset(scores_key, mapping=scores)
+            return challenge, commit
+
+        return self._watched(challenge_id, attempt)
+
+    def delete_challenge(self, challenge_id: str, from_status: Optional[str] = None) -> bool:
+        def attempt(pipe, key, scores_key):
+            status = pipe.hget(key, 'status')
+            if status is None or from_status not in (None, status):
+                return False, None
+            return True, lambda pipe: pipe.delete(key, scores_key)
+
+        return bool(self._watched(challenge_id, attempt))
+
+    def apply_scores(self, challenge_id: str, deltas: Dict[str, int]) -> Optional[Dict]:
+        def attempt(pipe, key, scores_key):
+            challenge = self._decode(pipe.hgetall(key), pipe.hgetall(scores_key))
+            if challenge is None or challenge['status'] != CHALLENGE_ACTIVE:
+                return None, None
+            applied = {player: amount for player, amount in deltas.items() if player in challenge['scores']}
+            if not applied:
+                return None, None
+            for player, amount in applied.items():
+                challenge['scores'][player] += amount
+            challenge['seq'] += 1
+
+            def commit(pipe):
+                for player, amount in applied.items():
+                    pipe.hincrby(scores_key, player, amount)
+                pipe.hincrby(key, 'seq', 1)
+            return challenge, commit
+
+        return self._watched(challenge_id, attempt)
+
+    def stats(self) -> Dict:
+        return {'backend': 'redis', 'shards': len(self.clients)}
+
+
+def create_state_backend(urls: str = '') -> StateBackend:
+    """Build a Redis backend over the comma-separated ``urls``, or an in-process one"""
+    shards = [url.strip() for url in urls.split(',') if url.strip()]
+    if shards:
+        return RedisStateBackend.from_urls(shards)
+    return InProcessStateBackend()
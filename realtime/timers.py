@@ -0,0 +1,152 @@
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from vision.executor import POLL_INTERVAL, _spawn_thread
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """Hierarchical timing wheel of keyed deadlines
+
+    Deadlines are rounded up to whole ticks. Level 0 has one slot per tick
+    for the next ``slots`` ticks, and each level above covers ``slots``
+    times the span of the one below; a timer sits at the lowest level whose
+    higher digits match the current tick and moves down a level when the
+    wheel reaches its slot. Scheduling, cancelling and each tick are O(1)
+    (amortized over cascades), and memory is proportional to the timers
+    pending. Timers further out than the top level wait in an overflow map
+    that is rescanned once per top-level revolution.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, start: float = 0.0):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.tick = tick
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.levels = levels
+        self.origin = start
+        self.current = 0
+        self.wheels: List[List[Dict]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.overflow: Dict[Any, Tuple[int, Any]] = {}
+        self.due: Dict[Any, Tuple[int, Any]] = {}
+        self.where: Dict[Any, Dict] = {}  # key -> the slot dict holding it
+
+    def __len__(self) -> int:
+        return len(self.where)
+
+    def _tick_for(self, deadline: float) -> int:
+        return math.ceil((deadline - self.origin) / self.tick)
+
+    def _place(self, key, expires: int, payload):
+        if expires <= self.current:
+            slot = self.due
+        else:
+            slot = self.overflow
+            for level in range(self.levels):
+                shift = self.bits * (level + 1)
+                if expires >> shift == self.current >> shift:
+                    slot = self.wheels[level][(expires >> (self.bits * level)) & self.mask]
+                    break
+        slot[key] = (expires, payload)
+        self.where[key] = slot
+
+    def schedule(self, key, deadline: float, payload=None):
+        """Fire ``key`` with ``payload`` at ``deadline``, replacing any timer it had"""
+        self.cancel(key)
+        self._place(key, self._tick_for(deadline), payload)
+
+    def cancel(self, key) -> bool:
+        slot = self.where.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    def _cascade(self, slot: Dict):
+        entries = list(slot.items())
+        slot.clear()
+        for key, (expires, payload) in entries:
+            self._place(key, expires, payload)
+
+    def advance(self, now: float) -> List[Tuple[Any, Any]]:
+        """Move the wheel up to ``now``; returns (key, payload) of the timers that expired"""
+        target = math.floor((now - self.origin) / self.tick)
+        while self.current < target:
+            self.current += 1
+            if not self.current & ((1 << (self.bits * self.levels)) - 1):
+                self._cascade(self.overflow)
+            # Higher levels first: their timers may land in a lower slot due now
+            for level in range(self.levels - 1, 0, -1):
+                if not self.current & ((1 << (self.bits * level)) - 1):
+                    self._cascade(self.wheels[level][(self.current >> (self.bits * level)) & self.mask])
+            self._cascade(self.wheels[0][self.current & self.mask])
+
+        expired = [(key, payload) for key, (_, payload) in self.due.items()]
+        for key, _ in expired:
+            del self.where[key]
+        self.due.clear()
+        return expired
+
+
+class TimerScheduler:
+    """Runs a TimerWheel against the clock on a background task
+
+    ``callback(key, payload)`` is called for every timer as it expires,
+    within about one tick of its deadline. The task starts with the first
+    timer scheduled.
+    """
+
+    def __init__(self, callback: Callable[[Any, Any], None], tick: float = 1.0,
+                 spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.time):
+        self.callback = callback
+        self.sleep = sleep
+        self.clock = clock
+        self.spawn = spawn
+        self.wheel = TimerWheel(tick=tick, start=clock())
+        self.ready = threading.Condition()
+        self.started = False
+        self.stopping = False
+        self.fired = 0
+
+    def schedule(self, key, deadline: float, payload=None):
+        with self.ready:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            self.wheel.schedule(key, deadline, payload)
+            self.ready.notify()
+
+    def cancel(self, key) -> bool:
+        with self.ready:
+            return self.wheel.cancel(key)
+
+    def _run(self):
+        while not self.stopping:
+            with self.ready:
+                while not len(self.wheel) and not self.stopping:
+                    self.ready.wait(POLL_INTERVAL)
+                if self.stopping:
+                    break
+                expired = self.wheel.advance(self.clock())
+            for key, payload in expired:
+                try:
+                    self.callback(key, payload)
+                except Exception as e:
+                    logger.error(f"Timer callback for {key} failed: {str(e)}")
+            self.fired += len(expired)
+            self.sleep(self.wheel.tick)
+
+    def stats(self) -> Dict:
+        with self.ready:
+            return {'pending': len(self.wheel), 'fired': self.fired}
+
+    def shutdown(self):
+        self.stopping = True
+        with self.ready:
+            self.ready.notify_all()
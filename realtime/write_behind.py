@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+from vision.executor import POLL_INTERVAL, _spawn_thread
+
+logger = logging.getLogger(__name__)
+
+
+def write_rows(writer: Callable[[List[Dict]], None], rows: List[Dict], discard: Tuple[type, ...] = (),
+               label: str = 'rows') -> Tuple[int, int, List[Dict]]:
+    """Hand ``rows`` to ``writer`` as one batch, isolating bad rows if it fails
+
+    A failed batch is retried one row at a time: a row raising one of
+    ``discard`` (such as an integrity error) is skipped for good, and the
+    first other failure stops the retry, as the store is likely down.
+    Returns how many rows were written, how many were discarded and the
+    rows left for a later try.
+    """
+    if not rows:
+        return 0, 0, []
+    try:
+        writer(rows)
+        return len(rows), 0, []
+    except Exception as e:
+        logger.error(f"Error writing {len(rows)} {label}, retrying one by one: {str(e)}")
+    written = rejected = 0
+    for index, row in enumerate(rows):
+        try:
+            writer([row])
+        except discard as e:
+            logger.error(f"Discarding one of the {label}: {str(e)}")
+            rejected += 1
+            continue
+        except Exception as e:
+            logger.error(f"Error writing {label}, keeping {len(rows) - index} for later: {str(e)}")
+            return written, rejected, rows[index:]
+        written += 1
+    return written, rejected, []
+
+
+class WriteBehindBuffer:
+    """Rows buffered in memory and written by a background task in batches
+
+    ``add`` only appends; the task hands the buffer to ``writer`` as one
+    list once ``max_rows`` are waiting or the oldest has waited
+    ``max_age`` seconds, and ``flush`` writes it at once. Failed batches go
+    through ``write_rows``, so a row the store rejects is dropped alone and
+    the rest are kept for the next try, up to ``max_pending``. The task
+    starts with the first row.
+    """
+
+    label = 'rows'
+
+    def __init__(self, writer: Callable[[List[Dict]], None], max_rows: int = 200,
+                 max_age: float = 1.0, max_pending: int = 20000, discard: Tuple[type, ...] = (),
+                 spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.writer = writer
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.max_pending = max_pending
+        self.discard = discard
+        self.spawn = spawn
+        self.sleep = sleep
+        self.clock = clock
+        self.rows: List[Dict] = []
+        self.writing: List[Dict] = []
+        self.oldest = None
+        self.ready = threading.Condition()
+        self.started = False
+        self.stopping = False
+        self.written = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def add(self, row: Dict):
+        with self.ready:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            if not self.rows:
+                self.oldest = self.clock()
+            self.rows.append(row)
+            if len(self.rows) >= self.max_rows:
+                self.ready.notify()
+
+    def _run(self):
+        while not self.stopping:
+            with self.ready:
+                while not self.rows and not self.stopping:
+                    self.ready.wait(POLL_INTERVAL)
+                if self.stopping:
+                    break
+                delay = self.oldest + self.max_age - self.clock()
+                if len(self.rows) < self.max_rows and delay > 0:
+                    self.ready.wait(min(delay, POLL_INTERVAL))
+                    continue
+            _, kept = self._flush()
+            if kept:
+                # Back off instead of retrying in a tight loop
+                self.sleep(self.max_age)
+
+    def _flush(self) -> Tuple[int, int]:
+        with self.ready:
+            rows, self.rows, self.oldest = self.rows, [], None
+            self.writing = rows
+        if not rows:
+            return 0, 0
+        written, rejected, kept = write_rows(self.writer, rows, self.discard, self.label)
+        with self.ready:
+            if kept:
+                merged = kept + self.rows
+                self.dropped += max(0, len(merged) - self.max_pending)
+                self.rows = merged[-self.max_pending:]
+                self.oldest = self.clock()
+            self.writing = []
+        self.written += written
+        self.rejected += rejected
+        self.batches += 1
+        return written, len(kept)
+
+    def flush(self) -> int:
+        """Write every buffered row now; returns how many were written"""
+        return self._flush()[0]
+
+    def buffered(self) -> List[Dict]:
+        """Rows not written yet, oldest first"""
+        with self.ready:
+            return self.writing + self.rows
+
+    def stats(self) -> Dict:
+        with self.ready:
+            pending = len(self.rows) + len(self.writing)
+        return {
+            'pending': pending,
+            'written': self.written,
+            'batches': self.batches,
+            'rejected': self.rejected,
+            'dropped': self.dropped
+        }
+
+    def shutdown(self):
+        self.stopping = True
+        with self.ready:
+            self.ready.notify_all()
+        self.flush()
@@ -0,0 +1,62 @@
+import sys
+import argparse
+import time
+import logging
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from vision.synthetic import COLORS, simulate
+from vision.tracking import BallTracker, max_displacement_shot
+
+def simulate_detections(frames, seed=0):
+    """Yield noisy per-frame detections and the number of strikes so far"""
+    rng = np.random.default_rng(seed + 1)
+    shots = 0
+    for positions, struck in simulate(frames, seed):
+        shots += struck
+        noise = rng.normal(0, 1.0, positions.shape)
+        yield [
+            {'color': color, 'position': (int(x), int(y)), 'radius': 12}
+            for color, (x, y) in zip(COLORS, positions + noise)
+        ], shots
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark umpire ball tracking with 16 balls')
+    parser.add_argument('--frames', type=int, default=3000,
+                      help='Frames to simulate (default: 3000)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    frames = list(simulate_detections(args.frames))
+    true_shots = frames[-1][1]
+
+    previous = []
+    legacy_shots = 0
+    start = time.perf_counter()
+    for detections, _ in frames:
+        legacy_shots += max_displacement_shot(detections, previous)
+        previous = detections
+    legacy_time = (time.perf_counter() - start) / len(frames)
+
+    tracker = BallTracker()
+    tracked_shots = 0
+    start = time.perf_counter()
+    for detections, _ in frames:
+        _, shot = tracker.update(detections)
+        tracked_shots += shot
+    tracker_time = (time.perf_counter() - start) / len(frames)
+
+    logging.info(f"{len(frames)} frames, 16 balls, {true_shots} simulated shots")
+    logging.info(f"max-displacement scan: {legacy_time * 1e6:.1f} us/frame, {legacy_shots} shots reported")
+    logging.info(f"kalman tracker:        {tracker_time * 1e6:.1f} us/frame, {tracked_shots} shots reported, "
+                 f"{tracker.next_id - 1} track ids issued")
+
+
+if __name__ == '__main__':
+    main()
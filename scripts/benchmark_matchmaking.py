@@ -0,0 +1,116 @@
+import sys
+import argparse
+import time
+import logging
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from realtime.matchmaking import MatchQueue
+from realtime.spatial import haversine
+
+GAME_TYPES = ['8ball', '9ball', 'straight']
+
+
+def simulate_arrivals(players, rate, cities, seed=0):
+    """Yield (arrival time, user id, skill, game type, lat, lng) around random city centres"""
+    rng = np.random.default_rng(seed)
+    centres = np.column_stack([rng.uniform(-50, 60, cities), rng.uniform(-120, 140, cities)])
+    times = np.cumsum(rng.exponential(1.0 / rate, players))
+    homes = rng.integers(0, cities, players)
+    # ~5 km spread around each centre
+    offsets = rng.normal(0, 0.045, (players, 2))
+    skills = np.clip(rng.normal(5.0, 2.0, players), 0.0, 10.0)
+    game_types = rng.choice(len(GAME_TYPES), players, p=[0.6, 0.3, 0.1])
+    for user_id in range(players):
+        lat, lng = centres[homes[user_id]] + offsets[user_id]
+        yield (float(times[user_id]), user_id, float(skills[user_id]), GAME_TYPES[game_types[user_id]],
+               float(lat), float(lng))
+
+
+def naive_enqueue(waiting, arrival, skill_width, radius):
+    """Linear scan over every waiting player with the strictest limits, for comparison"""
+    _, user_id, skill, game_type, lat, lng = arrival
+    for index, (_, _, other_skill, other_type, other_lat, other_lng) in enumerate(waiting):
+        if (other_type == game_type and abs(other_skill - skill) < skill_width
+                and haversine(lat, lng, other_lat, other_lng) <= radius):
+            return waiting.pop(index)
+    waiting.append(arrival)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark matchmaking on a simulated stream of players')
+    parser.add_argument('--players', type=int, default=50000,
+                      help='Players to simulate (default: 50000)')
+    parser.add_argument('--rate', type=float, default=100.0,
+                      help='Players looking for a game per second (default: 100)')
+    parser.add_argument('--cities', type=int, default=300,
+                      help='Areas players are spread over (default: 300)')
+    parser.add_argument('--naive', type=int, default=5000,
+                      help='Players to run through the linear-scan baseline (default: 5000, 0 to skip)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    arrivals = list(simulate_arrivals(args.players, args.rate, args.cities))
+    by_id = {arrival[1]: arrival for arrival in arrivals}
+
+    queue = MatchQueue(start=0.0)
+    waits, gaps, distances, enqueue_times = [], [], [], []
+    advance_time = 0.0
+    peak = 0
+    expired = 0
+    clock = 0.0
+
+    def record(waiting, new, now):
+        _, _, skill_a, _, lat_a, lng_a = by_id[waiting.user_id]
+        _, _, skill_b, _, lat_b, lng_b = by_id[new.user_id]
+        waits.extend([now - waiting.enqueued, now - new.enqueued])
+        gaps.append(abs(skill_a - skill_b))
+        distances.append(haversine(lat_a, lng_a, lat_b, lng_b))
+
+    for arrival in arrivals:
+        now, user_id, skill, game_type, lat, lng = arrival
+        # Widening runs once per simulated second, as the Matchmaker task does
+        while clock + queue.wheel.tick <= now:
+            clock += queue.wheel.tick
+            start = time.perf_counter()
+            matches, timed_out = queue.advance(clock)
+            advance_time += time.perf_counter() - start
+            expired += len(timed_out)
+            for waiting, new in matches:
+                record(waiting, new, clock)
+        start = time.perf_counter()
+        match = queue.enqueue(user_id, skill, game_type, lat, lng, now)
+        enqueue_times.append(time.perf_counter() - start)
+        if match is not None:
+            record(*match, now)
+        peak = max(peak, len(queue))
+
+    enqueue_times = np.array(enqueue_times) * 1e6
+    waits = np.array(waits)
+    logging.info(f"{args.players} players over {arrivals[-1][0]:.0f} s in {args.cities} areas, "
+                 f"peak {peak} waiting")
+    logging.info(f"enqueue: {enqueue_times.mean():.1f} us mean, {np.percentile(enqueue_times, 99):.1f} us p99; "
+                 f"widening: {advance_time / max(clock, 1) * 1e3:.2f} ms per second simulated")
+    logging.info(f"{len(gaps)} matches, {expired} timed out, {len(queue)} still waiting")
+    logging.info(f"wait: {np.median(waits):.1f} s median, {np.percentile(waits, 95):.1f} s p95; "
+                 f"skill gap {np.mean(gaps):.2f} mean; distance {np.median(distances) / 1000:.1f} km median")
+
+    if args.naive:
+        waiting = []
+        matched = 0
+        start = time.perf_counter()
+        for arrival in arrivals[:args.naive]:
+            matched += naive_enqueue(waiting, arrival, queue.skill_width, queue.radii[0]) is not None
+        naive_time = (time.perf_counter() - start) / args.naive
+        logging.info(f"linear scan, first {args.naive} players: {naive_time * 1e6:.1f} us/enqueue, "
+                     f"{matched} matches, {len(waiting)} waiting at the end")
+
+
+if __name__ == '__main__':
+    main()
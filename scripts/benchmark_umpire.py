@@ -0,0 +1,224 @@
+import sys
+import argparse
+import copy
+import json
+import time
+import logging
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from vision import detection
+from vision.pipeline import DEFAULT_COLOR_RANGES, analyze_frame
+from vision.synthetic import COLORS, SyntheticTable, match_detections
+from vision.table import TableGeometry
+from vision.tracking import BallTracker
+
+RESOLUTIONS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080)
+}
+
+# A detected shot counts if it starts within this many frames of a strike
+SHOT_WINDOW = 5
+
+
+def new_monitor(frame, locate_table=True):
+    """Monitor entry as GameMonitor keeps it, calibrated on the first frame"""
+    return {
+        'color_ranges': copy.deepcopy(DEFAULT_COLOR_RANGES),
+        'segmenter': None,
+        'tracker': BallTracker(),
+        'table': TableGeometry.detect(frame) if locate_table else None
+    }
+
+
+def score_shots(detected, struck):
+    """Match detected shot frames to strike frames within SHOT_WINDOW"""
+    matched = 0
+    remaining = list(detected)
+    for frame in struck:
+        hit = next((d for d in remaining if frame <= d <= frame + SHOT_WINDOW), None)
+        if hit is not None:
+            remaining.remove(hit)
+            matched += 1
+    return matched, len(remaining)
+
+
+def run_case(table, detector, frames, warmup, alloc_frames, locate_table):
+    monitor = None
+    # Preallocated so the harness itself does not add retained blocks
+    latencies = np.full(max(0, frames - alloc_frames), np.nan)
+    true_positives = false_positives = false_negatives = color_hits = 0
+    position_error = 0.0
+    detected_shots, struck = [], []
+    transient = []
+    retained_before = retained_after = 0
+
+    for index, (frame, truth) in enumerate(table.frames(warmup + frames)):
+        if monitor is None:
+            monitor = new_monitor(frame, locate_table)
+        measured = index - warmup
+        tracing = 0 <= measured < alloc_frames
+
+        # Allocations are traced over the first measured frames only, as
+        # tracing slows every allocation down
+        if measured == 0 and alloc_frames > 0:
+            tracemalloc.start()
+        if measured == alloc_frames:
+            tracemalloc.stop()
+            retained_before = sys.getallocatedblocks()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+
+        start = time.perf_counter()
+        balls, shot, _ = analyze_frame(monitor, frame, detector)
+        elapsed = time.perf_counter() - start
+
+        if tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            transient.append(peak - baseline)
+        if measured < 0:
+            continue
+        if not tracing:
+            latencies[measured - alloc_frames] = elapsed
+
+        pairs, distances = match_detections(balls, truth['balls'], table.radius)
+        true_positives += len(pairs)
+        false_positives += len(balls) - len(pairs)
+        false_negatives += len(truth['balls']) - len(pairs)
+        color_hits += sum(balls[d]['color'] == truth['balls'][t]['color'] for d, t in pairs)
+        position_error += float(distances.sum())
+        if shot:
+            detected_shots.append(measured)
+        if truth['shot']:
+            struck.append(measured)
+    retained_after = sys.getallocatedblocks()
+    measured_frames = max(1, frames - alloc_frames)
+
+    latencies = latencies if len(latencies) else np.array([np.nan])
+    shots_matched, false_shots = score_shots(detected_shots, struck)
+    return {
+        'fps': float(len(latencies) / latencies.sum()),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        'peak_alloc_kb': float(np.mean(transient) / 1024) if transient else 0.0,
+        'retained_blocks_per_frame': (retained_after - retained_before) / measured_frames,
+        'precision': true_positives / max(1, true_positives + false_positives),
+        'recall': true_positives / max(1, true_positives + false_negatives),
+        'color_accuracy': color_hits / max(1, true_positives),
+        'position_error_px': position_error / max(1, true_positives),
+        'shots': len(struck),
+        'shots_detected': shots_matched,
+        'false_shots': false_shots,
+        'table_located': monitor['table'] is not None
+    }
+
+
+def shot_rates(result):
+    """Fraction of strikes detected and false shots per strike"""
+    strikes = max(1, result['shots'])
+    return result['shots_detected'] / strikes, result['false_shots'] / strikes
+
+
+def regressions(results, baseline, tolerance):
+    """Describe every case that got slower or less accurate than the baseline"""
+    found = []
+    for case, result in results.items():
+        previous = baseline.get(case)
+        if previous is None:
+            continue
+        if result['fps'] < previous['fps'] * (1 - tolerance):
+            found.append(f"{case}: {result['fps']:.1f} fps, baseline {previous['fps']:.1f}")
+        for metric in ('precision', 'recall', 'color_accuracy'):
+            if result[metric] < previous[metric] - 0.01:
+                found.append(f"{case}: {metric} {result[metric]:.3f}, baseline {previous[metric]:.3f}")
+        # Shot counts depend on --frames, so compare rates per strike
+        if (shot_rates(result)[0] < shot_rates(previous)[0]
+                or shot_rates(result)[1] > shot_rates(previous)[1]):
+            found.append(f"{case}: shots {result['shots_detected']}/{result['shots']} "
+                         f"({result['false_shots']} false), baseline {previous['shots_detected']}/"
+                         f"{previous['shots']} ({previous['false_shots']} false)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the umpire pipeline on synthetic tables')
+    parser.add_argument('--frames', type=int, default=300,
+                      help='Frames to measure per case (default: 300)')
+    parser.add_argument('--warmup', type=int, default=10,
+                      help='Frames processed before measuring (default: 10)')
+    parser.add_argument('--resolutions', default='720p,1080p',
+                      help=f"Comma separated, from {', '.join(RESOLUTIONS)} (default: 720p,1080p)")
+    parser.add_argument('--detectors', default=','.join(detection.DETECTORS),
+                      help='Comma separated detector strategies (default: all)')
+    parser.add_argument('--balls', type=int, default=len(COLORS),
+                      help=f'Balls on the table, cue ball first (default: {len(COLORS)})')
+    parser.add_argument('--shot-every', type=int, default=60,
+                      help='Frames between cue strikes (default: 60)')
+    parser.add_argument('--perspective', type=float, default=0.0,
+                      help='Far-end narrowing from camera tilt, 0-0.5 (default: 0)')
+    parser.add_argument('--lighting', type=float, default=0.05,
+                      help='Exposure drift as a fraction of full scale (default: 0.05)')
+    parser.add_argument('--noise', type=float, default=4.0,
+                      help='Sensor noise standard deviation in levels (default: 4)')
+    parser.add_argument('--no-table', action='store_true',
+                      help='Process full frames instead of the located table bed')
+    parser.add_argument('--alloc-frames', type=int, default=20,
+                      help='Measured frames traced for allocations instead of timed (default: 20)')
+    parser.add_argument('--seed', type=int, default=0,
+                      help='Random seed for layouts and strikes (default: 0)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--baseline', help='Fail if results regress against this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                      help='Allowed fractional FPS drop against the baseline (default: 0.15)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    colors = [COLORS[i % len(COLORS)] for i in range(args.balls)]
+
+    results = {}
+    for resolution in args.resolutions.split(','):
+        width, height = RESOLUTIONS[resolution.strip()]
+        for detector in args.detectors.split(','):
+            detector = detector.strip()
+            table = SyntheticTable(width, height, colors, perspective=args.perspective,
+                                   lighting=args.lighting, noise=args.noise,
+                                   shot_every=args.shot_every, seed=args.seed)
+            case = f"{resolution.strip()}/{detector}"
+            result = results[case] = run_case(table, detector, args.frames, args.warmup,
+                                              args.alloc_frames, not args.no_table)
+            logging.info(
+                f"{case}: {result['fps']:.1f} fps, p50 {result['p50_ms']:.2f} ms, "
+                f"p99 {result['p99_ms']:.2f} ms, {result['peak_alloc_kb']:.0f} KiB peak/frame, "
+                f"{result['retained_blocks_per_frame']:.1f} blocks retained/frame | "
+                f"precision {result['precision']:.3f}, recall {result['recall']:.3f}, "
+                f"color {result['color_accuracy']:.3f}, error {result['position_error_px']:.2f} px, "
+                f"shots {result['shots_detected']}/{result['shots']} ({result['false_shots']} false)"
+                + ('' if result['table_located'] or args.no_table else ' [table not located]')
+            )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        logging.info(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for message in found:
+            logging.error(f"Regression: {message}")
+        if found:
+            sys.exit(1)
+        logging.info("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import sys
+import argparse
+import time
+import logging
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add the project root to Python path
+project_root = Path(__file__).parent.parent
+sys.path.append(str(project_root))
+
+from vision.segmentation import ColorSegmenter, segment_per_color
+
+COLOR_RANGES = {
+    'white': {'lower': np.array([0, 0, 200]), 'upper': np.array([180, 30, 255])},
+    'red': {'lower': np.array([0, 100, 100]), 'upper': np.array([10, 255, 255])},
+    'yellow': {'lower': np.array([20, 100, 100]), 'upper': np.array([30, 255, 255])},
+    'green': {'lower': np.array([50, 100, 100]), 'upper': np.array([70, 255, 255])}
+}
+
+BALL_COLORS_BGR = {
+    'white': (245, 245, 245),
+    'red': (30, 30, 220),
+    'yellow': (30, 220, 230),
+    'green': (40, 200, 40)
+}
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080)
+}
+
+
+def render_table(width, height, balls_per_color, seed=0):
+    """Draw a blue felt with non-overlapping coloured balls"""
+    rng = np.random.default_rng(seed)
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:] = (140, 70, 20)
+    noise = rng.integers(-8, 8, frame.shape, dtype=np.int16)
+    frame = np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    radius = 20
+    placed = []
+    for color, bgr in BALL_COLORS_BGR.items():
+        for _ in range(balls_per_color):
+            while True:
+                x = int(rng.integers(radius * 2, width - radius * 2))
+                y = int(rng.integers(radius * 2, height - radius * 2))
+                if all((x - px) ** 2 + (y - py) ** 2 > (4 * radius) ** 2 for px, py in placed):
+                    break
+            placed.append((x, y))
+            cv2.circle(frame, (x, y), radius, bgr, -1)
+    return frame
+
+
+def time_it(func, iterations):
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    elapsed = (time.perf_counter() - start) / iterations
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark umpire ball segmentation')
+    parser.add_argument('--iterations', type=int, default=50,
+                      help='Frames to time per resolution (default: 50)')
+    parser.add_argument('--balls-per-color', type=int, default=3,
+                      help='Balls drawn per calibrated color (default: 3)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    segmenter = ColorSegmenter(COLOR_RANGES)
+
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = render_table(width, height, args.balls_per_color)
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+        legacy_time, legacy_balls = time_it(lambda: segment_per_color(hsv, COLOR_RANGES), args.iterations)
+        single_time, single_balls = time_it(lambda: segmenter.detect(hsv), args.iterations)
+
+        logging.info(f"{name}: per-color {legacy_time * 1000:.2f} ms ({len(legacy_balls)} balls), "
+                     f"single-pass {single_time * 1000:.2f} ms ({len(single_balls)} balls), "
+                     f"speedup x{legacy_time / single_time:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,9 @@
 let socket;
 let currentRoom = null;
 let activeChallenge = null;
+let heartbeatTimer = null;
+
+const HEARTBEAT_INTERVAL_MS = 30000;
 
 // Initialize socket connection and event handlers
 function initMultiplayer() {
@@ -9,47 +12,63 @@ function initMultiplayer() {
   socket.on('connect', () => {
     console.log('Connected to server');
     joinNearbyChat();
+    sendHeartbeat();
+    clearInterval(heartbeatTimer);
+    heartbeatTimer = setInterval(sendHeartbeat, HEARTBEAT_INTERVAL_MS);
   });
 
-  socket.on('user_joined', (data) => {
+  onPayload(socket, 'user_joined', (data) => {
     addChatMessage(`${data.user} joined the area`, 'system');
   });
 
-  socket.on('new_message', (data) => {
+  onPayload(socket, 'new_message', (data) => {
     addChatMessage(`${data.user}: ${data.message}`);
   });
 
-  socket.on('challenge_received', (data) => {
+  onPayload(socket, 'challenge_received', (data) => {
     if (data.challenger_id !== currentPlayerId) {
       showChallengeNotification(data);
     }
   });
 
-  socket.on('challenge_started', (data) => {
+  onPayload(socket, 'challenge_started', (data) => {
     activeChallenge = {
       id: data.challenge_id,
       startTime: new Date(data.start_time),
       duration: data.duration,
       players: data.players,
+      seq: 0,
     };
     showChallengeStarted(data);
     startChallengeTimer();
   });
 
-  socket.on('challenge_declined', (data) => {
+  onPayload(socket, 'match_not_found', () => {
+    showError('No opponent found nearby, try again later');
+  });
+
+  onPayload(socket, 'challenge_expired', (data) => {
+    clearChallengeNotification(data.challenge_id);
+    if (activeChallenge && activeChallenge.id === data.challenge_id) {
+      activeChallenge = null;
+    }
+    addChatMessage('A challenge expired before it was accepted', 'system');
+  });
+
+  onPayload(socket, 'challenge_declined', (data) => {
     if (activeChallenge && activeChallenge.id === data.challenge_id) {
       activeChallenge = null;
       showError(`${data.decliner} declined your challenge`);
     }
   });
 
-  socket.on('score_updated', (data) => {
+  onPayload(socket, 'scores_updated', (data) => {
     if (activeChallenge && activeChallenge.id === data.challenge_id) {
-      updateChallengeScore(data);
+      applyScoreUpdate(data);
     }
   });
 
-  socket.on('challenge_ended', (data) => {
+  onPayload(socket, 'challenge_ended', (data) => {
     if (activeChallenge && activeChallenge.id === data.challenge_id) {
       showChallengeResults(data);
       activeChallenge = null;
@@ -92,27 +111,51 @@ function joinNearbyChat() {
   if (!playerMarker) return;
 
   const pos = playerMarker.getPosition();
-  fetch('/multiplayer/api/join-chat', {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-    },
-    body: JSON.stringify({
-      lat: pos.lat(),
-      lng: pos.lng(),
-    }),
-  })
-    .then((response) => response.json())
-    .then((data) => {
-      if (data.status === 'success') {
-        currentRoom = data.room;
-        addChatMessage('Joined local chat', 'system');
-      }
-    })
-    .catch((error) => {
-      console.error('Error joining chat:', error);
+  socket.emit('join_chat', { lat: pos.lat(), lng: pos.lng() }, (response) => {
+    if (!response || !response.success) {
+      console.error('Error joining chat:', response ? response.error : 'no response');
       showError('Failed to join local chat');
-    });
+      return;
+    }
+    currentRoom = response.room;
+    (response.history ? response.history.messages : [])
+      .slice()
+      .reverse()
+      .forEach((message) => addChatMessage(`${message.user}: ${message.message}`));
+    addChatMessage('Joined local chat', 'system');
+  });
+}
+
+// Keep this player's presence fresh; the server marks silent players offline
+function sendHeartbeat() {
+  const heartbeat = { status: activeChallenge ? 'in_game' : 'online' };
+  if (playerMarker) {
+    const pos = playerMarker.getPosition();
+    heartbeat.lat = pos.lat();
+    heartbeat.lng = pos.lng();
+  }
+  socket.emit('heartbeat', heartbeat);
+}
+
+// Ask the server to pair this player with a nearby opponent of similar skill
+function findMatch(gameType = '8ball') {
+  const request = { game_type: gameType };
+  if (playerMarker) {
+    const pos = playerMarker.getPosition();
+    request.lat = pos.lat();
+    request.lng = pos.lng();
+  }
+  socket.emit('find_match', request, (response) => {
+    if (!response || !response.success) {
+      showError(`Failed to find a match: ${response ? response.error : 'no response'}`);
+    } else if (!response.matched) {
+      addChatMessage('Looking for an opponent...', 'system');
+    }
+  });
+}
+
+function cancelMatch() {
+  socket.emit('cancel_match');
 }
 
 // Send chat message
@@ -194,6 +237,7 @@ function showChallengeNotification(data) {
   const notification = document.createElement('div');
   notification.className =
     'alert alert-info alert-dismissible fade show position-fixed top-50 start-50 translate-middle';
+  notification.dataset.challengeId = data.challenge_id;
   notification.innerHTML = `
         ${data.challenger} challenged you to a ${data.duration / 60} minute coin collection competition!
         <div class="mt-2">
@@ -205,6 +249,13 @@ function showChallengeNotification(data) {
   document.body.appendChild(notification);
 }
 
+// Remove a pending challenge's notification
+function clearChallengeNotification(challengeId) {
+  document
+    .querySelectorAll(`[data-challenge-id="${challengeId}"]`)
+    .forEach((notification) => notification.remove());
+}
+
 // Respond to challenge
 function respondToChallenge(challengeId, accept) {
   fetch('/multiplayer/api/respond-to-challenge', {
@@ -261,13 +312,46 @@ function showChallengeStarted(data) {
 }
 
 // Update challenge score
-function updateChallengeScore(data) {
-  const scoreElement = document.getElementById(`score-${data.player_id}`);
+function updateChallengeScore(playerId, score) {
+  const scoreElement = document.getElementById(`score-${playerId}`);
   if (scoreElement) {
-    scoreElement.textContent = data.new_score;
+    scoreElement.textContent = score;
+  }
+}
+
+// Apply a coalesced score broadcast; a gap in seq means one was missed
+function applyScoreUpdate(data) {
+  if (data.seq <= activeChallenge.seq) return;
+  const missed = data.seq > activeChallenge.seq + 1;
+  activeChallenge.seq = data.seq;
+  Object.entries(data.scores).forEach(([playerId, score]) => updateChallengeScore(playerId, score));
+  if (missed) {
+    resyncChallenge(activeChallenge.id);
   }
 }
 
+// Fetch the full scores after missing an update
+function resyncChallenge(challengeId) {
+  fetch(`/multiplayer/api/challenge/${challengeId}`)
+    .then((response) => response.json())
+    .then((data) => {
+      if (data.status === 'success' && activeChallenge && activeChallenge.id === challengeId) {
+        if (data.challenge.seq < activeChallenge.seq) return;
+        activeChallenge.seq = data.challenge.seq;
+        Object.entries(data.challenge.scores).forEach(([playerId, score]) =>
+          updateChallengeScore(playerId, score)
+        );
+      }
+    })
+    .catch((error) => console.error('Error resyncing challenge:', error));
+}
+
+// Report points scored in the active challenge
+function sendScoreIncrement(increment) {
+  if (!activeChallenge) return;
+  socket.emit('challenge_score', { challenge_id: activeChallenge.id, score_increment: increment });
+}
+
 // Start challenge timer
 function startChallengeTimer() {
   const timerElement = document.getElementById('challenge-timer');
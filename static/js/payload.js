@@ -0,0 +1,17 @@
+// Server events arrive pre-serialized: JSON text, or msgpack bytes when the
+// server emits msgpack (decoded with @msgpack/msgpack, loaded by the pages
+// that include this file)
+function decodePayload(data) {
+  if (typeof data === 'string') {
+    return JSON.parse(data);
+  }
+  if (data instanceof ArrayBuffer && window.MessagePack) {
+    return window.MessagePack.decode(new Uint8Array(data));
+  }
+  return data;
+}
+
+// Register a handler that receives the decoded payload
+function onPayload(socket, event, handler) {
+  socket.on(event, (data) => handler(decodePayload(data)));
+}
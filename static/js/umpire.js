@@ -33,6 +33,9 @@ function initUmpireSystem() {
   document
     .getElementById('stop-monitoring')
     ?.addEventListener('click', stopMonitoring);
+  document
+    .getElementById('calibrate-table')
+    ?.addEventListener('click', requestCalibration);
 
   // Initialize status indicators
   updateStatusIndicators();
@@ -57,9 +60,9 @@ function initializeSocket() {
   socket.on('reconnect_failed', handleReconnectFailed);
 
   // Game event handlers
-  socket.on('shot_detected', handleShotDetection);
-  socket.on('monitoring_status', updateMonitoringStatus);
-  socket.on('calibration_complete', handleCalibrationComplete);
+  onPayload(socket, 'shot_detected', handleShotDetection);
+  onPayload(socket, 'monitoring_status', updateMonitoringStatus);
+  onPayload(socket, 'calibration_complete', handleCalibrationComplete);
 }
 
 // Socket event handlers
@@ -112,6 +115,8 @@ function startMonitoring() {
     return;
 
   umpireState.isMonitoring = true;
+  // The server calibrates on the first frame of every game
+  umpireState.isCalibrated = false;
   updateStatusIndicators();
 
   // Emit start monitoring event to server
@@ -138,6 +143,20 @@ function stopMonitoring() {
   socket.emit('stop_monitoring');
 }
 
+// Locate the table and recalibrate colors on the next frame
+function requestCalibration() {
+  if (umpireState.connectionStatus !== 'connected') return;
+
+  socket.emit('calibrate', null, (response) => {
+    if (!response.success) {
+      showError(response.error || 'Failed to request calibration');
+      return;
+    }
+    umpireState.isCalibrated = false;
+    updateStatusIndicators();
+  });
+}
+
 // Clean up resources
 function cleanup() {
   if (frameProcessingId) {
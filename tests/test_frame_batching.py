@@ -0,0 +1,35 @@
+from vision.batching import FrameBatcher, run_frame_batch
+from vision.executor import ProcessPoolFrameExecutor
+
+
+def queued_executor(workers):
+    """A process executor whose tasks stay queued: no worker is started"""
+    executor = ProcessPoolFrameExecutor(workers=workers, queue_size=1024)
+    executor.started = True
+    return executor
+
+
+def test_venue_batches_reach_every_worker():
+    for workers in (2, 3, 4, 8):
+        executor = queued_executor(workers)
+        batcher = FrameBatcher(executor, max_batch=2, spawn=lambda run: None)
+        for venue_id in (1, 2, 3):
+            for user_id in range(64):
+                for _ in range(2):
+                    batcher.submit(venue_id, user_id, max, (venue_id, user_id), lambda result: None)
+
+        for slot in executor.slots:
+            venues = {tasks[0][1][0] for func, (tasks,), _ in slot.pending if func is run_frame_batch}
+            assert venues == {1, 2, 3}, f"worker {slot.index} of {workers} got venues {venues}"
+
+
+def test_batches_follow_the_users_worker():
+    executor = queued_executor(4)
+    batcher = FrameBatcher(executor, max_batch=1, spawn=lambda run: None)
+    for user_id in range(32):
+        batcher.submit(7, user_id, max, (7, user_id), lambda result: None)
+
+    for slot in executor.slots:
+        for _, (tasks,), _ in slot.pending:
+            for _, (_, user_id) in tasks:
+                assert executor.slot_index(user_id) == slot.index
@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from ranking.leaderboard import write_leaderboards
+
+
+def venue_row(points, wins, losses, current_streak, highest_streak):
+    return {'venue_id': 1, 'user_id': 2, 'points': points, 'wins': wins, 'losses': losses,
+            'current_streak': current_streak, 'highest_streak': highest_streak, 'last_played': None}
+
+
+def test_increments_add_up_on_one_row():
+    engine = create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE venue_leaderboards (id INTEGER PRIMARY KEY, venue_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL, points INTEGER, wins INTEGER, losses INTEGER, current_streak INTEGER, "
+            "highest_streak INTEGER, last_played DATETIME, created_at DATETIME, updated_at DATETIME, "
+            "UNIQUE (venue_id, user_id))"
+        ))
+    session = Session(engine)
+    write_leaderboards(session, [venue_row(3, 1, 0, 1, 4)], [])
+    write_leaderboards(session, [venue_row(2, 1, 1, 0, 2)], [])
+    rows = session.execute(text(
+        "SELECT points, wins, losses, current_streak, highest_streak FROM venue_leaderboards"
+    )).fetchall()
+    assert [tuple(row) for row in rows] == [(5, 2, 1, 0, 4)]
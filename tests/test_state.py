@@ -0,0 +1,23 @@
+import fakeredis
+
+from realtime.state import USER_TTL_SECONDS, RedisStateBackend
+
+
+def backend():
+    server = fakeredis.FakeServer()
+    return RedisStateBackend({name: fakeredis.FakeRedis(server=server, decode_responses=True)
+                              for name in ('a', 'b')})
+
+
+def test_user_records_expire():
+    state = backend()
+    state.set_user(7, {'room': 'area_abc'})
+    key = state._user_key(7)
+    assert 0 < state._client(key).ttl(key) <= USER_TTL_SECONDS
+
+
+def test_removed_users_are_gone():
+    state = backend()
+    state.set_user(7, {'room': 'area_abc'})
+    state.remove_user(7)
+    assert state.get_user(7) is None
@@ -0,0 +1,47 @@
+from realtime.chat import ChatLog
+from realtime.write_behind import WriteBehindBuffer, write_rows
+
+
+class Rejected(Exception):
+    pass
+
+
+def store(rejected=(), down_from=None):
+    rows_written = []
+
+    def writer(rows):
+        if len(rows) > 1 and any(row['id'] in rejected or row['id'] == down_from for row in rows):
+            raise RuntimeError('batch failed')
+        for row in rows:
+            if row['id'] in rejected:
+                raise Rejected(row['id'])
+            if down_from is not None and row['id'] >= down_from:
+                raise RuntimeError('store down')
+        rows_written.extend(rows)
+
+    return writer, rows_written
+
+
+def test_bad_row_is_discarded_alone():
+    writer, rows_written = store(rejected={2})
+    rows = [{'id': i} for i in range(5)]
+    assert write_rows(writer, rows, (Rejected,)) == (4, 1, [])
+    assert [row['id'] for row in rows_written] == [0, 1, 3, 4]
+
+
+def test_rows_after_outage_are_kept():
+    writer, rows_written = store(down_from=3)
+    buffer = WriteBehindBuffer(writer, discard=(Rejected,), spawn=lambda task: None)
+    for i in range(5):
+        buffer.add({'id': i})
+    assert buffer.flush() == 3
+    assert [row['id'] for row in buffer.buffered()] == [3, 4]
+    assert buffer.stats()['pending'] == 2
+
+
+def test_chat_history_includes_buffered_messages():
+    writer, _ = store()
+    chat = ChatLog(writer, spawn=lambda task: None)
+    for i in range(4):
+        chat.add({'id': i, 'room_id': i % 2})
+    assert [message['id'] for message in chat.pending_for([1], 10)] == [3, 1]
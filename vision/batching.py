@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from vision.executor import POLL_INTERVAL, _spawn_thread
+
+logger = logging.getLogger(__name__)
+
+
+def run_frame_batch(tasks: List[Tuple[Callable, tuple]]) -> List[Any]:
+    """Run (func, args) frame tasks back to back; a failure only affects its own frame"""
+    results = []
+    for func, args in tasks:
+        try:
+            results.append(func(*args))
+        except Exception as e:
+            logger.error(f"Batched frame task failed: {str(e)}")
+            results.append({'status': 'error', 'message': str(e)})
+    return results
+
+
+class FrameBatcher:
+    """Groups frame tasks that arrive close together into one executor task
+
+    Tasks are collected per group (a venue) and per executor worker their
+    key (a user id) maps to, until ``window`` seconds after the batch's
+    first pending task or until ``max_batch`` tasks are waiting, and then
+    submitted straight to that worker as a single run_frame_batch task. A
+    venue with many tables thus costs one queue slot, one pipe round trip
+    and one dispatcher wake-up per worker and window instead of one per
+    frame, spreads over every worker, and each user's monitor stays where
+    their unbatched tasks run. Each task's callback gets its own result; if
+    the batch is dropped under load every callback gets None.
+    """
+
+    def __init__(self, executor, window: float = 0.015, max_batch: int = 16,
+                 spawn: Callable = _spawn_thread, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.spawn = spawn
+        self.sleep = sleep
+        self.clock = clock
+        self.pending: Dict[Tuple, Tuple[float, List]] = {}  # (group, worker) -> (deadline, [(task, callback)])
+        self.ready = threading.Condition()
+        self.started = False
+        self.stopping = False
+        self.batches = 0
+        self.frames = 0
+
+    def submit(self, group, key, func: Callable, args: tuple, callback: Callable[[Any], None]):
+        batch = (group, self.executor.slot_index(key))
+        full = None
+        with self.ready:
+            if not self.started:
+                self.started = True
+                self.spawn(self._run)
+            _, tasks = self.pending.setdefault(batch, (self.clock() + self.window, []))
+            tasks.append(((func, args), callback))
+            if len(tasks) >= self.max_batch:
+                full = self.pending.pop(batch)[1]
+            else:
+                self.ready.notify()
+        if full is not None:
+            self._submit(batch, full)
+
+    def _run(self):
+        """Flush batches whose window has elapsed"""
+        while not self.stopping:
+            with self.ready:
+                while not self.pending and not self.stopping:
+                    self.ready.wait(POLL_INTERVAL)
+                if self.stopping:
+                    break
+                delay = min(deadline for deadline, _ in self.pending.values()) - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            with self.ready:
+                now = self.clock()
+                due = [batch for batch, (deadline, _) in self.pending.items() if deadline <= now]
+                batches = [(batch, self.pending.pop(batch)[1]) for batch in due]
+            for batch, tasks in batches:
+                self._submit(batch, tasks)
+
+    def _submit(self, batch: Tuple, tasks: List):
+        callbacks = [callback for _, callback in tasks]
+
+        def deliver(results):
+            if not isinstance(results, list):
+                # Dropped (None) or failed as a whole (error payload)
+                results = [results] * len(callbacks)
+            for callback, result in zip(callbacks, results):
+                try:
+                    callback(result)
+                except Exception as e:
+                    logger.error(f"Frame result callback failed: {str(e)}")
+
+        self.batches += 1
+        self.frames += len(tasks)
+        self.executor.submit(batch, run_frame_batch, ([task for task, _ in tasks],), deliver, slot=batch[1])
+
+    def stats(self) -> Dict:
+        with self.ready:
+            waiting = sum(len(tasks) for _, tasks in self.pending.values())
+        return {
+            'batches': self.batches,
+            'frames': self.frames,
+            'mean_batch_size': round(self.frames / self.batches, 2) if self.batches else 0.0,
+            'waiting': waiting
+        }
+
+    def shutdown(self):
+        self.stopping = True
+        with self.ready:
+            self.ready.notify_all()
@@ -0,0 +1,146 @@
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Channel extents in OpenCV's 8-bit HSV
+HUE_BINS = 180
+SATURATION_BINS = 256
+
+# Samples are drawn from this fraction of a ball's radius, clear of the felt
+SAMPLE_RADIUS = 0.6
+
+
+def _disk_offsets(count: int, seed: int = 0) -> np.ndarray:
+    """Fixed pseudo-random points spread uniformly over the unit disk"""
+    rng = np.random.default_rng(seed)
+    radius = np.sqrt(rng.uniform(0, 1, count))
+    angle = rng.uniform(0, 2 * np.pi, count)
+    return np.stack([radius * np.cos(angle), radius * np.sin(angle)], axis=1)
+
+
+class ColorCalibrator:
+    """Continuous HSV range calibration from sparse samples of detected balls
+
+    Every frame, ``samples_per_ball`` pixels are read from inside each
+    detected ball and binned into per-color hue and saturation counts.
+    Every ``update_every`` frames those counts are folded into exponentially
+    weighted histograms (weight ``decay`` for the new batch), and each
+    color's hue and saturation windows are re-centred on the histogram
+    medians, keeping their widths and moving at most ``max_step`` levels per
+    update; offsets within ``deadband`` are ignored so windows do not
+    flicker between neighbouring levels. Full-width windows (e.g. the cue
+    ball's hue) never move, and value bounds are left as calibrated.
+
+    ``observe`` returns a fresh color_ranges dict when any window moved, so
+    callers swap the reference instead of mutating ranges in use.
+    """
+
+    def __init__(self, color_ranges: Dict[str, Dict[str, np.ndarray]], decay: float = 0.2,
+                 samples_per_ball: int = 24, update_every: int = 30, min_samples: int = 200,
+                 max_step: int = 3, deadband: int = 1, seed: int = 0):
+        self.color_ranges = color_ranges
+        self.colors: List[str] = list(color_ranges.keys())
+        self.index = {color: i for i, color in enumerate(self.colors)}
+        self.decay = decay
+        self.update_every = update_every
+        self.min_samples = min_samples
+        self.max_step = max_step
+        self.deadband = deadband
+        self.offsets = _disk_offsets(samples_per_ball, seed) * SAMPLE_RADIUS
+
+        colors = len(self.colors)
+        self.hue = np.zeros((colors, HUE_BINS), np.float32)
+        self.saturation = np.zeros((colors, SATURATION_BINS), np.float32)
+        self.pending_hue = np.zeros((colors, HUE_BINS), np.int64)
+        self.pending_saturation = np.zeros((colors, SATURATION_BINS), np.int64)
+        self.frames = 0
+        self.updates = 0
+
+    @property
+    def nbytes(self) -> int:
+        return (self.hue.nbytes + self.saturation.nbytes
+                + self.pending_hue.nbytes + self.pending_saturation.nbytes)
+
+    def sample(self, hsv: np.ndarray, balls: List[Dict]):
+        """Accumulate hue/saturation samples from inside the given balls"""
+        known = [ball for ball in balls if ball['color'] in self.index]
+        if not known:
+            return
+        height, width = hsv.shape[:2]
+        centres = np.array([ball['position'] for ball in known], np.float32)
+        radii = np.array([ball['radius'] for ball in known], np.float32)
+        codes = np.array([self.index[ball['color']] for ball in known], np.int64)
+
+        points = centres[:, None, :] + self.offsets[None, :, :] * radii[:, None, None]
+        xs = np.clip(points[..., 0].astype(np.int64), 0, width - 1).ravel()
+        ys = np.clip(points[..., 1].astype(np.int64), 0, height - 1).ravel()
+        pixels = hsv[ys, xs]
+        owners = np.repeat(codes, len(self.offsets))
+
+        colors = len(self.colors)
+        self.pending_hue += np.bincount(
+            owners * HUE_BINS + np.minimum(pixels[:, 0], HUE_BINS - 1),
+            minlength=colors * HUE_BINS
+        ).reshape(colors, HUE_BINS)
+        self.pending_saturation += np.bincount(
+            owners * SATURATION_BINS + pixels[:, 1], minlength=colors * SATURATION_BINS
+        ).reshape(colors, SATURATION_BINS)
+
+    def observe(self, hsv: np.ndarray, balls: List[Dict]) -> Optional[Dict[str, Dict[str, np.ndarray]]]:
+        """Sample one frame; returns new color ranges when an update moved them"""
+        self.sample(hsv, balls)
+        self.frames += 1
+        if self.frames % self.update_every:
+            return None
+        return self.update()
+
+    def update(self) -> Optional[Dict[str, Dict[str, np.ndarray]]]:
+        """Fold pending samples into the histograms and re-centre the ranges"""
+        counts = self.pending_hue.sum(axis=1)
+        ready = counts >= self.min_samples
+        if ready.any():
+            for histogram, pending in ((self.hue, self.pending_hue),
+                                       (self.saturation, self.pending_saturation)):
+                batch = pending[ready] / counts[ready, None]
+                # The first batch seeds a color's histogram outright
+                fresh = histogram[ready].sum(axis=1, keepdims=True) == 0
+                weight = np.where(fresh, 1.0, self.decay)
+                histogram[ready] = (1 - weight) * histogram[ready] + weight * batch
+        self.pending_hue[ready] = 0
+        self.pending_saturation[ready] = 0
+        if not ready.any():
+            return None
+
+        ranges = None
+        for code in np.flatnonzero(ready).tolist():
+            color = self.colors[code]
+            lower = np.array(self.color_ranges[color]['lower'])
+            upper = np.array(self.color_ranges[color]['upper'])
+            moved = False
+            for channel, histogram, limit in ((0, self.hue, HUE_BINS - 1),
+                                              (1, self.saturation, SATURATION_BINS - 1)):
+                span = int(upper[channel] - lower[channel])
+                if span >= limit:
+                    continue
+                cumulative = np.cumsum(histogram[code])
+                median = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+                centre = (int(lower[channel]) + int(upper[channel])) // 2
+                if abs(median - centre) <= self.deadband:
+                    continue
+                step = int(np.clip(median - centre, -self.max_step, self.max_step))
+                new_lower = int(np.clip(lower[channel] + step, 0, limit - span))
+                if new_lower != lower[channel]:
+                    lower[channel], upper[channel] = new_lower, new_lower + span
+                    moved = True
+            if moved:
+                if ranges is None:
+                    ranges = {name: dict(bounds) for name, bounds in self.color_ranges.items()}
+                ranges[color] = {'lower': lower, 'upper': upper}
+
+        if ranges is not None:
+            self.color_ranges = ranges
+            self.updates += 1
+        return ranges
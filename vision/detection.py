@@ -0,0 +1,110 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from vision.segmentation import ColorSegmenter
+
+logger = logging.getLogger(__name__)
+
+# Ball detector strategies
+DETECTOR_COLOR = 'color'  # HSV segmentation only; circles are the color blobs
+DETECTOR_HOUGH = 'hough'  # HoughCircles over the whole surface; colors sampled from labels
+DETECTOR_FUSED = 'fused'  # HSV segmentation, HoughCircles only around color candidates
+DETECTORS = (DETECTOR_COLOR, DETECTOR_HOUGH, DETECTOR_FUSED)
+
+HOUGH_PARAMS = {
+    'dp': 1,
+    'minDist': 20,
+    'param1': 50,
+    'param2': 30,
+    'minRadius': 10,
+    'maxRadius': 30
+}
+
+# Margin around a color candidate so a whole circle and its edges fit in the ROI
+ROI_PADDING = HOUGH_PARAMS['maxRadius'] + 5
+
+
+def hough_circles(gray: np.ndarray) -> np.ndarray:
+    """Blur a grayscale image and run HoughCircles; returns an (n, 3) float array"""
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    circles = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, **HOUGH_PARAMS)
+    if circles is None:
+        return np.zeros((0, 3), np.float32)
+    return circles[0]
+
+
+def hough_in_regions(surface: np.ndarray, regions: List[Tuple[int, int, int, int]]) -> np.ndarray:
+    """Run HoughCircles only inside padded candidate rectangles of a BGR surface
+
+    Only the padded rectangles are converted to grayscale. Circles found
+    twice where regions overlap are merged using the same minimum distance
+    HoughCircles applies within one image.
+    """
+    height, width = surface.shape[:2]
+    found = []
+    for x, y, w, h in regions:
+        x0, y0 = max(0, x - ROI_PADDING), max(0, y - ROI_PADDING)
+        x1, y1 = min(width, x + w + ROI_PADDING), min(height, y + h + ROI_PADDING)
+        circles = hough_circles(cv2.cvtColor(surface[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY))
+        if len(circles):
+            circles[:, 0] += x0
+            circles[:, 1] += y0
+            found.append(circles)
+    if not found:
+        return np.zeros((0, 3), np.float32)
+
+    circles = np.concatenate(found)
+    keep = []
+    for circle in circles:
+        if all(np.hypot(*(circle[:2] - kept[:2])) >= HOUGH_PARAMS['minDist'] for kept in keep):
+            keep.append(circle)
+    return np.array(keep, np.float32)
+
+
+def circles_from_balls(balls: List[Dict]) -> np.ndarray:
+    """Circle array for balls found by color segmentation"""
+    return np.array([(b['position'][0], b['position'][1], b['radius']) for b in balls],
+                    np.float32).reshape(-1, 3)
+
+
+def circle_payload(circles: np.ndarray) -> List[Dict]:
+    """Integer circle dicts as emitted in cv_result"""
+    circles = np.uint16(np.around(circles))
+    return [{'x': int(x), 'y': int(y), 'radius': int(r)} for x, y, r in circles]
+
+
+def detect(surface: np.ndarray, hsv: np.ndarray, segmenter: ColorSegmenter, strategy: str,
+           with_circles: bool = False) -> Tuple[List[Dict], Optional[np.ndarray]]:
+    """Detect balls (and optionally circles) on one decoded surface
+
+    All strategies share the caller's decoded surface and HSV conversion;
+    grayscale is only computed where a Hough pass needs it.
+    Returns the ball list and an (n, 3) circle array, or None for the
+    circles when ``with_circles`` is False.
+    """
+    if strategy == DETECTOR_HOUGH:
+        circles = hough_circles(cv2.cvtColor(surface, cv2.COLOR_BGR2GRAY))
+        labels = segmenter.label(hsv)
+        balls = []
+        for x, y, r in circles:
+            ix, iy = int(x), int(y)
+            if 0 <= iy < labels.shape[0] and 0 <= ix < labels.shape[1]:
+                balls.append({
+                    'color': segmenter.color_at(labels, ix, iy) or 'unknown',
+                    'position': (ix, iy),
+                    'radius': int(r)
+                })
+        return balls, circles if with_circles else None
+
+    regions = [] if strategy == DETECTOR_FUSED and with_circles else None
+    balls = segmenter.detect(hsv, regions)
+    if not with_circles:
+        return balls, None
+    if regions is None:
+        return balls, circles_from_balls(balls)
+    if not regions:
+        return balls, np.zeros((0, 3), np.float32)
+    return balls, hough_in_regions(surface, regions)
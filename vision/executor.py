@@ -0,0 +1,218 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long dispatchers block on a pipe before re-checking for shutdown
+POLL_INTERVAL = 0.05
+
+
+def _spawn_thread(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def _worker_main(conn):
+    """Worker process loop: run (func, args) tasks until a None sentinel arrives"""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args = task
+        try:
+            result = func(*args)
+        except Exception as e:
+            logger.error(f"Frame worker task failed: {str(e)}")
+            result = {'status': 'error', 'message': str(e)}
+        conn.send(result)
+    conn.close()
+
+
+class InlineFrameExecutor:
+    """Runs frame tasks synchronously on the calling thread
+
+    A task that raises is reported to its callback as an error result, as
+    the worker processes do, so the callback always runs; a failing
+    callback is logged, not raised to the submitter.
+    """
+
+    def slot_index(self, key) -> int:
+        return 0
+
+    def submit(self, key, func: Callable, args: tuple, callback: Callable[[Any], None],
+               slot: Optional[int] = None) -> bool:
+        try:
+            result = func(*args)
+        except Exception as e:
+            logger.error(f"Frame task failed: {str(e)}")
+            result = {'status': 'error', 'message': str(e)}
+        try:
+            callback(result)
+        except Exception as e:
+            logger.error(f"Frame result callback failed: {str(e)}")
+        return True
+
+    def stats(self) -> Dict:
+        return {'backend': 'inline'}
+
+    def shutdown(self):
+        pass
+
+
+class _WorkerSlot:
+    """One worker process, its pipe and its bounded backlog"""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.pending = deque(maxlen=queue_size)
+        self.ready = threading.Condition()
+        self.process = None
+        self.conn = None
+        self.processed = 0
+        self.dropped = 0
+
+
+class ProcessPoolFrameExecutor:
+    """Runs frame tasks on a pool of single-threaded worker processes
+
+    Every key (a user id) is pinned to one worker so per-user state such as
+    a GameMonitor entry stays in a single process. Each worker has a bounded
+    backlog; when it is full the oldest task is dropped and its callback gets
+    None. Results are delivered to callbacks from dispatcher tasks created
+    with ``spawn``, so they can emit through socketio without blocking the
+    request that submitted the frame.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 4,
+                 spawn: Callable = _spawn_thread, start_method: Optional[str] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.spawn = spawn
+        self.context = multiprocessing.get_context(start_method)
+        self.slots = [_WorkerSlot(i, queue_size) for i in range(self.workers)]
+        self.lock = threading.Lock()
+        self.started = False
+        self.stopping = False
+
+    def _start(self):
+        with self.lock:
+            if self.started:
+                return
+            for slot in self.slots:
+                parent_conn, child_conn = self.context.Pipe()
+                slot.conn = parent_conn
+                slot.process = self.context.Process(
+                    target=_worker_main, args=(child_conn,), daemon=True,
+                    name=f"frame-worker-{slot.index}"
+                )
+                slot.process.start()
+                child_conn.close()
+                self.spawn(self._dispatch, slot)
+            self.started = True
+            logger.info(f"Started {self.workers} frame worker processes")
+
+    def slot_index(self, key) -> int:
+        """Stable key -> worker index mapping (independent of PYTHONHASHSEED)"""
+        return zlib.crc32(str(key).encode()) % self.workers
+
+    def slot_for(self, key) -> _WorkerSlot:
+        return self.slots[self.slot_index(key)]
+
+    def submit(self, key, func: Callable, args: tuple, callback: Callable[[Any], None],
+               slot: Optional[int] = None) -> bool:
+        """Queue a task on the key's worker, or on worker ``slot`` if given
+
+        Returns False if an older task had to be dropped.
+        """
+        if not self.started:
+            self._start()
+
+        slot = self.slots[slot] if slot is not None else self.slot_for(key)
+        dropped = None
+        with slot.ready:
+            if len(slot.pending) == slot.pending.maxlen:
+                dropped = slot.pending.popleft()
+                slot.dropped += 1
+            slot.pending.append((func, args, callback))
+            slot.ready.notify()
+
+        if dropped is not None:
+            dropped[2](None)
+        return dropped is None
+
+    def _dispatch(self, slot: _WorkerSlot):
+        """Feed one worker a task at a time and deliver its results"""
+        while not self.stopping:
+            with slot.ready:
+                while not slot.pending and not self.stopping:
+                    slot.ready.wait(POLL_INTERVAL)
+                if self.stopping:
+                    break
+                func, args, callback = slot.pending.popleft()
+
+            try:
+                slot.conn.send((func, args))
+                while not slot.conn.poll(POLL_INTERVAL):
+                    if not slot.process.is_alive():
+                        raise RuntimeError(f"Frame worker {slot.index} died")
+                result = slot.conn.recv()
+                slot.processed += 1
+            except Exception as e:
+                logger.error(f"Frame dispatch failed: {str(e)}")
+                result = {'status': 'error', 'message': str(e)}
+
+            try:
+                callback(result)
+            except Exception as e:
+                logger.error(f"Frame result callback failed: {str(e)}")
+
+        # Only the dispatcher writes to the pipe, so it also sends the sentinel
+        try:
+            slot.conn.send(None)
+        except (OSError, ValueError):
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            'backend': 'process',
+            'workers': [
+                {
+                    'index': slot.index,
+                    'queued': len(slot.pending),
+                    'processed': slot.processed,
+                    'dropped': slot.dropped
+                }
+                for slot in self.slots
+            ]
+        }
+
+    def shutdown(self, timeout: float = 2.0):
+        self.stopping = True
+        for slot in self.slots:
+            with slot.ready:
+                slot.ready.notify_all()
+        deadline = time.monotonic() + timeout
+        for slot in self.slots:
+            if slot.process is not None:
+                slot.process.join(max(0.0, deadline - time.monotonic()))
+                if slot.process.is_alive():
+                    slot.process.terminate()
+
+
+def create_frame_executor(backend: str, **kwargs):
+    """Build the executor named by ``backend`` ('inline' or 'process')"""
+    if backend == 'process':
+        return ProcessPoolFrameExecutor(**kwargs)
+    if backend != 'inline':
+        logger.warning(f"Unknown frame executor '{backend}', falling back to inline")
+    return InlineFrameExecutor()
@@ -0,0 +1,138 @@
+import logging
+import secrets
+from collections import OrderedDict, namedtuple
+from multiprocessing import shared_memory
+from threading import Lock
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SLOT_FREE = 0
+SLOT_BUSY = 1
+
+# Slot payloads start on a cache-line boundary after the state bytes
+HEADER_ALIGN = 64
+
+# Picklable handle to one filled slot, sent to workers instead of pixels
+FrameRef = namedtuple('FrameRef', ['name', 'slots', 'shape', 'slot', 'sequence'])
+
+
+def _header_size(slots: int) -> int:
+    # One state byte per slot plus the owner's unlinked flag
+    return -(-(slots + 1) // HEADER_ALIGN) * HEADER_ALIGN
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing block without taking ownership of its lifetime"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        return shared_memory.SharedMemory(name=name)
+
+
+class FrameRing:
+    """Fixed set of preallocated frame slots in one shared memory block
+
+    The block starts with one state byte per slot and a flag byte followed
+    by the slots themselves, each holding a single uint8 frame of
+    ``shape``. The ingestion side claims a free slot, decodes straight into
+    it and hands a FrameRef to a worker; the worker maps the same block,
+    reads the frame in place and frees the slot. Only the owner (the side
+    that created the ring) unlinks the block, raising the flag first so
+    attached mappings can tell they are stale.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], slots: int = 3, name: Optional[str] = None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.slot_bytes = int(np.prod(self.shape))
+        self.owner = name is None
+        size = _header_size(slots) + slots * self.slot_bytes
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                name=f"dp_frames_{secrets.token_hex(6)}", create=True, size=size
+            )
+        else:
+            self.shm = _attach(name)
+        self.name = self.shm.name
+        self.header = np.ndarray((_header_size(slots),), np.uint8, buffer=self.shm.buf)
+        self.states = self.header[:slots]
+        self.frames = np.ndarray((slots,) + self.shape, np.uint8, buffer=self.shm.buf,
+                                 offset=_header_size(slots))
+        if self.owner:
+            self.header[:] = SLOT_FREE
+        self.lock = Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self.shm.size
+
+    def acquire(self) -> Optional[int]:
+        """Claim a free slot for writing, or None if every slot is busy"""
+        with self.lock:
+            free = np.flatnonzero(self.states == SLOT_FREE)
+            if not len(free):
+                return None
+            slot = int(free[0])
+            self.states[slot] = SLOT_BUSY
+            return slot
+
+    def release(self, slot: int):
+        if self.states is not None:  # the ring may have been closed meanwhile
+            self.states[slot] = SLOT_FREE
+
+    def frame(self, slot: int) -> np.ndarray:
+        """View of a slot's pixels (no copy)"""
+        return self.frames[slot]
+
+    def ref(self, slot: int, sequence=None) -> FrameRef:
+        return FrameRef(self.name, self.slots, self.shape, slot, sequence)
+
+    @property
+    def unlinked(self) -> bool:
+        """True once the owner has closed the ring (always True after close)"""
+        return self.header is None or bool(self.header[self.slots])
+
+    def close(self):
+        if self.owner and self.header is not None:
+            self.header[self.slots] = 1
+        # Views must go before the mapping can be closed
+        self.header = None
+        self.states = None
+        self.frames = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (BufferError, FileNotFoundError) as e:
+            logger.warning(f"Could not release frame ring {self.name}: {str(e)}")
+
+
+class RingAttachments:
+    """Worker-side cache of rings mapped by name
+
+    Mappings of rings their owner has since unlinked are closed on the next
+    lookup, and beyond ``capacity`` the least recently used go too. Mapping
+    a ring that is already gone raises FileNotFoundError.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.rings: OrderedDict = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, ref: FrameRef) -> FrameRing:
+        with self.lock:
+            for name in [name for name, ring in self.rings.items() if ring.unlinked]:
+                self.rings.pop(name).close()
+            ring = self.rings.get(ref.name)
+            if ring is None:
+                ring = self.rings[ref.name] = FrameRing(ref.shape, ref.slots, name=ref.name)
+                while len(self.rings) > self.capacity:
+                    _, stale = self.rings.popitem(last=False)
+                    stale.close()
+            else:
+                self.rings.move_to_end(ref.name)
+            return ring
@@ -0,0 +1,166 @@
+import logging
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _UserIngestion:
+    """Ingestion state for one user's video stream"""
+
+    def __init__(self, target_fps: int):
+        self.in_flight = False
+        self.started_at = 0.0
+        self.pending = None
+        self.pending_thumb = None
+        self.last_thumb = None
+        self.last_admitted_at = 0.0
+        self.latency = None  # EWMA of submit -> result, seconds
+        self.target_fps = target_fps
+        self.received = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+
+class IngestionGovernor:
+    """Decides which incoming video frames are worth processing
+
+    Each user has at most one frame in flight. Frames that arrive meanwhile
+    are coalesced so only the newest one is processed next, and frames whose
+    small grayscale thumbnail barely differs from the last admitted one are
+    skipped outright (at least one frame per ``max_skip_interval`` is
+    always let through). The measured processing latency drives a target
+    FPS that keeps each table within ``cpu_budget`` of one core; callers
+    advertise it to clients so they stop sending frames that would be
+    dropped anyway.
+    """
+
+    def __init__(self, min_fps: int = 2, max_fps: int = 30, cpu_budget: float = 0.5,
+                 diff_threshold: float = 2.0, max_skip_interval: float = 1.0,
+                 thumb_size: Tuple[int, int] = (32, 18), smoothing: float = 0.2,
+                 thumbnailer: Optional[Callable] = None):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.cpu_budget = cpu_budget
+        self.diff_threshold = diff_threshold
+        self.max_skip_interval = max_skip_interval
+        self.thumb_size = thumb_size
+        self.smoothing = smoothing
+        self.thumbnailer = thumbnailer or self.thumbnail
+        self.states: Dict[object, _UserIngestion] = {}
+        self.lock = Lock()
+
+    def _state(self, user_id) -> _UserIngestion:
+        state = self.states.get(user_id)
+        if state is None:
+            state = self.states[user_id] = _UserIngestion(self.max_fps)
+        return state
+
+    @staticmethod
+    def thumbnail(image_bytes: bytes, size: Tuple[int, int]):
+        """Cheap grayscale thumbnail decoded at reduced scale (None if undecodable)"""
+        reduced = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if reduced is None:
+            return None
+        return cv2.resize(reduced, size, interpolation=cv2.INTER_AREA)
+
+    def _is_duplicate(self, state: _UserIngestion, thumb, now: float) -> bool:
+        if thumb is None or state.last_thumb is None:
+            return False
+        if now - state.last_admitted_at >= self.max_skip_interval:
+            return False
+        return cv2.norm(thumb, state.last_thumb, cv2.NORM_L1) / thumb.size < self.diff_threshold
+
+    def admit(self, user_id, frame):
+        """Offer a new frame; returns the frame to process now, or None
+
+        ``frame`` is opaque to the governor apart from ``thumbnailer``, which
+        defaults to decoding compressed image bytes.
+        """
+        thumb = self.thumbnailer(frame, self.thumb_size)
+        now = time.monotonic()
+        with self.lock:
+            state = self._state(user_id)
+            state.received += 1
+
+            if self._is_duplicate(state, thumb, now):
+                state.skipped += 1
+                return None
+
+            if state.in_flight:
+                if state.pending is not None:
+                    state.coalesced += 1
+                state.pending = frame
+                state.pending_thumb = thumb
+                return None
+
+            state.in_flight = True
+            state.started_at = now
+            state.last_thumb = thumb
+            state.last_admitted_at = now
+            return frame
+
+    def complete(self, user_id) -> Tuple[Optional[object], Optional[int]]:
+        """Record that the in-flight frame finished
+
+        Returns the coalesced frame to process next (or None) and the new
+        target FPS if it changed enough to be worth advertising (or None).
+        Completions for a user forgotten meanwhile are ignored.
+        """
+        now = time.monotonic()
+        with self.lock:
+            state = self.states.get(user_id)
+            if state is None or not state.in_flight:
+                return None, None
+            state.processed += 1
+            elapsed = max(now - state.started_at, 1e-4)
+            if state.latency is None:
+                state.latency = elapsed
+            else:
+                state.latency += self.smoothing * (elapsed - state.latency)
+
+            target = int(min(self.max_fps, max(self.min_fps, self.cpu_budget / state.latency)))
+            changed = None
+            # Only re-advertise on a meaningful change to avoid status chatter
+            if abs(target - state.target_fps) >= max(1, 0.2 * state.target_fps):
+                state.target_fps = target
+                changed = target
+
+            next_frame = state.pending
+            if next_frame is None:
+                state.in_flight = False
+            else:
+                state.pending = None
+                state.started_at = now
+                state.last_thumb = state.pending_thumb
+                state.last_admitted_at = now
+                state.pending_thumb = None
+            return next_frame, changed
+
+    def target_fps(self, user_id) -> int:
+        with self.lock:
+            state = self.states.get(user_id)
+            return state.target_fps if state else self.max_fps
+
+    def forget(self, user_id):
+        with self.lock:
+            self.states.pop(user_id, None)
+
+    def stats(self, user_id) -> Dict:
+        with self.lock:
+            state = self.states.get(user_id)
+            if state is None:
+                return {}
+            return {
+                'received': state.received,
+                'processed': state.processed,
+                'coalesced': state.coalesced,
+                'skipped': state.skipped,
+                'target_fps': state.target_fps,
+                'latency_ms': round((state.latency or 0.0) * 1000, 2)
+            }
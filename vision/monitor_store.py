@@ -0,0 +1,159 @@
+import logging
+import time
+from collections import OrderedDict
+from threading import RLock
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def monitor_nbytes(monitor: Dict) -> int:
+    """Approximate bytes held by a GameMonitor entry's image buffers"""
+    total = 0
+    last_frame = monitor.get('last_frame')
+    if isinstance(last_frame, np.ndarray):
+        total += last_frame.nbytes
+    segmenter = monitor.get('segmenter')
+    if segmenter is not None:
+        for buffer in (segmenter._bits, segmenter._plane):
+            if buffer is not None:
+                total += buffer.nbytes
+    table = monitor.get('table')
+    if table is not None:
+        total += table.map1.nbytes + table.map2.nbytes
+    tracker = monitor.get('tracker')
+    if tracker is not None:
+        total += tracker.x.nbytes + tracker.P.nbytes
+    calibrator = monitor.get('calibrator')
+    if calibrator is not None:
+        total += calibrator.nbytes
+    return total
+
+
+class MonitorStore:
+    """Per-user monitor registry with LRU, idle-TTL and memory-budget eviction
+
+    Entries are kept in least-recently-used order. Reads through
+    ``get_or_create`` refresh an entry; ``touch`` also re-measures it with
+    ``sizeof`` so the byte total tracks buffers allocated after creation.
+    Entries idle for longer than ``ttl`` seconds are evicted lazily, and the
+    least recently used ones go first whenever ``max_entries`` or
+    ``max_bytes`` would be exceeded. ``on_evict`` is called with the key
+    and entry of everything evicted.
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 512 * 1024 * 1024,
+                 ttl: float = 30 * 60, sizeof: Callable[[Dict], int] = monitor_nbytes,
+                 on_evict: Optional[Callable] = None, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.clock = clock
+        self.entries: OrderedDict = OrderedDict()  # key -> [entry, last_used, nbytes]
+        self.bytes_held = 0
+        self.evictions = 0
+        self.lock = RLock()
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            record = self.entries.get(key)
+            if record is None:
+                return None
+            record[1] = self.clock()
+            self.entries.move_to_end(key)
+            return record[0]
+
+    def get_or_create(self, key, factory: Callable[[], Dict]):
+        with self.lock:
+            entry = self.get(key)
+            if entry is not None:
+                return entry
+            self.evict_idle()
+            entry = factory()
+            nbytes = self.sizeof(entry)
+            self.entries[key] = [entry, self.clock(), nbytes]
+            self.bytes_held += nbytes
+            self._enforce_limits(keep=key)
+            return entry
+
+    def touch(self, key):
+        """Mark an entry used and re-measure its size"""
+        with self.lock:
+            record = self.entries.get(key)
+            if record is None:
+                return
+            nbytes = self.sizeof(record[0])
+            self.bytes_held += nbytes - record[2]
+            record[1] = self.clock()
+            record[2] = nbytes
+            self.entries.move_to_end(key)
+            self._enforce_limits(keep=key)
+
+    def pop(self, key):
+        with self.lock:
+            record = self.entries.pop(key, None)
+            if record is None:
+                return None
+            self.bytes_held -= record[2]
+            return record[0]
+
+    def _evict(self, key):
+        record = self.entries.pop(key)
+        self.bytes_held -= record[2]
+        self.evictions += 1
+        if self.on_evict is not None:
+            try:
+                self.on_evict(key, record[0])
+            except Exception as e:
+                logger.error(f"Monitor eviction callback failed: {str(e)}")
+
+    def evict_idle(self) -> int:
+        """Evict entries unused for longer than the TTL; returns how many"""
+        with self.lock:
+            cutoff = self.clock() - self.ttl
+            evicted = 0
+            while self.entries:
+                key, record = next(iter(self.entries.items()))
+                if record[1] >= cutoff:
+                    break
+                self._evict(key)
+                evicted += 1
+            return evicted
+
+    def _enforce_limits(self, keep=None):
+        while self.entries and (len(self.entries) > self.max_entries or self.bytes_held > self.max_bytes):
+            key = next(iter(self.entries))
+            if key == keep:
+                # Never evict the entry being served; a single oversized
+                # monitor is allowed to exceed the budget
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(key)
+                key = next(iter(self.entries))
+            self._evict(key)
+
+    def items(self):
+        with self.lock:
+            return [(key, record[0]) for key, record in self.entries.items()]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'live_monitors': len(self.entries),
+                'bytes_held': self.bytes_held,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,61 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from vision import detection
+from vision.segmentation import ColorSegmenter
+
+logger = logging.getLogger(__name__)
+
+# HSV ranges monitors start from before calibration
+DEFAULT_COLOR_RANGES = {
+    'white': {'lower': np.array([0, 0, 200]), 'upper': np.array([180, 30, 255])},  # Cue ball
+    'red': {'lower': np.array([0, 100, 100]), 'upper': np.array([10, 255, 255])},
+    'yellow': {'lower': np.array([20, 100, 100]), 'upper': np.array([30, 255, 255])},
+    'green': {'lower': np.array([50, 100, 100]), 'upper': np.array([70, 255, 255])}
+}
+
+
+def analyze_frame(monitor: Dict, frame: np.ndarray, detector: str = detection.DETECTOR_FUSED,
+                  with_circles: bool = False) -> Tuple[List[Dict], bool, Optional[np.ndarray]]:
+    """Detect and track the balls of one camera frame for a monitor entry
+
+    ``monitor`` needs 'color_ranges', 'segmenter', 'tracker' and 'table'
+    (as kept by GameMonitor), and may hold a ColorCalibrator under
+    'calibrator'; the segmenter is built on first use. Returns
+    the tracked balls (camera pixel positions, plus 'table_position' when
+    the table is known), whether a shot started, and the detector's circles
+    in camera pixels (None unless ``with_circles``).
+    """
+    # Restrict work to the rectified playing surface once it is known
+    table = monitor['table']
+    if table is not None and not table.matches(frame):
+        table = None
+    surface = table.warp(frame) if table is not None else frame
+
+    hsv = cv2.cvtColor(surface, cv2.COLOR_BGR2HSV)
+
+    # Label all calibrated colors in a single pass; Hough runs according
+    # to the detector strategy on the same decoded surface
+    if monitor['segmenter'] is None:
+        monitor['segmenter'] = ColorSegmenter(monitor['color_ranges'])
+    balls, circles = detection.detect(surface, hsv, monitor['segmenter'], detector, with_circles)
+
+    # Follow lighting drift using samples from the balls just found; new
+    # ranges replace the references, the segmenter in use is never mutated
+    calibrator = monitor.get('calibrator')
+    if calibrator is not None:
+        ranges = calibrator.observe(hsv, balls)
+        if ranges is not None:
+            monitor['segmenter'] = ColorSegmenter(ranges)
+            monitor['color_ranges'] = ranges
+
+    # Match balls to persistent tracks and detect shots from their motion
+    balls, shot_detected = monitor['tracker'].update(balls)
+    if table is not None:
+        table.annotate(balls)
+        if circles is not None and len(circles):
+            circles[:, :2] = table.to_image(circles[:, :2])
+    return balls, shot_detected, circles
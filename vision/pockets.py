@@ -0,0 +1,103 @@
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from realtime.write_behind import WriteBehindBuffer
+from vision.table import CANONICAL_SIZE
+
+# Pocket centres in normalized table coordinates: corners and side pockets
+POCKET_POSITIONS = ((0.0, 0.0), (0.5, 0.0), (1.0, 0.0),
+                    (0.0, 1.0), (0.5, 1.0), (1.0, 1.0))
+
+CUE_COLOR = 'white'
+
+
+class PocketDetector:
+    """Detects pocketed balls from tracks that vanish at a pocket
+
+    Each pocket is a small circular ROI (``roi_radius`` as a fraction of the
+    bed width) around a fixed point of the canonical table. When a tracked
+    ball disappears, only its last position and its position extrapolated
+    ``lookahead`` frames ahead are tested against the six ROIs; if either
+    falls inside one and the ball stays missing for ``confirm_frames``
+    frames, it is reported as pocketed. A cue ball going down is a foul.
+    Nothing beyond the tracker's output is scanned.
+    """
+
+    def __init__(self, size: Tuple[int, int] = CANONICAL_SIZE, roi_radius: float = 0.05,
+                 confirm_frames: int = 3, lookahead: float = 2.0):
+        width, height = size
+        self.scale = np.array([width - 1, height - 1], np.float64)
+        self.centres = np.array(POCKET_POSITIONS) * self.scale
+        self.roi_radius = roi_radius * width
+        self.confirm_frames = confirm_frames
+        self.lookahead = lookahead
+        self.visible: Dict[int, Tuple[np.ndarray, np.ndarray, str]] = {}  # track -> (position, velocity, color)
+        self.missing: Dict[int, List] = {}  # track -> [frames missing, pocket, color]
+
+    def pocket_for(self, points: np.ndarray) -> np.ndarray:
+        """Index of the pocket ROI containing each (n, 2) canonical point, or -1"""
+        offsets = points[:, None, :] - self.centres[None, :, :]
+        distance = np.hypot(offsets[..., 0], offsets[..., 1])
+        nearest = distance.argmin(axis=1)
+        inside = distance[np.arange(len(points)), nearest] <= self.roi_radius
+        return np.where(inside, nearest, -1)
+
+    def update(self, balls: List[Dict]) -> List[Dict]:
+        """Feed one frame of tracked balls; returns the balls pocketed on it
+
+        Balls need 'track_id', 'velocity' (canonical px/frame) and
+        'table_position'; without a located table nothing is detected.
+        """
+        current = {
+            ball['track_id']: ball for ball in balls
+            if ball.get('table_position') is not None and 'track_id' in ball
+        }
+
+        # Tracks that were visible last frame and are gone now
+        vanished = [track_id for track_id in self.visible if track_id not in current]
+        if vanished:
+            last = np.array([self.visible[t][0] for t in vanished])
+            ahead = last + self.lookahead * np.array([self.visible[t][1] for t in vanished])
+            pockets = np.maximum(self.pocket_for(last), self.pocket_for(ahead))
+            for track_id, pocket in zip(vanished, pockets.tolist()):
+                if pocket >= 0:
+                    self.missing[track_id] = [0, pocket, self.visible[track_id][2]]
+
+        events = []
+        for track_id in list(self.missing):
+            if track_id in current:
+                # Only occluded or missed for a frame or two
+                del self.missing[track_id]
+                continue
+            record = self.missing[track_id]
+            record[0] += 1
+            if record[0] >= self.confirm_frames:
+                del self.missing[track_id]
+                events.append({
+                    'track_id': track_id,
+                    'color': record[2],
+                    'pocket': record[1],
+                    'foul': record[2] == CUE_COLOR
+                })
+
+        self.visible = {
+            track_id: (np.array(ball['table_position']) * self.scale, np.array(ball['velocity']),
+                       ball['color'])
+            for track_id, ball in current.items()
+        }
+        return events
+
+
+class ShotLog(WriteBehindBuffer):
+    """Write-behind buffer of completed shots
+
+    Shots are few and arrive slowly, so the batch is smaller and may wait
+    longer than the chat log's.
+    """
+
+    label = 'shots'
+
+    def __init__(self, writer: Callable[[List[Dict]], None], max_rows: int = 50,
+                 max_age: float = 5.0, max_pending: int = 5000, **kwargs):
+        super().__init__(writer, max_rows=max_rows, max_age=max_age, max_pending=max_pending, **kwargs)
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import re
+import time
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# One row per ball per frame
+BALL_DTYPE = np.dtype([
+    ('frame', '<u4'),
+    ('time', '<f8'),
+    ('track_id', '<u4'),
+    ('color', 'u1'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('table_x', '<f4'),  # NaN when the table bed is unknown
+    ('table_y', '<f4'),
+    ('radius', '<u2')
+])
+
+# One row per event
+EVENT_DTYPE = np.dtype([
+    ('frame', '<u4'),
+    ('time', '<f8'),
+    ('kind', 'u1'),
+    ('value', '<i4')
+])
+
+EVENT_SHOT = 1
+EVENT_POCKET = 2  # value: track id
+EVENT_FOUL = 3  # value: track id of the ball involved
+
+UNKNOWN_POSITION = (np.nan, np.nan)
+
+BALLS_FILE = 'balls.bin'
+EVENTS_FILE = 'events.bin'
+META_FILE = 'meta.json'
+
+
+def _safe(part) -> str:
+    """One path component from an id; no dots, so never '.', '..' or hidden"""
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(part)) or '_'
+
+
+def replay_path(root: str, user_id, game_id) -> str:
+    return os.path.join(root, _safe(user_id), _safe(game_id))
+
+
+class ReplayWriter:
+    """Append-only columnar log for one user's game
+
+    Rows go into fixed-size structured-array buffers allocated once, and a
+    full buffer (or one older than ``flush_interval`` seconds) is appended
+    to its file with a single ``tofile`` call. Steady-state recording
+    therefore allocates no per-frame Python objects beyond the detections
+    it is handed.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = 4096, flush_interval: float = 5.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+        self.balls = np.zeros(chunk_rows, BALL_DTYPE)
+        self.events = np.zeros(max(16, chunk_rows // 16), EVENT_DTYPE)
+        self.ball_rows = 0
+        self.event_rows = 0
+        self.colors: Dict[str, int] = {}
+        self.frame = self._existing_frames()
+        self.last_flush = time.monotonic()
+        self._load_meta()
+
+    def _existing_frames(self) -> int:
+        """Continue numbering after frames already on disk"""
+        balls_file = os.path.join(self.path, BALLS_FILE)
+        if not os.path.exists(balls_file) or os.path.getsize(balls_file) < BALL_DTYPE.itemsize:
+            return 0
+        last = np.fromfile(balls_file, BALL_DTYPE, offset=os.path.getsize(balls_file) - BALL_DTYPE.itemsize)
+        return int(last['frame'][0]) + 1
+
+    def _load_meta(self):
+        meta_file = os.path.join(self.path, META_FILE)
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                self.colors = {color: code for code, color in enumerate(json.load(f)['colors'])}
+
+    def _write_meta(self):
+        meta = {
+            'colors': sorted(self.colors, key=self.colors.get),
+            'ball_dtype': BALL_DTYPE.descr,
+            'event_dtype': EVENT_DTYPE.descr
+        }
+        with open(os.path.join(self.path, META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+    def _color_code(self, color: str) -> int:
+        code = self.colors.get(color)
+        if code is None:
+            code = self.colors[color] = len(self.colors)
+            self._write_meta()
+        return code
+
+    def record(self, balls: List[Dict], shot: bool = False, timestamp: Optional[float] = None,
+               events: Iterable[Tuple[int, int]] = ()):
+        now = time.time() if timestamp is None else timestamp
+        if self.ball_rows + len(balls) > len(self.balls):
+            self.flush()
+            if len(balls) > len(self.balls):
+                self.balls = np.zeros(len(balls), BALL_DTYPE)
+
+        for ball in balls:
+            x, y = ball['position']
+            table_x, table_y = ball.get('table_position', UNKNOWN_POSITION)
+            self.balls[self.ball_rows] = (self.frame, now, ball.get('track_id', 0),
+                                          self._color_code(ball['color']), x, y,
+                                          table_x, table_y, ball['radius'])
+            self.ball_rows += 1
+
+        if shot:
+            self.record_event(EVENT_SHOT, 1, now)
+        for kind, value in events:
+            self.record_event(kind, value, now)
+
+        self.frame += 1
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def record_event(self, kind: int, value: int = 0, timestamp: Optional[float] = None):
+        if self.event_rows == len(self.events):
+            self.flush()
+        self.events[self.event_rows] = (self.frame, time.time() if timestamp is None else timestamp,
+                                        kind, value)
+        self.event_rows += 1
+
+    def flush(self):
+        if self.ball_rows:
+            with open(os.path.join(self.path, BALLS_FILE), 'ab') as f:
+                self.balls[:self.ball_rows].tofile(f)
+            self.ball_rows = 0
+        if self.event_rows:
+            with open(os.path.join(self.path, EVENTS_FILE), 'ab') as f:
+                self.events[:self.event_rows].tofile(f)
+            self.event_rows = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+
+class ReplayRecorder:
+    """Replay writers keyed by (user, game) under one root directory"""
+
+    def __init__(self, root: str, chunk_rows: int = 4096, flush_interval: float = 5.0):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.writers: Dict[Tuple, ReplayWriter] = {}
+        self.lock = Lock()
+
+    def writer(self, user_id, game_id) -> ReplayWriter:
+        key = (user_id, game_id)
+        with self.lock:
+            writer = self.writers.get(key)
+            if writer is None:
+                writer = self.writers[key] = ReplayWriter(
+                    replay_path(self.root, user_id, game_id), self.chunk_rows, self.flush_interval
+                )
+            return writer
+
+    def record(self, user_id, game_id, balls: List[Dict], shot: bool = False,
+               events: Iterable[Tuple[int, int]] = ()):
+        try:
+            self.writer(user_id, game_id).record(balls, shot, events=events)
+        except OSError as e:
+            logger.error(f"Replay recording failed for user {user_id}: {str(e)}")
+
+    def close(self, user_id, game_id=None):
+        """Flush and drop a user's writers (all of their games by default)"""
+        with self.lock:
+            keys = [key for key in self.writers if key[0] == user_id and game_id in (None, key[1])]
+            writers = [self.writers.pop(key) for key in keys]
+        for writer in writers:
+            writer.close()
+
+    def close_all(self):
+        with self.lock:
+            writers = list(self.writers.values())
+            self.writers.clear()
+        for writer in writers:
+            writer.close()
+
+
+class ReplayReader:
+    """Streams a recorded game back without loading it all into memory"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.colors: List[str] = json.load(f)['colors']
+
+    @classmethod
+    def open(cls, root: str, user_id, game_id) -> 'ReplayReader':
+        return cls(replay_path(root, user_id, game_id))
+
+    def _table(self, name: str, dtype: np.dtype) -> np.ndarray:
+        filename = os.path.join(self.path, name)
+        if not os.path.exists(filename) or os.path.getsize(filename) < dtype.itemsize:
+            return np.zeros(0, dtype)
+        return np.memmap(filename, dtype, mode='r')
+
+    def balls(self) -> np.ndarray:
+        """All ball rows as a read-only memory map"""
+        return self._table(BALLS_FILE, BALL_DTYPE)
+
+    def events(self) -> np.ndarray:
+        return self._table(EVENTS_FILE, EVENT_DTYPE)
+
+    def shots(self) -> np.ndarray:
+        events = self.events()
+        return events[events['kind'] == EVENT_SHOT]
+
+    def pocketed(self) -> np.ndarray:
+        events = self.events()
+        return events[events['kind'] == EVENT_POCKET]
+
+    def iter_frames(self, chunk_rows: int = 65536) -> Iterator[Tuple[int, float, np.ndarray]]:
+        """Yield (frame, time, rows) per recorded frame, reading in chunks
+
+        Frames with no balls detected are not present in the log.
+        """
+        balls = self.balls()
+        start = 0
+        while start < len(balls):
+            chunk = balls[start:start + chunk_rows]
+            frames = chunk['frame']
+            if start + chunk_rows < len(balls):
+                # Hold back the last frame, which may continue in the next chunk
+                cut = int(np.searchsorted(frames, frames[-1]))
+                if cut == 0:
+                    cut = len(chunk)
+            else:
+                cut = len(chunk)
+            boundaries = np.flatnonzero(np.diff(frames[:cut])) + 1
+            for rows in np.split(chunk[:cut], boundaries):
+                yield int(rows['frame'][0]), float(rows['time'][0]), rows
+            start += cut
+
+    def color_name(self, code: int) -> str:
+        return self.colors[code]
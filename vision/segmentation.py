@@ -0,0 +1,161 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Blob filters shared by both segmentation paths
+MIN_BLOB_AREA = 100
+MIN_BALL_RADIUS = 10
+MAX_BALL_RADIUS = 30
+
+# Label images are uint8 bitmasks, so at most eight colors fit in one pass
+MAX_COLORS = 8
+
+MORPH_KERNEL = np.ones((5, 5), np.uint8)
+BORDER_KERNEL = np.ones((3, 3), np.uint8)
+
+
+def _first_bit_table() -> np.ndarray:
+    """Map every 8-bit label to 1 + the index of its lowest set bit (0 when empty)"""
+    table = np.zeros(256, np.uint8)
+    for value in range(1, 256):
+        table[value] = (value & -value).bit_length()
+    return table
+
+
+FIRST_BIT_LUT = _first_bit_table()
+
+
+class ColorSegmenter:
+    """Labels every calibrated color in a single pass over an HSV frame
+
+    The HSV ranges are folded into three 256-entry lookup tables, one per
+    channel, whose entries are bitmasks of the colors accepting that channel
+    value. ANDing the three looked-up planes yields the set of colors a pixel
+    belongs to, and that bitmask is used directly as the pixel label. Morphology
+    and contour extraction then run once on the label image instead of once per
+    color.
+    """
+
+    def __init__(self, color_ranges: Dict[str, Dict[str, np.ndarray]]):
+        if len(color_ranges) > MAX_COLORS:
+            raise ValueError(f"At most {MAX_COLORS} colors can be segmented in one pass")
+
+        self.colors: List[str] = list(color_ranges.keys())
+        self.luts = np.zeros((3, 256), np.uint8)
+        values = np.arange(256)
+        for index, color in enumerate(self.colors):
+            lower = np.asarray(color_ranges[color]['lower'])
+            upper = np.asarray(color_ranges[color]['upper'])
+            bit = np.uint8(1 << index)
+            for channel in range(3):
+                inside = (values >= lower[channel]) & (values <= upper[channel])
+                self.luts[channel][inside] |= bit
+
+        # Scratch buffers reused between frames of the same shape
+        self._shape: Optional[tuple] = None
+        self._bits = None
+        self._plane = None
+
+    def _ensure_buffers(self, shape):
+        if self._shape != shape:
+            self._shape = shape
+            self._bits = np.empty(shape, np.uint8)
+            self._plane = np.empty(shape, np.uint8)
+
+    def label(self, hsv: np.ndarray) -> np.ndarray:
+        """Return a uint8 label image whose bit i is set for pixels of self.colors[i]"""
+        self._ensure_buffers(hsv.shape[:2])
+        h, s, v = cv2.split(hsv)
+        cv2.LUT(h, self.luts[0], dst=self._bits)
+        cv2.LUT(s, self.luts[1], dst=self._plane)
+        cv2.bitwise_and(self._bits, self._plane, dst=self._bits)
+        cv2.LUT(v, self.luts[2], dst=self._plane)
+        return cv2.bitwise_and(self._bits, self._plane)
+
+    def clean(self, labels: np.ndarray) -> np.ndarray:
+        """Apply one shared open/close pass and return the ball foreground mask
+
+        Borders between touching blobs of different colors are cut out of the
+        mask so that each contour covers a single color.
+        """
+        foreground = cv2.compare(labels, 0, cv2.CMP_GT)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, MORPH_KERNEL)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_CLOSE, MORPH_KERNEL)
+
+        # Gaps bridged by closing take their neighbours' labels, then any pixel
+        # next to a higher label is a color border
+        filled = cv2.dilate(labels, MORPH_KERNEL)
+        filled = cv2.bitwise_and(filled, foreground)
+        filled = cv2.max(filled, labels)
+        border = cv2.compare(cv2.dilate(filled, BORDER_KERNEL), filled, cv2.CMP_GT)
+        return cv2.bitwise_and(foreground, cv2.bitwise_not(border))
+
+    def extract_blobs(self, labels: np.ndarray, mask: np.ndarray,
+                      regions: Optional[List[Tuple[int, int, int, int]]] = None) -> List[Dict]:
+        """Turn a label image and its cleaned foreground mask into ball candidates
+
+        If ``regions`` is given, the bounding rectangle of every blob large
+        enough to be a ball is appended to it, whatever its radius.
+        """
+        detected_balls = []
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        for contour in contours:
+            if cv2.contourArea(contour) <= MIN_BLOB_AREA:
+                continue
+            bx, by, bw, bh = cv2.boundingRect(contour)
+            if regions is not None:
+                regions.append((bx, by, bw, bh))
+            (x, y), radius = cv2.minEnclosingCircle(contour)
+            radius = int(radius)
+            if not MIN_BALL_RADIUS <= radius <= MAX_BALL_RADIUS:
+                continue
+
+            # Majority label inside the blob decides its color
+            patch = labels[by:by + bh, bx:bx + bw][mask[by:by + bh, bx:bx + bw] > 0]
+            votes = np.bincount(FIRST_BIT_LUT[patch], minlength=len(self.colors) + 1)[1:]
+            if not votes.any():
+                continue
+
+            detected_balls.append({
+                'color': self.colors[int(votes.argmax())],
+                'position': (int(x), int(y)),
+                'radius': radius
+            })
+        return detected_balls
+
+    def detect(self, hsv: np.ndarray, regions: Optional[List] = None) -> List[Dict]:
+        """Label, clean and extract balls from an HSV frame"""
+        labels = self.label(hsv)
+        return self.extract_blobs(labels, self.clean(labels), regions)
+
+    def color_at(self, labels: np.ndarray, x: int, y: int) -> Optional[str]:
+        """Color of the label image at a pixel, None for background"""
+        index = int(FIRST_BIT_LUT[labels[y, x]])
+        return self.colors[index - 1] if index else None
+
+
+def segment_per_color(hsv: np.ndarray, color_ranges: Dict[str, Dict[str, np.ndarray]]) -> List[Dict]:
+    """Reference per-color segmentation, kept for benchmarks and comparisons"""
+    detected_balls = []
+    for color, ranges in color_ranges.items():
+        mask = cv2.inRange(hsv, ranges['lower'], ranges['upper'])
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, MORPH_KERNEL)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, MORPH_KERNEL)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        for contour in contours:
+            if cv2.contourArea(contour) > MIN_BLOB_AREA:
+                (x, y), radius = cv2.minEnclosingCircle(contour)
+                radius = int(radius)
+                if MIN_BALL_RADIUS <= radius <= MAX_BALL_RADIUS:
+                    detected_balls.append({
+                        'color': color,
+                        'position': (int(x), int(y)),
+                        'radius': radius
+                    })
+    return detected_balls
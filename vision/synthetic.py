@@ -0,0 +1,203 @@
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from vision.tracking import GATED_COST, assign
+
+logger = logging.getLogger(__name__)
+
+# Ball colors as drawn, chosen inside the default calibration ranges
+BALL_COLORS_BGR = {
+    'white': (245, 245, 245),
+    'red': (20, 50, 220),  # hue clear of the 0/180 wrap
+    'yellow': (30, 220, 230),
+    'green': (40, 200, 40)
+}
+
+# Cue ball first, then object balls
+COLORS = ['white'] + ['red'] * 5 + ['yellow'] * 5 + ['green'] * 5
+
+FELT_BGR = (140, 70, 20)
+RAIL_BGR = (25, 45, 70)
+FLOOR_BGR = (90, 90, 90)
+
+# A 2.25" ball on a 100" bed
+BALL_TO_BED = 0.0225
+
+# Fraction of the frame the bed may span
+BED_FILL = 0.84
+
+
+def _spread(rng: np.random.Generator, count: int, width: float, height: float,
+            margin: float) -> np.ndarray:
+    """Random starting layout with no two balls closer than 3 * margin"""
+    positions = np.zeros((count, 2))
+    for index in range(count):
+        for _ in range(1000):
+            candidate = rng.uniform([2 * margin, 2 * margin], [width - 2 * margin, height - 2 * margin])
+            gaps = np.hypot(*(positions[:index] - candidate).T)
+            if not len(gaps) or gaps.min() > 3 * margin:
+                break
+        positions[index] = candidate
+    return positions
+
+
+def simulate(frames: int, seed: int = 0, width: int = 1280, height: int = 720,
+             shot_every: int = 60, colors: List[str] = COLORS,
+             margin: float = 20) -> Iterator[Tuple[np.ndarray, bool]]:
+    """Yield (positions, struck) for balls on a width x height bed
+
+    The cue ball is struck every ``shot_every`` frames, then every ball
+    rolls with friction and bounces off the cushions. ``struck`` is True on
+    the frame of each strike.
+    """
+    rng = np.random.default_rng(seed)
+    positions = _spread(rng, len(colors), width, height, margin)
+    velocities = np.zeros_like(positions)
+    for frame in range(frames):
+        struck = frame % shot_every == 10
+        if struck:
+            angle = rng.uniform(0, 2 * np.pi)
+            velocities[0] = rng.uniform(20, 40) * np.array([np.cos(angle), np.sin(angle)])
+        positions += velocities
+        velocities *= 0.9
+        velocities[np.hypot(velocities[:, 0], velocities[:, 1]) < 0.5] = 0
+        # Bounce off the cushions
+        for axis, limit in ((0, width), (1, height)):
+            out = (positions[:, axis] < margin) | (positions[:, axis] > limit - margin)
+            velocities[out, axis] *= -1
+            positions[:, axis] = np.clip(positions[:, axis], margin, limit - margin)
+        yield positions, struck
+
+
+class SyntheticTable:
+    """Procedural camera view of a pool table with ground truth
+
+    The bed is drawn top-down at its own resolution and projected into the
+    frame through a homography, so ``perspective`` > 0 narrows the far end
+    the way a tilted camera does. Per frame, the exposure drifts by up to
+    ``lighting`` (a fraction of full scale) and Gaussian sensor noise of
+    ``noise`` levels is added.
+    """
+
+    def __init__(self, width: int = 1280, height: int = 720, colors: List[str] = COLORS,
+                 perspective: float = 0.0, lighting: float = 0.05, noise: float = 4.0,
+                 shot_every: int = 60, seed: int = 0):
+        self.width = width
+        self.height = height
+        self.colors = list(colors)
+        self.lighting = lighting
+        self.noise = noise
+        self.shot_every = shot_every
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+
+        bed_width = int(min(width * BED_FILL, height * BED_FILL * 2))
+        self.bed_size = (bed_width, bed_width // 2)
+        self.radius = max(2, int(round(bed_width * BALL_TO_BED / 2)))
+
+        # Bed corners in the frame: top-left, top-right, bottom-right, bottom-left
+        bed_height = self.bed_size[1]
+        left, top = (width - bed_width) / 2, (height - bed_height) / 2
+        inset = bed_width * perspective / 2
+        self.corners = np.array([
+            [left + inset, top], [left + bed_width - inset, top],
+            [left + bed_width, top + bed_height], [left, top + bed_height]
+        ], dtype=np.float32)
+        bed = np.array([[0, 0], [bed_width - 1, 0], [bed_width - 1, bed_height - 1],
+                        [0, bed_height - 1]], dtype=np.float32)
+        self.homography = cv2.getPerspectiveTransform(bed, self.corners)
+
+        # Static background: floor, rails and the bed's footprint
+        self.background = np.empty((height, width, 3), np.uint8)
+        self.background[:] = FLOOR_BGR
+        rail = max(4, self.radius * 2)
+        cv2.fillConvexPoly(self.background, self._outline(rail).astype(np.int32), RAIL_BGR, cv2.LINE_AA)
+        self.bed_mask = np.zeros((height, width), np.uint8)
+        cv2.fillConvexPoly(self.bed_mask, self.corners.astype(np.int32), 255, cv2.LINE_AA)
+
+        # Cycled sensor noise fields, so rendering stays cheap
+        self.noise_bank = [
+            self.rng.normal(0, noise, (height, width, 3)).astype(np.float32) for _ in range(4)
+        ] if noise > 0 else []
+        self._surface = np.empty((bed_height, bed_width, 3), np.uint8)
+
+    def _outline(self, margin: float) -> np.ndarray:
+        center = self.corners.mean(axis=0)
+        offsets = self.corners - center
+        scale = 1 + margin / np.abs(offsets).max(axis=0)
+        return center + offsets * scale
+
+    def to_frame(self, points: np.ndarray) -> np.ndarray:
+        """Map bed pixels to frame pixels"""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points, self.homography).reshape(-1, 2)
+
+    def render(self, positions: np.ndarray, frame_index: int = 0,
+               out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Draw one frame with balls at bed ``positions``"""
+        surface = self._surface
+        surface[:] = FELT_BGR
+        for color, (x, y) in zip(self.colors, positions):
+            cv2.circle(surface, (int(round(x)), int(round(y))), self.radius,
+                       BALL_COLORS_BGR[color], -1, cv2.LINE_AA)
+
+        if out is None:
+            frame = self.background.copy()
+        else:
+            frame = out
+            np.copyto(frame, self.background)
+        warped = cv2.warpPerspective(surface, self.homography, (self.width, self.height),
+                                     flags=cv2.INTER_LINEAR)
+        cv2.copyTo(warped, self.bed_mask, frame)
+
+        gain = 1 + self.lighting * np.sin(frame_index / 15.0)
+        if self.noise_bank or gain != 1:
+            shaded = frame.astype(np.float32) * gain
+            if self.noise_bank:
+                shaded += self.noise_bank[frame_index % len(self.noise_bank)]
+            np.clip(shaded, 0, 255, out=shaded)
+            frame[:] = shaded
+        return frame
+
+    def frames(self, count: int) -> Iterator[Tuple[np.ndarray, Dict]]:
+        """Yield (frame, truth) pairs
+
+        ``truth`` holds 'balls' (color, frame 'position' and 'radius' per
+        ball) and 'shot', True on the frame of each cue strike.
+        """
+        margin = self.radius + 2
+        motion = simulate(count, self.seed, self.bed_size[0], self.bed_size[1],
+                          self.shot_every, self.colors, margin)
+        buffer = np.empty((self.height, self.width, 3), np.uint8)
+        for index, (positions, struck) in enumerate(motion):
+            frame = self.render(positions, index, out=buffer)
+            image = self.to_frame(positions)
+            yield frame, {
+                'balls': [
+                    {'color': color, 'position': (float(x), float(y)), 'radius': self.radius}
+                    for color, (x, y) in zip(self.colors, image.tolist())
+                ],
+                'shot': struck
+            }
+
+
+def match_detections(detected: List[Dict], truth: List[Dict],
+                     max_distance: float) -> Tuple[List[Tuple[int, int]], np.ndarray]:
+    """Pair detections with ground-truth balls by minimum total distance
+
+    Returns the (detected, truth) index pairs within ``max_distance`` and
+    their distances.
+    """
+    if not detected or not truth:
+        return [], np.zeros(0)
+    found = np.array([ball['position'] for ball in detected], dtype=np.float64)
+    expected = np.array([ball['position'] for ball in truth], dtype=np.float64)
+    distance = np.hypot(*(found[:, None, :] - expected[None, :, :]).transpose(2, 0, 1))
+    cost = np.where(distance <= max_distance, distance, GATED_COST)
+    rows, cols = assign(cost)
+    valid = cost[rows, cols] < GATED_COST
+    rows, cols = rows[valid], cols[valid]
+    return list(zip(rows.tolist(), cols.tolist())), distance[rows, cols]
@@ -0,0 +1,146 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Largest canonical playing surface, 2:1 like a regulation table. At this
+# size a 2.25" ball on a 100" bed is ~14px in radius, inside the segmenter's
+# limits; smaller beds keep roughly their own resolution (see canonical_size).
+CANONICAL_SIZE = (1280, 640)
+
+# The felt must cover at least this fraction of the frame to be trusted
+MIN_TABLE_AREA = 0.15
+
+
+def order_corners(points: np.ndarray) -> np.ndarray:
+    """Order four points as top-left, top-right, bottom-right, bottom-left"""
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+
+def detect_table_quad(frame: np.ndarray) -> Optional[np.ndarray]:
+    """Find the felt quadrilateral in a BGR frame
+
+    The felt is taken to be the dominant saturated hue; its largest blob is
+    simplified to four corners (falling back to the minimum-area rectangle).
+    Returns the ordered corners, or None if no plausible table is visible.
+    """
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    saturated = cv2.inRange(hsv, np.array([0, 60, 40]), np.array([180, 255, 255]))
+    hist = cv2.calcHist([hsv], [0], saturated, [180], [0, 180]).ravel()
+    if hist.sum() == 0:
+        return None
+    felt_hue = int(np.argmax(hist))
+
+    lower = np.array([max(0, felt_hue - 12), 60, 40])
+    upper = np.array([min(180, felt_hue + 12), 255, 255])
+    mask = cv2.inRange(hsv, lower, upper)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (25, 25))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    felt = max(contours, key=cv2.contourArea)
+    if cv2.contourArea(felt) < MIN_TABLE_AREA * frame.shape[0] * frame.shape[1]:
+        return None
+
+    hull = cv2.convexHull(felt)
+    quad = cv2.approxPolyDP(hull, 0.02 * cv2.arcLength(hull, True), True)
+    if len(quad) != 4:
+        quad = cv2.boxPoints(cv2.minAreaRect(hull))
+    return order_corners(quad)
+
+
+def canonical_size(corners: np.ndarray, max_size: Tuple[int, int] = CANONICAL_SIZE) -> Tuple[int, int]:
+    """Rectified surface size for a table quad, never more pixels than the quad covers
+
+    Width and height follow the longer of each pair of opposite sides, then
+    shrink together until the surface holds no more pixels than the quad
+    itself and fits within ``max_size``, so warping never upsamples.
+    """
+    top_left, top_right, bottom_right, bottom_left = order_corners(corners)
+    width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+    if width < 1 or height < 1:
+        return 1, 1
+    area = cv2.contourArea(order_corners(corners))
+    scale = min(1.0, np.sqrt(area / (width * height)), max_size[0] / width, max_size[1] / height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+class TableGeometry:
+    """Cached mapping between a camera frame and the canonical table surface
+
+    The remap tables are built once, so warping a frame touches only the
+    pixels of the playing surface and costs one cv2.remap call. The surface
+    is sized from the quad itself unless ``size`` is given.
+    """
+
+    def __init__(self, corners: np.ndarray, frame_shape: Tuple[int, ...],
+                 size: Optional[Tuple[int, int]] = None):
+        self.corners = order_corners(corners)
+        self.frame_shape = tuple(frame_shape[:2])
+        self.size = size = tuple(size) if size is not None else canonical_size(self.corners)
+        width, height = size
+        canonical = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+                             dtype=np.float32)
+        self.homography = cv2.getPerspectiveTransform(self.corners, canonical)
+        self.inverse = cv2.getPerspectiveTransform(canonical, self.corners)
+
+        # Source coordinates for every canonical pixel, in fixed point
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        grid = np.stack([xs, ys], axis=-1).reshape(-1, 1, 2)
+        source = cv2.perspectiveTransform(grid, self.inverse).reshape(height, width, 2)
+        self.map1, self.map2 = cv2.convertMaps(source[..., 0], source[..., 1], cv2.CV_16SC2)
+
+    @classmethod
+    def detect(cls, frame: np.ndarray) -> Optional['TableGeometry']:
+        corners = detect_table_quad(frame)
+        if corners is None:
+            return None
+        return cls(corners, frame.shape)
+
+    def matches(self, frame: np.ndarray) -> bool:
+        return frame.shape[:2] == self.frame_shape
+
+    def warp(self, frame: np.ndarray, dst: Optional[np.ndarray] = None) -> np.ndarray:
+        """Crop and rectify the playing surface to the canonical size"""
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst)
+
+    def to_image(self, points: np.ndarray) -> np.ndarray:
+        """Map canonical surface points back to camera pixels"""
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+        return cv2.perspectiveTransform(points, self.inverse).reshape(-1, 2)
+
+    def annotate(self, balls: List[Dict]) -> List[Dict]:
+        """Add table-normalized and camera coordinates to canonical detections
+
+        'table_position' is (x, y) in [0, 1] across the bed; 'position' is
+        rewritten in camera pixels so clients can keep drawing on the video.
+        """
+        if not balls:
+            return balls
+        canonical = np.array([ball['position'] for ball in balls], dtype=np.float32)
+        image = self.to_image(canonical)
+        width, height = self.size
+        for ball, (cx, cy), (ix, iy) in zip(balls, canonical.tolist(), image.tolist()):
+            ball['table_position'] = (round(cx / (width - 1), 4), round(cy / (height - 1), 4))
+            ball['position'] = (int(ix), int(iy))
+        return balls
+
+    def to_dict(self) -> Dict:
+        return {
+            'corners': self.corners.round(1).tolist(),
+            'size': list(self.size)
+        }
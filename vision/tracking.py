@@ -0,0 +1,259 @@
+import logging
+from collections import deque
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional; fall back to the numpy solver below
+    linear_sum_assignment = None
+
+logger = logging.getLogger(__name__)
+
+# Cost assigned to gated-out pairs; finite so the solver stays well defined
+GATED_COST = 1e6
+
+# Constant-velocity model, one step per frame: state is [x, y, vx, vy]
+F = np.array([[1, 0, 1, 0],
+              [0, 1, 0, 1],
+              [0, 0, 1, 0],
+              [0, 0, 0, 1]], dtype=np.float64)
+
+
+def _hungarian(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Minimum-cost assignment for a rectangular cost matrix (O(n^2 m) for n <= m)"""
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)  # p[j]: row (1-based) assigned to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(candidates.argmin()) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(p[1:])
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def assign(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Optimal assignment, using scipy when it is installed"""
+    if cost.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    return _hungarian(cost)
+
+
+class BallTracker:
+    """Multi-ball tracker with persistent track ids
+
+    Every track carries a constant-velocity Kalman state. Each frame the
+    states are predicted together, detections are matched to tracks of the
+    same color by solving an assignment problem over a gated distance
+    matrix, and matched tracks are corrected in one batched update.
+    Unmatched detections start new tracks and tracks unseen for
+    ``max_misses`` frames are dropped.
+
+    A shot is reported on the first frame in which a confirmed ball moves
+    faster than ``shot_speed`` after the table has been at rest for
+    ``rest_frames`` frames, so a rolling ball counts once rather than once
+    per frame.
+    """
+
+    def __init__(self, gate: float = 60.0, max_misses: int = 5, min_hits: int = 3,
+                 shot_speed: float = 10.0, rest_speed: float = 3.0, rest_frames: int = 5,
+                 process_noise: float = 25.0, measurement_noise: float = 4.0,
+                 history: int = 120):
+        self.gate = gate
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.shot_speed = shot_speed
+        self.rest_speed = rest_speed
+        self.rest_frames = rest_frames
+        self.history = history
+
+        self.Q = process_noise * np.array([[0.25, 0, 0.5, 0],
+                                           [0, 0.25, 0, 0.5],
+                                           [0.5, 0, 1, 0],
+                                           [0, 0.5, 0, 1]])
+        self.R = measurement_noise * np.eye(2)
+
+        self.x = np.zeros((0, 4))
+        self.P = np.zeros((0, 4, 4))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.colors = np.zeros(0, dtype=np.int64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.trajectories: Dict[int, deque] = {}
+
+        self.color_codes: Dict[str, int] = {}
+        self.next_id = 1
+        self.frames_at_rest = 0
+        self.in_motion = False
+
+    def _color_code(self, color: str) -> int:
+        code = self.color_codes.get(color)
+        if code is None:
+            code = self.color_codes[color] = len(self.color_codes)
+        return code
+
+    def _predict(self):
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + self.Q
+
+    def _correct(self, tracks: np.ndarray, measurements: np.ndarray):
+        P = self.P[tracks]
+        S = P[:, :2, :2] + self.R
+        # Closed-form inverse of the 2x2 innovation covariances
+        det = S[:, 0, 0] * S[:, 1, 1] - S[:, 0, 1] * S[:, 1, 0]
+        S_inv = np.empty_like(S)
+        S_inv[:, 0, 0] = S[:, 1, 1] / det
+        S_inv[:, 1, 1] = S[:, 0, 0] / det
+        S_inv[:, 0, 1] = -S[:, 0, 1] / det
+        S_inv[:, 1, 0] = -S[:, 1, 0] / det
+        K = P[:, :, :2] @ S_inv
+        innovation = measurements - self.x[tracks, :2]
+        self.x[tracks] += (K @ innovation[:, :, None])[:, :, 0]
+        self.P[tracks] = P - K @ P[:, :2, :]
+
+    def update(self, detections: List[Dict]) -> Tuple[List[Dict], bool]:
+        """Advance one frame
+
+        Returns the detections annotated with 'track_id' and 'velocity', and
+        whether a shot started on this frame.
+        """
+        self._predict()
+
+        count = len(detections)
+        positions = np.array([d['position'] for d in detections], dtype=np.float64).reshape(-1, 2)
+        colors = np.array([self._color_code(d['color']) for d in detections], dtype=np.int64)
+
+        offsets = self.x[:, None, :2] - positions[None, :, :]
+        distance = np.hypot(offsets[..., 0], offsets[..., 1])
+        cost = np.where(
+            (self.colors[:, None] == colors[None, :]) & (distance <= self.gate),
+            distance, GATED_COST
+        )
+        rows, cols = assign(cost)
+        valid = cost[rows, cols] < GATED_COST
+        rows, cols = rows[valid], cols[valid]
+
+        if len(rows):
+            self._correct(rows, positions[cols])
+        self.hits[rows] += 1
+        self.misses += 1
+        self.misses[rows] = 0
+
+        # Track row of every detection, before any tracks are added or dropped
+        detection_rows = np.empty(count, dtype=np.int64)
+        detection_rows[cols] = rows
+
+        # New tracks for unmatched detections
+        matched = np.zeros(count, dtype=bool)
+        matched[cols] = True
+        unmatched = np.flatnonzero(~matched)
+        if len(unmatched):
+            added = len(unmatched)
+            new_x = np.zeros((added, 4))
+            new_x[:, :2] = positions[unmatched]
+            new_P = np.tile(np.diag([self.R[0, 0], self.R[1, 1], 100.0, 100.0]), (added, 1, 1))
+            detection_rows[unmatched] = np.arange(len(self.ids), len(self.ids) + added)
+            self.x = np.vstack([self.x, new_x])
+            self.P = np.concatenate([self.P, new_P])
+            self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + added)])
+            self.colors = np.concatenate([self.colors, colors[unmatched]])
+            self.hits = np.concatenate([self.hits, np.ones(added, dtype=np.int64)])
+            self.misses = np.concatenate([self.misses, np.zeros(added, dtype=np.int64)])
+            self.next_id += added
+
+        track_ids = self.ids[detection_rows].tolist()
+        velocities = self.x[detection_rows, 2:].tolist()
+
+        # Drop stale tracks
+        alive = self.misses <= self.max_misses
+        if not alive.all():
+            for track_id in self.ids[~alive].tolist():
+                self.trajectories.pop(track_id, None)
+            self.x, self.P = self.x[alive], self.P[alive]
+            self.ids, self.colors = self.ids[alive], self.colors[alive]
+            self.hits, self.misses = self.hits[alive], self.misses[alive]
+
+        # Annotate detections with their track and record trajectories
+        annotated = []
+        for detection, track_id, velocity in zip(detections, track_ids, velocities):
+            trajectory = self.trajectories.get(track_id)
+            if trajectory is None:
+                trajectory = self.trajectories[track_id] = deque(maxlen=self.history)
+            trajectory.append(detection['position'])
+            annotated.append(dict(detection, track_id=track_id, velocity=tuple(velocity)))
+        return annotated, self._update_motion()
+
+    def _update_motion(self) -> bool:
+        speeds = np.hypot(self.x[:, 2], self.x[:, 3])[(self.hits >= self.min_hits) & (self.misses == 0)]
+        max_speed = float(speeds.max()) if len(speeds) else 0.0
+
+        shot = False
+        if max_speed > self.shot_speed:
+            shot = not self.in_motion and self.frames_at_rest >= self.rest_frames
+            self.in_motion = True
+            self.frames_at_rest = 0
+        elif max_speed < self.rest_speed:
+            self.frames_at_rest += 1
+            if self.frames_at_rest >= self.rest_frames:
+                self.in_motion = False
+        return shot
+
+    def trajectory(self, track_id: int) -> List[Tuple[int, int]]:
+        return list(self.trajectories.get(track_id, ()))
+
+
+def max_displacement_shot(current_balls: List[Dict], previous_balls: List[Dict],
+                          threshold: float = 20.0) -> bool:
+    """Reference same-color max-displacement check, kept for benchmarks"""
+    if not previous_balls:
+        return False
+    max_displacement = 0
+    for curr_ball in current_balls:
+        curr_pos = curr_ball['position']
+        for prev_ball in previous_balls:
+            if prev_ball['color'] == curr_ball['color']:
+                prev_pos = prev_ball['position']
+                displacement = np.sqrt(
+                    (curr_pos[0] - prev_pos[0])**2 +
+                    (curr_pos[1] - prev_pos[1])**2
+                )
+                max_displacement = max(max_displacement, displacement)
+    return max_displacement > threshold
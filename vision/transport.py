@@ -0,0 +1,159 @@
+import base64
+import logging
+import struct
+from collections import namedtuple
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Binary video frame wire format (little endian, 12 byte header):
+#   magic    2s  b'DP'
+#   version  B   1
+#   encoding B   one of the ENCODING_* values below
+#   width    H   pixels (ignored for compressed encodings)
+#   height   H   pixels (ignored for compressed encodings)
+#   sequence I   client frame counter, wraps at 2**32
+# followed by the payload: a JPEG/WebP file, a GRAY8 plane or I420 planes.
+FRAME_MAGIC = b'DP'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<2sBBHHI')
+
+ENCODING_COMPRESSED = 0  # JPEG or WebP, anything cv2.imdecode understands
+ENCODING_GRAY8 = 1
+ENCODING_I420 = 2
+
+FramePacket = namedtuple('FramePacket', ['encoding', 'width', 'height', 'sequence', 'buffer', 'offset'])
+
+
+class FrameFormatError(ValueError):
+    """Raised when a binary frame packet is malformed"""
+
+
+def _raw_size(encoding: int, width: int, height: int) -> int:
+    if encoding == ENCODING_GRAY8:
+        return width * height
+    if encoding == ENCODING_I420:
+        return width * height * 3 // 2
+    return 0
+
+
+def pack_frame(payload: bytes, encoding: int = ENCODING_COMPRESSED, width: int = 0,
+               height: int = 0, sequence: int = 0) -> bytes:
+    """Build a binary frame packet (used by clients, tools and benchmarks)"""
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, encoding, width, height,
+                               sequence & 0xFFFFFFFF)
+    return header + payload
+
+
+def parse_frame(buffer: bytes) -> FramePacket:
+    """Parse a binary frame packet without copying its payload"""
+    if len(buffer) < FRAME_HEADER.size:
+        raise FrameFormatError("Frame packet shorter than header")
+    magic, version, encoding, width, height, sequence = FRAME_HEADER.unpack_from(buffer)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise FrameFormatError("Unknown frame packet magic or version")
+    if encoding not in (ENCODING_COMPRESSED, ENCODING_GRAY8, ENCODING_I420):
+        raise FrameFormatError(f"Unknown frame encoding {encoding}")
+    if encoding != ENCODING_COMPRESSED:
+        if width == 0 or height == 0 or (encoding == ENCODING_I420 and (width % 2 or height % 2)):
+            raise FrameFormatError(f"Invalid raw frame size {width}x{height}")
+        if len(buffer) - FRAME_HEADER.size < _raw_size(encoding, width, height):
+            raise FrameFormatError("Raw frame payload is truncated")
+    return FramePacket(encoding, width, height, sequence, buffer, FRAME_HEADER.size)
+
+
+def packet_from_data_url(data_url: str) -> FramePacket:
+    """Wrap a legacy base64 (optionally data-URL prefixed) image as a packet"""
+    if ',' in data_url:
+        data_url = data_url.split(',', 1)[1]
+    return FramePacket(ENCODING_COMPRESSED, 0, 0, None, base64.b64decode(data_url), 0)
+
+
+def _payload(packet: FramePacket, count: int = -1) -> np.ndarray:
+    return np.frombuffer(packet.buffer, np.uint8, count=count, offset=packet.offset)
+
+
+def _imdecode(packet: FramePacket, flags: int) -> Optional[np.ndarray]:
+    """cv2.imdecode of a compressed payload, None if it is empty or corrupt"""
+    payload = _payload(packet)
+    if not len(payload):
+        return None
+    try:
+        return cv2.imdecode(payload, flags)
+    except cv2.error:
+        return None
+
+
+def _luma_plane(packet: FramePacket) -> np.ndarray:
+    """Zero-copy view of the luminance plane of a raw packet"""
+    return _payload(packet, packet.width * packet.height).reshape(packet.height, packet.width)
+
+
+def frame_thumbnail(packet: FramePacket, size: Tuple[int, int]):
+    """Small grayscale thumbnail of a packet, None if it cannot be decoded"""
+    if packet.encoding == ENCODING_COMPRESSED:
+        gray = _imdecode(packet, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None:
+            return None
+    else:
+        gray = _luma_plane(packet)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+class FrameDecoder:
+    """Decodes frame packets into BGR frames
+
+    Raw packets are converted straight from a view of the received buffer
+    into a BGR buffer reused per user, so steady-state decoding allocates
+    nothing. Compressed packets go through cv2.imdecode on a view of the
+    payload. The returned frame is only valid until the user's next frame
+    is decoded.
+    """
+
+    def __init__(self):
+        self.buffers: Dict[object, np.ndarray] = {}
+        self.last_sequence: Dict[object, int] = {}
+        self.lock = Lock()
+
+    def _buffer(self, key, height: int, width: int) -> np.ndarray:
+        with self.lock:
+            buffer = self.buffers.get(key)
+            if buffer is None or buffer.shape[:2] != (height, width):
+                buffer = self.buffers[key] = np.empty((height, width, 3), np.uint8)
+            return buffer
+
+    def is_stale(self, key, packet: FramePacket) -> bool:
+        """True if the packet is older than one already seen for this key"""
+        if packet.sequence is None:
+            return False
+        with self.lock:
+            last = self.last_sequence.get(key)
+            # Serial-number comparison so the counter may wrap around
+            delta = (packet.sequence - last) & 0xFFFFFFFF if last is not None else 1
+            if delta == 0 or delta >= 0x80000000:
+                return True
+            self.last_sequence[key] = packet.sequence
+            return False
+
+    def decode(self, key, packet: FramePacket, dst: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Decode a packet; raw packets are converted into ``dst`` when given"""
+        if packet.encoding == ENCODING_COMPRESSED:
+            return _imdecode(packet, cv2.IMREAD_COLOR)
+
+        frame = dst if dst is not None else self._buffer(key, packet.height, packet.width)
+        if packet.encoding == ENCODING_GRAY8:
+            cv2.cvtColor(_luma_plane(packet), cv2.COLOR_GRAY2BGR, dst=frame)
+        else:
+            planes = _payload(packet, packet.width * packet.height * 3 // 2)
+            planes = planes.reshape(packet.height * 3 // 2, packet.width)
+            cv2.cvtColor(planes, cv2.COLOR_YUV2BGR_I420, dst=frame)
+        return frame
+
+    def release(self, key):
+        with self.lock:
+            self.buffers.pop(key, None)
+            self.last_sequence.pop(key, None)